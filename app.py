@@ -1,51 +1,235 @@
-from flask import Flask, request, jsonify
-import json
+from flask import Blueprint, Flask, Response, request, jsonify
+import logging
 import os
+import threading
 import time
 import uuid
 from datetime import datetime, timedelta
+from pathlib import Path
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso, sin lock de tareas de fondo
+    fcntl = None
 from dotenv import load_dotenv
 from google_calendar_service import get_calendar_service
 from sync_logic import (
     sincronizar_item_via_webhook, 
+    cargar_contexto_item,
+    construir_contexto_desde_payload,
+    verificar_eventos_item,
+    marcar_evento_divergente,
     _detectar_cambio_de_automatizacion,
-    generate_content_hash
+    _extraer_user_id_webhook
 )
 # Note: Google→Monday sync functions removed for unidirectional sync
 from monday_api_handler import MondayAPIHandler
 # Removed sync_token_manager - not needed for unidirectional sync
 from sync_state_manager import get_sync_state, update_sync_state
+from retry_scheduler import RetryableError, retry_scheduler
+from drift_detector import drift_detector
+from work_queue import work_queue
+from item_locks import item_locks
+from webhook_dedup import webhook_dedup, clave_webhook
+from sync_priority import prioridad_item, encolar_sincronizacion, ORIGEN_WEBHOOK, ORIGEN_RECONCILIACION
+from calendar_write_scheduler import calendar_write_scheduler
+from webhook_classifier import clasificar_webhook, ACCION_IGNORAR, ACCION_APLICAR
+import sync_logging
+from sync_logging import contexto_log, anotar_contexto, configurar_logging, limpiar_contexto
+from sync_metrics import metrics, medir_etapa, STAGE_SECONDS, CONTENT_TYPE as METRICS_CONTENT_TYPE
 import config
 
+logger = logging.getLogger(__name__)
+
 # Cargar variables de entorno
 load_dotenv()
 
-# Creamos la aplicación Flask
-app = Flask(__name__)
+# Las rutas viven en un blueprint; la aplicación se construye con create_app()
+bp = Blueprint('sync', __name__)
 
-# Inicializar servicios globales UNA SOLA VEZ
-try:
-    google_service_global = get_calendar_service()
-    if google_service_global:
-        print("✅ Servicio de Google Calendar inicializado correctamente")
+# Clientes de Google y Monday del proceso actual. No se crean al importar: con un servidor
+# pre-fork (gunicorn) cada worker construye los suyos tras el fork, en el primer uso
+_servicios = {'pid': None, 'google': None, 'monday': None}
+_servicios_lock = threading.Lock()
+
+# Proceso que ya arrancó sus hilos en segundo plano y archivo del lock de las tareas únicas
+_worker = {'pid': None, 'lock_file': None}
+_worker_lock = threading.Lock()
+
+def _servicios_del_proceso():
+    """Crea (una vez por proceso) los clientes de Google y Monday."""
+    pid = os.getpid()
+    if _servicios['pid'] == pid:
+        return _servicios
+    with _servicios_lock:
+        if _servicios['pid'] != pid:
+            try:
+                google_service = get_calendar_service()
+                if google_service:
+                    logger.info("Servicio de Google Calendar inicializado correctamente (proceso %s)", pid)
+                else:
+                    logger.warning("Servicio de Google Calendar no disponible")
+            except Exception as e:
+                logger.error("Error al inicializar Google Calendar: %s", e)
+                google_service = None
+            # Sin reintentos bloqueantes: los fallos transitorios se delegan al planificador de reintentos.
+            # El pid se guarda el último: marca los clientes como listos para los demás hilos
+            _servicios.update(
+                google=google_service,
+                monday=MondayAPIHandler(api_token=os.getenv("MONDAY_API_KEY"), blocking_retries=False),
+                pid=pid
+            )
+    return _servicios
+
+def get_google_service():
+    """Servicio de Google Calendar del proceso actual (o None si no está disponible)."""
+    return _servicios_del_proceso()['google']
+
+def get_monday_handler():
+    """Cliente de Monday del proceso actual."""
+    return _servicios_del_proceso()['monday']
+
+def _reintentar_sincronizacion_item(payload):
+    """
+    Sincronización completa de un item: handler del planificador de reintentos y de los
+    trabajos 'sync_item' de la cola (reconciliación y scripts manuales).
+    """
+    google_service = get_google_service()
+    if not google_service:
+        raise RetryableError("Servicio de Google Calendar no disponible")
+    return sincronizar_item_via_webhook(
+        payload['item_id'],
+        monday_handler=get_monday_handler(),
+        google_service=google_service,
+        change_uuid=payload.get('change_uuid'),
+        defer_retries=True
+    )
+
+retry_scheduler.register_handler('sync_item', _reintentar_sincronizacion_item)
+
+def _reempujar_evento_divergente(monday_item_id, calendar_id, event):
+    """Un evento sincronizado se editó o borró en Google: se vuelve a escribir la versión de Monday."""
+    marcar_evento_divergente(monday_item_id, calendar_id, event)
+    if config.WORK_QUEUE_ENABLED:
+        # Por la cola, con prioridad de reconciliación: no se adelanta a los cambios de grabaciones próximas
+        encolar_sincronizacion(monday_item_id, ORIGEN_RECONCILIACION)
+        return
+    retry_scheduler.schedule(
+        'sync_item',
+        {'item_id': str(monday_item_id), 'change_uuid': str(uuid.uuid4())},
+        error=f"Evento {event.get('id')} modificado en Google ({calendar_id})",
+        dedup_key=str(monday_item_id)
+    )
+
+def _delegar_reintento(operation, payload, delay, dedup_key):
+    """Envía a la cola SQLite un reintento de un proceso que no ejecuta el planificador."""
+    return work_queue.enqueue(operation, payload, delay=delay, coalesce_key=dedup_key)
+
+def _tomar_tareas_unicas():
+    """
+    Intenta quedarse con las tareas de fondo que solo deben correr en un proceso
+    (detector de divergencias y reintentos diferidos, que guardan su estado en JSON).
+    
+    El lock del archivo lo libera el sistema al morir el proceso, y el worker que
+    lo sustituya lo vuelve a tomar.
+    
+    Returns:
+        bool: True si este proceso debe ejecutarlas
+    """
+    if fcntl is None:
+        return True
+    lock_path = Path(config.BACKGROUND_TASKS_LOCK_FILE)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(lock_path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _worker['lock_file'] = lock_file  # Abierto mientras viva el proceso
+    return True
+
+def _calentar_conexiones():
+    """Crea los clientes del proceso y abre la primera conexión con Google (carga y refresca las credenciales)."""
+    google_service = get_google_service()
+    get_monday_handler()
+    if not google_service:
+        return
+    try:
+        google_service.calendars().get(calendarId=config.MASTER_CALENDAR_ID, fields='id').execute()
+    except Exception as e:
+        logger.warning("No se pudo calentar la conexión con Google: %s", e)
+
+def init_worker(procesos=1):
+    """
+    Prepara el proceso actual para sincronizar: arranca los workers de la cola, las
+    tareas de fondo únicas (si le tocan) y calienta las conexiones.
+    
+    Se llama tras el fork en cada worker (hook post_fork de gunicorn.conf.py) o al
+    arrancar el servidor de desarrollo. Es idempotente dentro de un proceso.
+    
+    Args:
+        procesos: Workers del servidor; el ritmo de escritura por calendario se reparte entre ellos
+    """
+    pid = os.getpid()
+    with _worker_lock:
+        if _worker['pid'] == pid:
+            return
+        _worker['pid'] = pid
+
+    # Lo primero: el hilo escritor de logs heredado del proceso padre no existe en este
+    configurar_logging()
+
+    if procesos > 1:
+        # /metrics lo atiende cualquier worker: cada uno vuelca sus contadores para que se sumen
+        metrics.iniciar_multiproceso()
+        calendar_write_scheduler.configurar_ritmo(
+            config.CALENDAR_WRITE_RATE_PER_SECOND / procesos,
+            max(1, config.CALENDAR_WRITE_BURST / procesos)
+        )
+        if not config.WORK_QUEUE_ENABLED:
+            logger.warning("Varios procesos sin cola de trabajo: los webhooks de un item pueden sincronizarse a la vez")
+
+    # Con varios procesos la cola se consume siempre: por ella viajan los reintentos de los demás
+    if config.WORK_QUEUE_ENABLED or procesos > 1:
+        work_queue.start()
+
+    tareas_unicas = _tomar_tareas_unicas()
+    if tareas_unicas:
+        retry_scheduler.start()
+        if config.DRIFT_DETECTION_ENABLED:
+            drift_detector.start(get_google_service, _reempujar_evento_divergente)
     else:
-        print("⚠️  Servicio de Google Calendar no disponible")
-except Exception as e:
-    print(f"❌ Error al inicializar Google Calendar: {e}")
-    google_service_global = None
+        # La tabla de reintentos es del proceso que tiene el lock; este no la escribe
+        retry_scheduler.delegar_en(_delegar_reintento)
 
-monday_handler_global = MondayAPIHandler(api_token=os.getenv("MONDAY_API_KEY"))
-# Removed sync_token_manager - not needed for unidirectional sync
+    _calentar_conexiones()
+    logger.info("Worker %s listo%s", pid, ' (con tareas de fondo únicas)' if tareas_unicas else '')
 
-# Configuración del nuevo sistema anti-bucles
-print("🚀 Inicializando sistema anti-bucles con sync_state_manager y detección de automatización")
+def _asegurar_worker():
+    """Si ningún hook inicializó este proceso (otro servidor WSGI), se inicializa en su primera petición."""
+    if _worker['pid'] != os.getpid():
+        init_worker()
+
+def create_app():
+    """
+    Construye la aplicación Flask.
+    
+    No crea clientes ni arranca hilos, así que es seguro llamarla antes de un fork
+    (p. ej. con preload_app en gunicorn): cada proceso se prepara con init_worker().
+    """
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    app.before_request(_asegurar_worker)
+    # Los hilos del servidor se reutilizan: cada petición empieza sin item_id ni stage
+    app.before_request(limpiar_contexto)
+    return app
 
-@app.route('/')
+@bp.route('/')
 def home():
     """Endpoint de prueba para verificar que el servidor está vivo."""
     return "¡Hola! El servidor de sincronización Stupendastic está funcionando."
 
-@app.route('/health', methods=['GET'])
+@bp.route('/health', methods=['GET'])
 def health_check():
     """Endpoint de verificación de salud para webhooks."""
     return jsonify({
@@ -59,7 +243,7 @@ def health_check():
 # ENDPOINTS DE DEBUGGING
 # ============================================================================
 
-@app.route('/debug/sync-state/<item_id>', methods=['GET'])
+@bp.route('/debug/sync-state/<item_id>', methods=['GET'])
 def debug_sync_state(item_id):
     """Muestra el estado de sincronización para un item específico."""
     try:
@@ -94,7 +278,7 @@ def debug_sync_state(item_id):
             'error': f'Error obteniendo estado de sincronización: {str(e)}'
         }), 500
 
-@app.route('/debug/last-syncs', methods=['GET'])
+@bp.route('/debug/last-syncs', methods=['GET'])
 def debug_last_syncs():
     """Muestra las últimas 10 sincronizaciones."""
     try:
@@ -140,7 +324,7 @@ def debug_last_syncs():
             'error': f'Error obteniendo últimas sincronizaciones: {str(e)}'
         }), 500
 
-@app.route('/debug/clear-state/<item_id>', methods=['DELETE'])
+@bp.route('/debug/clear-state/<item_id>', methods=['DELETE'])
 def debug_clear_state(item_id):
     """Limpia el estado de sincronización para un item específico (para testing)."""
     try:
@@ -175,7 +359,7 @@ def debug_clear_state(item_id):
             'error': f'Error limpiando estado: {str(e)}'
         }), 500
 
-@app.route('/debug/sync-monitor', methods=['GET'])
+@bp.route('/debug/sync-monitor', methods=['GET'])
 def debug_sync_monitor():
     """Endpoint para monitorear sincronizaciones en tiempo real."""
     try:
@@ -199,7 +383,68 @@ def debug_sync_monitor():
             'error': f'Error en monitor de sincronización: {str(e)}'
         }), 500
 
-@app.route('/webhook-test', methods=['GET', 'POST'])
+@bp.route('/debug/retry-queue', methods=['GET'])
+def debug_retry_queue():
+    """Muestra el estado de la tabla de reintentos diferidos."""
+    return jsonify(retry_scheduler.get_statistics()), 200
+
+@bp.route('/debug/calendar-writes', methods=['GET'])
+def debug_calendar_writes():
+    """Muestra el backlog y el ritmo de escritura de cada calendario de Google."""
+    return jsonify(calendar_write_scheduler.get_statistics()), 200
+
+@bp.route('/debug/work-queue', methods=['GET'])
+def debug_work_queue():
+    """Muestra el estado de la cola de trabajo y los últimos trabajos en dead letter."""
+    return jsonify(dict(
+        work_queue.get_statistics(),
+        item_locks=item_locks.get_statistics(),
+        dead_letter=work_queue.list_dead_letters(limit=int(request.args.get('limit', 20)))
+    )), 200
+
+@bp.route('/debug/work-queue/replay', methods=['POST'])
+@bp.route('/debug/work-queue/replay/<int:dead_letter_id>', methods=['POST'])
+def debug_work_queue_replay(dead_letter_id=None):
+    """Reencola un trabajo de dead letter (o todos si no se indica ID)."""
+    return jsonify({'replayed': work_queue.replay(dead_letter_id)}), 200
+
+@bp.route('/debug/webhook-dedup', methods=['GET'])
+def debug_webhook_dedup():
+    """Muestra las estadísticas del caché de idempotencia de webhooks."""
+    return jsonify(webhook_dedup.get_statistics()), 200
+
+@bp.route('/debug/logging', methods=['GET'])
+def debug_logging():
+    """Muestra los registros en cola y los descartados por cola llena en este proceso."""
+    return jsonify(sync_logging.get_statistics()), 200
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas en formato texto de Prometheus (latencia por etapa, llamadas a Monday y Google, colas)."""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@bp.route('/debug/drift', methods=['GET'])
+def debug_drift():
+    """Muestra las estadísticas del detector de ediciones manuales en Google."""
+    return jsonify(drift_detector.get_statistics()), 200
+
+@bp.route('/debug/google-events/<item_id>', methods=['GET'])
+def debug_google_events(item_id):
+    """Comprueba (con lecturas condicionales por ETag) si los eventos de un item se editaron en Google."""
+    google_service = get_google_service()
+    if not google_service:
+        return jsonify({'error': 'Servicio de Google Calendar no disponible'}), 503
+    try:
+        return jsonify({
+            'item_id': item_id,
+            'calendars': verificar_eventos_item(google_service, item_id)
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'error': f'Error verificando eventos en Google: {str(e)}'
+        }), 500
+
+@bp.route('/webhook-test', methods=['GET', 'POST'])
 def webhook_test():
     """Endpoint de prueba para verificar webhooks."""
     if request.method == 'GET':
@@ -216,126 +461,260 @@ def webhook_test():
             'data': request.json if request.is_json else 'No JSON data'
         }), 200
 
-@app.route('/monday-webhook', methods=['POST'])
+def _procesar_webhook(event_data, coalesced=1):
+    """
+    Pipeline completo de un webhook de Monday ya validado: detección de automatización,
+    contexto del item, eco y sincronización con Google.
+    
+    Lo ejecutan los workers de la cola de trabajo (o el propio endpoint si la cola
+    está desactivada).
+    
+    Args:
+        event_data: Payload del webhook (el último, si se fundieron varios)
+        coalesced: Número de webhooks del item fundidos en este trabajo por el debounce
+    
+    Returns:
+        dict: Respuesta con el resultado ('status', 'message'...)
+        
+    Raises:
+        RetryableError: Fallo transitorio de Monday o Google
+    """
+    clasificacion = clasificar_webhook(event_data)
+    item_id = clasificacion.item_id
+    
+    logger.info("Procesando webhook para item %s", item_id)
+    google_service = get_google_service()
+    monday_handler = get_monday_handler()
+    
+    # 0. SI EL PAYLOAD IDENTIFICA AL AUTOR, LA AUTOMATIZACIÓN SE DETECTA SIN LLAMAR A MONDAY
+    if _extraer_user_id_webhook(event_data) is not None and \
+            _detectar_cambio_de_automatizacion(str(item_id), monday_handler, event_data=event_data):
+        logger.info("Cambio de automatización detectado (payload), ignorando")
+        return {'status': 'automation_ignored', 'message': 'Cambio de automatización detectado'}
+
+    # 1. OBTENER DATOS DEL ITEM (UNA SOLA VEZ PARA TODO EL PIPELINE)
+    # Si el payload trae el valor nuevo, se aplica sobre el último estado conocido del item;
+    # si no, se consulta Monday. El contexto incluye el item parseado, su hash, su estado
+    # de sincronización y las updates recientes para la detección de automatización
+    change_uuid = str(uuid.uuid4())
+    anotar_contexto(change_uuid=change_uuid)
+    contexto = None
+    if coalesced > 1:
+        # Ráfaga fundida: el payload solo trae el último cambio, así que se lee el estado actual del item
+        logger.info("%s webhooks del item %s fundidos en una sincronización", coalesced, item_id)
+    elif clasificacion.action == ACCION_APLICAR:
+        contexto = construir_contexto_desde_payload(clasificacion, event_data=event_data, change_uuid=change_uuid)
+        if contexto:
+            logger.info("Valor de '%s' aplicado desde el payload, sin consultar Monday", clasificacion.column_id)
+
+    if contexto is None:
+        contexto = cargar_contexto_item(
+            item_id,
+            monday_handler,
+            event_data=event_data,
+            change_uuid=change_uuid
+        )
+
+    if not contexto:
+        logger.error("No se pudo obtener datos del item %s", item_id)
+        return {'message': 'Item no encontrado'}
+
+    # No devolvemos aquí: si no hay Google Event ID, la lógica de sincronización lo creará
+    if not contexto.google_event_id:
+        logger.warning("Item %s no tiene Google Event ID asociado — se creará uno si corresponde", item_id)
+
+    # 2. ESTADO DE SINCRONIZACIÓN Y 3. HASH DEL CONTENIDO ACTUAL (ya en el contexto)
+    sync_state = contexto.sync_state
+    current_hash = contexto.content_hash
+
+    logger.debug("Hash del contenido actual: %s", current_hash)
+
+    # 4. VERIFICAR SI ES UN ECO
+    if sync_state and sync_state.get('monday_content_hash') == current_hash:
+        logger.info("Eco detectado - contenido idéntico, ignorando")
+        return {'status': 'echo_ignored', 'message': 'Eco detectado'}
+
+    # 5. VERIFICAR SI FUE CAMBIO DE AUTOMATIZACIÓN
+    if _detectar_cambio_de_automatizacion(str(item_id), monday_handler,
+                                          event_data=event_data, item_data=contexto.item_data):
+        logger.info("Cambio de automatización detectado, ignorando")
+        return {'status': 'automation_ignored', 'message': 'Cambio de automatización detectado'}
+
+    # 6. VERIFICAR SERVICIOS DISPONIBLES
+    if not google_service:
+        logger.warning("Servicio de Google Calendar no disponible, omitiendo sincronización")
+        return {
+            'status': 'service_unavailable',
+            'message': 'Servicio de Google Calendar no disponible'
+        }
+
+    # 7. PROCEDER CON SINCRONIZACIÓN
+    logger.info("Iniciando sincronización Monday → Google para item %s", item_id)
+
+    success = sincronizar_item_via_webhook(
+        item_id, 
+        monday_handler=monday_handler,
+        google_service=google_service,
+        change_uuid=change_uuid,
+        defer_retries=True,
+        context=contexto
+    )
+
+    # 7. ACTUALIZAR ESTADO SI FUE EXITOSO
+    if success:
+        logger.info("Sincronización Monday → Google completada para item %s", item_id)
+
+        return {
+            'status': 'success',
+            'message': 'Sincronización completada',
+            'item_id': item_id,
+            'google_writes': contexto.escrituras
+        }
+    else:
+        logger.error("Error en sincronización Monday → Google para item %s", item_id)
+        return {
+            'status': 'error',
+            'message': 'Error en sincronización'
+        }
+
+def _procesar_webhook_encolado(payload):
+    """
+    Handler de la cola de trabajo: los RetryableError los reprograma la propia cola.
+    
+    La cola no entrega dos trabajos del mismo item a la vez; el lock del item cubre
+    además a los reintentos diferidos y a las re-sincronizaciones por divergencia.
+    """
+    item_id = clasificar_webhook(payload['event_data']).item_id
+    STAGE_SECONDS.observe(max(0.0, time.time() - payload.get('received_at', time.time())), 'queue_wait')
+    with item_locks.hold(item_id), contexto_log(item_id=item_id, stage='worker'), medir_etapa('process'):
+        resultado = _procesar_webhook(payload['event_data'], coalesced=payload.get('coalesced', 1))
+    espera = time.time() - payload.get('received_at', time.time())
+    logger.info("Webhook procesado (%s) %.2fs después de recibirse", resultado.get('status'), espera)
+    return resultado
+
+work_queue.register_handler('monday_webhook', _procesar_webhook_encolado)
+work_queue.register_handler('sync_item', _reintentar_sincronizacion_item)
+
+# Profundidad de las colas: se lee al servir /metrics, sin coste para los webhooks
+def _trabajos_por_estado():
+    stats = work_queue.get_statistics()
+    return {
+        'pending': stats['pending'],
+        'running': stats['running'],
+        'delayed': stats['delayed'],
+        'dead_letter': stats['dead_letters']
+    }
+
+def _reintentos_pendientes():
+    # Todos los procesos cargan la tabla de reintentos, pero solo la ejecuta el que tiene las tareas únicas
+    stats = retry_scheduler.get_statistics()
+    return stats['pending'] if stats['running'] else None
+
+def _escrituras_pendientes():
+    calendarios = calendar_write_scheduler.get_statistics()['calendars']
+    return {calendar_id: cola['backlog'] for calendar_id, cola in calendarios.items()}
+
+metrics.gauge('sync_work_queue_jobs', 'Trabajos en la cola de trabajo por estado', _trabajos_por_estado,
+              ('state',), compartida=True)
+metrics.gauge('sync_work_queue_oldest_ready_seconds', 'Antigüedad del trabajo listo más antiguo de la cola',
+              lambda: work_queue.get_statistics()['oldest_ready_age_seconds'], compartida=True)
+metrics.gauge('sync_retry_scheduler_pending', 'Reintentos diferidos pendientes', _reintentos_pendientes)
+metrics.gauge('sync_calendar_write_backlog', 'Escrituras en espera en el planificador por calendario',
+              _escrituras_pendientes, ('calendar_id',))
+metrics.gauge('sync_item_locks_active', 'Items con una sincronización en curso o esperando su lock',
+              lambda: item_locks.get_statistics()['active_keys'])
+metrics.gauge('sync_log_queue_depth', 'Registros de log pendientes de escribir',
+              lambda: sync_logging.get_statistics()['queued'])
+
+@bp.route('/monday-webhook', methods=['POST'])
 def handle_monday_webhook():
     """
     Webhook de Monday.com - Sincronización inteligente Monday → Google.
     Usa el nuevo sistema anti-bucles con sync_state_manager y detección de automatización.
+    Con la cola de trabajo activa solo valida y encola; la sincronización la hacen los workers.
     """
+    inicio = time.perf_counter()
     # Monday envía un 'challenge' la primera vez que configuras un webhook.
     if 'challenge' in request.json:
         challenge = request.json['challenge']
-        print(f"Recibido 'challenge' de Monday: {challenge}")
+        logger.info("Recibido 'challenge' de Monday: %s", challenge)
         return jsonify({'challenge': challenge})
 
     # Si no es un challenge, es una notificación de evento real.
     event_data = request.json
-    print("\n--- ¡Webhook de Monday Recibido! ---")
-    print(json.dumps(event_data, indent=2))
     
-    # Extraer el ID del item que ha cambiado
-    # Monday.com puede enviar el webhook en diferentes formatos
-    if 'pulseId' in event_data:
-        # Formato directo
-        item_id = event_data.get('pulseId')
-    elif 'event' in event_data and 'pulseId' in event_data['event']:
-        # Formato anidado
-        item_id = event_data['event'].get('pulseId')
-    else:
-        item_id = None
+    # Reenvío de un webhook ya recibido (Monday reintenta si no respondimos a tiempo): no se procesa
+    clave_idempotencia = clave_webhook(event_data)
+    if webhook_dedup.check_and_add(clave_idempotencia):
+        logger.info("Webhook duplicado ignorado (%s)", clave_idempotencia[:48])
+        return jsonify({'status': 'duplicate_ignored'}), 200
+    
+    # Clasificar el webhook solo con su payload: extraer el item y decidir si merece una llamada a la API
+    # Monday.com puede enviar el webhook en diferentes formatos (directo o anidado en 'event')
+    clasificacion = clasificar_webhook(event_data)
+    item_id = clasificacion.item_id
+    # Lectura del JSON, idempotencia y clasificación
+    STAGE_SECONDS.observe(time.perf_counter() - inicio, 'payload_parse')
+    anotar_contexto(item_id=item_id, stage='webhook')
+    # El payload completo solo con DEBUG (y muestreado): se formatea únicamente si se va a emitir
+    logger.debug("Webhook de Monday recibido: %s", event_data)
     
     if not item_id:
-        print("⚠️  No se pudo extraer el ID del item del webhook")
+        logger.warning("No se pudo extraer el ID del item del webhook")
         return jsonify({'message': 'Webhook recibido sin item_id'}), 200
     
-    print(f"🔄 Procesando webhook para item {item_id}")
+    if clasificacion.action == ACCION_IGNORAR:
+        logger.debug("Webhook ignorado para item %s: %s (%s)", item_id, clasificacion.reason, clasificacion.column_id)
+        return jsonify({
+            'status': 'ignored',
+            'reason': clasificacion.reason,
+            'column_id': clasificacion.column_id
+        }), 200
+    
+    if config.WORK_QUEUE_ENABLED:
+        # Solo se encola: los workers hacen la sincronización y el webhook responde al momento.
+        # Los webhooks del mismo item dentro de la ventana de debounce se funden en un solo trabajo.
+        # Con backlog, los items con la grabación más próxima se sincronizan antes
+        try:
+            job_id = work_queue.enqueue(
+                'monday_webhook',
+                {'event_data': event_data, 'received_at': time.time()},
+                delay=config.WEBHOOK_DEBOUNCE_SECONDS,
+                coalesce_key=str(item_id),
+                max_delay=config.WEBHOOK_DEBOUNCE_MAX_DELAY_SECONDS,
+                priority=prioridad_item(item_id, ORIGEN_WEBHOOK, clasificacion)
+            )
+        except Exception:
+            # Sin encolar no se ha procesado: el reenvío de Monday no debe tomarse por duplicado
+            webhook_dedup.discard(clave_idempotencia)
+            raise
+        logger.info("Webhook del item %s encolado (trabajo %s)", item_id, job_id)
+        return jsonify({'status': 'queued', 'item_id': item_id, 'job_id': job_id}), 200
     
     try:
-        # 1. OBTENER DATOS DEL ITEM DE MONDAY
-        from sync_logic import parse_monday_item
-        
-        # Obtener item específico de Monday usando el ID
-        item_data = monday_handler_global.get_item_by_id(
-            board_id=str(config.BOARD_ID_GRABACIONES),
-            item_id=str(item_id),
-            column_ids=[config.COL_GOOGLE_EVENT_ID, config.COL_FECHA, "personas1", "name"]
-        )
-        
-        if not item_data:
-            print(f"❌ No se pudo obtener datos del item {item_id}")
-            return jsonify({'message': 'Item no encontrado'}), 200
-        
-        # Procesar item de Monday
-        item_procesado = parse_monday_item(item_data)
-        google_event_id = item_procesado.get('google_event_id')
-        
-        # No devolvemos aquí: si no hay Google Event ID, la lógica de sincronización lo creará
-        if not google_event_id:
-            print(f"⚠️  Item {item_id} no tiene Google Event ID asociado — se creará uno si corresponde")
-        
-        # 2. OBTENER ESTADO DE SINCRONIZACIÓN (solo si ya existe Google Event ID)
-        sync_state = None
-        if google_event_id:
-            sync_state = get_sync_state(str(item_id), google_event_id)
-        
-        # 3. GENERAR HASH DEL CONTENIDO ACTUAL
-        current_content = {
-            'name': item_procesado.get('name', ''),
-            'fecha_inicio': item_procesado.get('fecha_inicio', ''),
-            'operario': item_procesado.get('operario', '')
-        }
-        current_hash = generate_content_hash(current_content)
-        
-        print(f"📊 Hash del contenido actual: {current_hash}")
-        
-        # 4. VERIFICAR SI ES UN ECO
-        if sync_state and sync_state.get('monday_content_hash') == current_hash:
-            print("🔄 Eco detectado - contenido idéntico, ignorando")
-            return jsonify({'status': 'echo_ignored', 'message': 'Eco detectado'}), 200
-        
-        # 5. VERIFICAR SI FUE CAMBIO DE AUTOMATIZACIÓN
-        if _detectar_cambio_de_automatizacion(str(item_id), monday_handler_global):
-            print("🤖 Cambio de automatización detectado, ignorando")
-            return jsonify({'status': 'automation_ignored', 'message': 'Cambio de automatización detectado'}), 200
-        
-        # 6. VERIFICAR SERVICIOS DISPONIBLES
-        if not google_service_global:
-            print("⚠️  Servicio de Google Calendar no disponible, omitiendo sincronización")
-            return jsonify({
-                'status': 'service_unavailable',
-                'message': 'Servicio de Google Calendar no disponible'
-            }), 200
-        
-        # 7. PROCEDER CON SINCRONIZACIÓN
-        print(f"🚀 Iniciando sincronización Monday → Google para item {item_id}")
-        
-        success = sincronizar_item_via_webhook(
-            item_id, 
-            monday_handler=monday_handler_global,
-            google_service=google_service_global,
-            change_uuid=str(uuid.uuid4())
+        # Un webhook a la vez por item: el contexto se lee después de que termine el anterior
+        with item_locks.hold(item_id):
+            return jsonify(_procesar_webhook(event_data)), 200
+    
+    except RetryableError as e:
+        # Fallo transitorio: responder ya y reintentar en segundo plano
+        logger.info("Fallo transitorio para item %s, reintento diferido: %s", item_id, e)
+        job_id = retry_scheduler.schedule(
+            'sync_item',
+            {'item_id': str(item_id), 'change_uuid': str(uuid.uuid4())},
+            retry_after=e.retry_after,
+            error=str(e),
+            dedup_key=str(item_id)
         )
-        
-        # 7. ACTUALIZAR ESTADO SI FUE EXITOSO
-        if success:
-            print(f"✅ Sincronización Monday → Google completada para item {item_id}")
-            
-            return jsonify({
-                'status': 'success',
-                'message': 'Sincronización completada',
-                'item_id': item_id
-            }), 200
-        else:
-            print(f"❌ Error en sincronización Monday → Google para item {item_id}")
-            return jsonify({
-                'status': 'error',
-                'message': 'Error en sincronización'
-            }), 200
+        return jsonify({
+            'status': 'retry_scheduled',
+            'message': 'Fallo transitorio, sincronización reprogramada',
+            'item_id': item_id,
+            'retry_job_id': job_id
+        }), 200
             
     except Exception as e:
-        print(f"❌ Error inesperado durante procesamiento del webhook: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error inesperado durante procesamiento del webhook: %s", e)
         return jsonify({
             'status': 'error',
             'message': f'Error interno: {str(e)}'
@@ -345,4 +724,9 @@ def handle_monday_webhook():
 # System now only supports Monday → Google synchronization
 
 if __name__ == '__main__':
-    app.run(debug=True, port=6754) 
\ No newline at end of file
+    # Servidor de desarrollo (un proceso, con recarga). En producción: gunicorn -c gunicorn.conf.py
+    app = create_app()
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Solo en el proceso hijo del reloader, que es el que atiende las peticiones
+        init_worker()
+    app.run(debug=True, port=config.SERVER_PORT) 
\ No newline at end of file
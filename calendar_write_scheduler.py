@@ -0,0 +1,392 @@
+"""
+Calendar Write Scheduler - Escrituras en Google coordinadas por calendario
+==========================================================================
+
+Google limita las escrituras por calendario. Cada sincronización escribe en el
+calendario maestro y en los personales, y con varios webhooks concurrentes
+(p. ej. una importación masiva) cada hilo enviaba su batch sin coordinarse
+con los demás: el maestro recibía ráfagas que acababan en cascadas de
+`rateLimitExceeded`.
+
+Este planificador mantiene una cola y un límite de ritmo (token bucket) por
+`calendar_id`. Un hilo despachador recorre las colas por turnos (round-robin)
+y en cada vuelta saca de cada calendario las escrituras que ya puede enviar:
+todas juntas (de distintos items y calendarios) forman un único batch HTTP,
+de modo que la sincronización de un item con su evento maestro y sus copias
+sigue costando una sola petición. Los lotes se envían desde un pool de hilos,
+con como mucho un lote en vuelo por calendario: las escrituras de un
+calendario no se adelantan unas a otras. Los calendarios en enfriamiento
+por cuota (ver google_calendar_service) se saltan hasta que termina la espera.
+
+Los llamadores siguen usando la interfaz de `execute_event_batch`: `execute()`
+encola las operaciones y espera a sus resultados (como mucho
+CALENDAR_WRITE_TIMEOUT_SECONDS; después son un fallo transitorio).
+"""
+
+import itertools
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+import config
+from google_calendar_service import (
+    execute_event_batch, segundos_enfriamiento, BATCH_MAX_SIZE, ERROR_CUOTA
+)
+from retry_scheduler import RetryableError, parse_retry_after, calcular_backoff
+from sync_metrics import THROTTLES
+
+logger = logging.getLogger(__name__)
+
+
+class _EscrituraPendiente:
+    """Operación de batch en cola, con el futuro que espera el llamador."""
+
+    def __init__(self, service: Any, operation: Dict[str, Any], defer_retries: bool, max_retries: int):
+        self.service = service
+        self.operation = operation
+        self.defer_retries = defer_retries
+        self.retries_left = max_retries
+        self.attempts = 0
+        self.not_before = 0.0
+        self.enqueued_at = time.time()
+        self.abandoned = False  # El llamador dejó de esperar (timeout): no se reencola
+        self.future: Future = Future()
+
+
+class _ColaCalendario:
+    """Cola y token bucket de un calendario."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.pending: deque = deque()
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+        self.in_flight = False  # Hay un lote de este calendario enviándose
+        self.completed_at: deque = deque()  # Instantes de las escrituras recientes (throughput)
+
+    def refill(self, now: float) -> None:
+        """Repone tokens según el tiempo transcurrido."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_to_token(self) -> float:
+        """Segundos hasta que haya un token disponible."""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class CalendarWriteScheduler:
+    """
+    Planificador de escrituras en Google Calendar con una cola por calendario.
+    """
+
+    def __init__(
+        self,
+        rate_per_calendar: float = config.CALENDAR_WRITE_RATE_PER_SECOND,
+        burst_per_calendar: float = config.CALENDAR_WRITE_BURST,
+        max_concurrent_batches: int = config.CALENDAR_WRITE_CONCURRENCY,
+        timeout: float = config.CALENDAR_WRITE_TIMEOUT_SECONDS
+    ):
+        """
+        Inicializa el planificador (el hilo despachador arranca con la primera escritura).
+
+        Args:
+            rate_per_calendar: Escrituras por segundo permitidas en cada calendario
+            burst_per_calendar: Escrituras que un calendario puede enviar de golpe tras estar inactivo
+            max_concurrent_batches: Lotes que se envían a la vez
+            timeout: Segundos que `execute()` espera a los resultados
+        """
+        self.rate_per_calendar = rate_per_calendar
+        self.burst_per_calendar = burst_per_calendar
+        self.max_concurrent_batches = max_concurrent_batches
+        self.timeout = timeout
+        self._colas: Dict[str, _ColaCalendario] = {}
+        self._turno: deque = deque()  # Orden round-robin de los calendarios
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {'batches': 0, 'operations': 0, 'requeued': 0, 'timeouts': 0}
+
+        for calendar_id in self.calendarios_conocidos():
+            self._cola(calendar_id)
+
+    def calendarios_conocidos(self) -> List[str]:
+        """Calendario maestro, calendario de no asignados y calendarios de FILMMAKER_PROFILES."""
+        calendarios = [config.MASTER_CALENDAR_ID, config.UNASSIGNED_CALENDAR_ID]
+        for perfil in config.FILMMAKER_PROFILES:
+            calendar_id = perfil.get('calendar_id')
+            if calendar_id and calendar_id not in calendarios:
+                calendarios.append(calendar_id)
+        return calendarios
+
+    def _cola(self, calendar_id: str) -> _ColaCalendario:
+        """Obtiene (o crea) la cola de un calendario. Llamar con el lock tomado."""
+        cola = self._colas.get(calendar_id)
+        if cola is None:
+            cola = _ColaCalendario(self.rate_per_calendar, self.burst_per_calendar)
+            self._colas[calendar_id] = cola
+            self._turno.append(calendar_id)
+        return cola
+
+    def configurar_ritmo(self, rate_per_calendar: float, burst_per_calendar: float) -> None:
+        """
+        Cambia el límite de ritmo de todos los calendarios (p. ej. para repartirlo entre
+        los procesos de un servidor pre-fork, que no comparten planificador).
+        """
+        with self._cond:
+            self.rate_per_calendar = rate_per_calendar
+            self.burst_per_calendar = burst_per_calendar
+            for cola in self._colas.values():
+                cola.rate = rate_per_calendar
+                cola.burst = burst_per_calendar
+                cola.tokens = min(cola.tokens, burst_per_calendar)
+
+    def _ensure_started(self) -> None:
+        """Arranca el hilo despachador y su pool si no están vivos (p. ej. tras un fork)."""
+        if self._thread and self._thread.is_alive():
+            return
+        # Los hilos del pool heredado de otro proceso no existen en este
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_batches, thread_name_prefix='calendar-write'
+        )
+        for cola in self._colas.values():
+            cola.in_flight = False
+        self._thread = threading.Thread(target=self._dispatch_loop, name='calendar-write-scheduler', daemon=True)
+        self._thread.start()
+
+    def execute(self, service: Any, operations: List[Dict[str, Any]], defer_retries: bool = False,
+                max_part_retries: int = 2) -> Dict[str, Dict[str, Any]]:
+        """
+        Encola las operaciones en sus calendarios y espera a que se ejecuten.
+
+        Mismos argumentos y resultado que `execute_event_batch`. En modo diferido las
+        partes transitorias no se reintentan aquí; si no, se vuelven a encolar
+        (respetando el enfriamiento y el backoff) hasta `max_part_retries` veces.
+
+        Las operaciones sin resultado al agotar `timeout` se sacan de la cola si aún
+        no se han enviado y se devuelven como fallo transitorio (RetryableError).
+        """
+        if not operations:
+            return {}
+        if not service:
+            return execute_event_batch(service, operations, defer_retries=defer_retries)
+
+        pendientes = [
+            (operation['key'], _EscrituraPendiente(
+                service, operation, defer_retries, 0 if defer_retries else max_part_retries
+            ))
+            for operation in operations
+        ]
+        with self._cond:
+            self._ensure_started()
+            for _, pendiente in pendientes:
+                self._cola(pendiente.operation['calendar_id']).pending.append(pendiente)
+            self._cond.notify()
+
+        limite = time.monotonic() + self.timeout
+        resultados = {}
+        for key, pendiente in pendientes:
+            try:
+                resultados[key] = pendiente.future.result(timeout=max(0.0, limite - time.monotonic()))
+            except FutureTimeoutError:
+                resultados[key] = self._abandonar(pendiente)
+        return resultados
+
+    def _abandonar(self, pendiente: _EscrituraPendiente) -> Dict[str, Any]:
+        """Resultado de una operación que no terminó a tiempo (la quita de su cola si no se envió)."""
+        calendar_id = pendiente.operation['calendar_id']
+        with self._cond:
+            self._stats['timeouts'] += 1
+            pendiente.abandoned = True
+            try:
+                self._colas[calendar_id].pending.remove(pendiente)
+            except ValueError:
+                pass  # Ya va en un lote: su resultado llegará, pero nadie lo espera
+        logger.warning("Escritura en %s... sin resultado tras %ss", calendar_id[:20], self.timeout)
+        return {
+            'ok': False, 'response': None, 'retryable': True, 'clase': None,
+            'error': RetryableError(f"Escritura en el calendario {calendar_id} sin resultado tras {self.timeout}s")
+        }
+
+    def _tomar_lote(self) -> tuple:
+        """
+        Saca de las colas las operaciones que se pueden enviar ya, recorriendo por turnos
+        los calendarios sin lote en vuelo, hasta llenar un batch (BATCH_MAX_SIZE partes).
+
+        Returns:
+            (lote, con partes de varios calendarios; segundos hasta que pueda haber más trabajo o None)
+        """
+        now = time.monotonic()
+        lote = []
+        espera = None
+
+        def _esperar(segundos):
+            nonlocal espera
+            espera = segundos if espera is None else min(espera, segundos)
+
+        for _ in range(len(self._turno)):
+            if len(lote) >= BATCH_MAX_SIZE:
+                break  # El resto de calendarios va en la siguiente vuelta
+            calendar_id = self._turno[0]
+            self._turno.rotate(-1)
+            cola = self._colas[calendar_id]
+            if not cola.pending:
+                continue
+
+            enfriamiento = segundos_enfriamiento(calendar_id)
+            if enfriamiento:
+                # En modo diferido no se espera al enfriamiento: el llamador reprograma
+                while cola.pending and cola.pending[0].defer_retries:
+                    pendiente = cola.pending.popleft()
+                    pendiente.future.set_result({
+                        'ok': False, 'response': None, 'retryable': True, 'clase': ERROR_CUOTA,
+                        'error': RetryableError(
+                            f"Calendario {calendar_id} en enfriamiento por cuota", retry_after=enfriamiento
+                        )
+                    })
+                _esperar(enfriamiento)
+                continue
+
+            if cola.in_flight:
+                continue  # Se vuelve a mirar cuando termine su lote
+
+            tomadas = 0
+            cola.refill(now)
+            while cola.pending and len(lote) < BATCH_MAX_SIZE:
+                pendiente = cola.pending[0]
+                if pendiente.not_before > now:
+                    _esperar(pendiente.not_before - now)
+                    break
+                if cola.tokens < 1:
+                    cola.throttled += 1
+                    THROTTLES.inc('calendar_write_scheduler', 'rate_limit')
+                    _esperar(cola.seconds_to_token())
+                    break
+                cola.tokens -= 1
+                lote.append(cola.pending.popleft())
+                tomadas += 1
+
+            if tomadas:
+                cola.in_flight = True
+        return lote, espera
+
+    def _dispatch_loop(self) -> None:
+        """Bucle del hilo despachador: toma lotes por turnos y los envía al pool."""
+        while True:
+            with self._cond:
+                lote, espera = self._tomar_lote()
+                if not lote:
+                    # Sin espera calculada: se despierta al encolar o al terminar un lote
+                    self._cond.wait(timeout=espera)
+                    continue
+                executor = self._executor
+            executor.submit(self._ejecutar_lote_en_vuelo, lote)
+
+    def _ejecutar_lote_en_vuelo(self, lote: List[_EscrituraPendiente]) -> None:
+        """Ejecuta un lote en el pool y libera sus calendarios al terminar."""
+        try:
+            self._ejecutar_lote(lote)
+        except Exception as e:
+            logger.error("Error ejecutando lote de escrituras en Google: %s", e)
+            for pendiente in lote:
+                if not pendiente.future.done():
+                    pendiente.future.set_result({
+                        'ok': False, 'response': None, 'error': e, 'retryable': False, 'clase': None
+                    })
+        finally:
+            with self._cond:
+                for calendar_id in {pendiente.operation['calendar_id'] for pendiente in lote}:
+                    self._colas[calendar_id].in_flight = False
+                self._cond.notify()
+
+    def _ejecutar_lote(self, lote: List[_EscrituraPendiente]) -> None:
+        """
+        Envía un lote en un batch por servicio (normalmente uno solo, con las partes de
+        todos sus calendarios) y resuelve (o reencola) cada operación.
+        """
+        por_servicio: Dict[int, List[_EscrituraPendiente]] = {}
+        for pendiente in lote:
+            por_servicio.setdefault(id(pendiente.service), []).append(pendiente)
+
+        for grupo in por_servicio.values():
+            # Las claves de los llamadores pueden repetirse entre items: cada parte lleva una propia
+            por_clave = {f"w{next(self._ids)}": pendiente for pendiente in grupo}
+            operaciones = [dict(p.operation, key=clave) for clave, p in por_clave.items()]
+            resultados = execute_event_batch(grupo[0].service, operaciones, defer_retries=True)
+            with self._cond:
+                self._stats['batches'] += 1
+                self._stats['operations'] += len(operaciones)
+
+            reencolar = []
+            now = time.time()
+            for clave, pendiente in por_clave.items():
+                resultado = resultados[clave]
+                pendiente.attempts += 1
+                if not resultado['ok'] and resultado['retryable'] and pendiente.retries_left > 0 \
+                        and not pendiente.abandoned:
+                    pendiente.retries_left -= 1
+                    retry_after = None
+                    if isinstance(resultado['error'], HttpError):
+                        retry_after = parse_retry_after(resultado['error'].resp.get('retry-after'))
+                    # El enfriamiento por cuota ya frena el calendario; el backoff cubre los 5xx
+                    pendiente.not_before = time.monotonic() + calcular_backoff(
+                        pendiente.attempts - 1, retry_after=retry_after
+                    )
+                    reencolar.append(pendiente)
+                    continue
+
+                with self._cond:
+                    cola = self._colas[pendiente.operation['calendar_id']]
+                    if resultado['ok']:
+                        cola.sent += 1
+                        cola.completed_at.append(now)
+                    else:
+                        cola.failed += 1
+                pendiente.future.set_result(resultado)
+
+            if reencolar:
+                with self._cond:
+                    self._stats['requeued'] += len(reencolar)
+                    # Al principio de su cola: conservan el orden respecto a las escrituras posteriores
+                    for pendiente in reversed(reencolar):
+                        self._colas[pendiente.operation['calendar_id']].pending.appendleft(pendiente)
+                    self._cond.notify()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Obtiene el backlog y el throughput de cada calendario."""
+        with self._cond:
+            now = time.time()
+            calendarios = {}
+            for calendar_id, cola in self._colas.items():
+                while cola.completed_at and now - cola.completed_at[0] > 60:
+                    cola.completed_at.popleft()
+                calendarios[calendar_id] = {
+                    'backlog': len(cola.pending),
+                    'oldest_wait_seconds': round(now - cola.pending[0].enqueued_at, 2) if cola.pending else 0,
+                    'writes_last_minute': len(cola.completed_at),
+                    'sent': cola.sent,
+                    'failed': cola.failed,
+                    'rate_limit_waits': cola.throttled,
+                    'batch_in_flight': cola.in_flight,
+                    'cooldown_seconds': round(segundos_enfriamiento(calendar_id), 2)
+                }
+            return dict(
+                self._stats,
+                rate_per_calendar=self.rate_per_calendar,
+                burst_per_calendar=self.burst_per_calendar,
+                max_concurrent_batches=self.max_concurrent_batches,
+                calendars=calendarios
+            )
+
+
+# Instancia global del planificador (el hilo despachador arranca con la primera escritura)
+calendar_write_scheduler = CalendarWriteScheduler()
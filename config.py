@@ -62,6 +62,14 @@ COL_FECHA_GRAB = "fecha56"
 # Alias para compatibilidad
 COL_FECHA = COL_FECHA_GRAB
 
+# Columnas cuyo cambio llega a Google Calendar (título, fecha, operarios, cliente y ubicación).
+# Los webhooks de cualquier otra columna se descartan antes de hacer ninguna llamada a la API
+SYNC_RELEVANT_COLUMNS = ["name", COL_FECHA_GRAB, "personas1", COL_CLIENTE, "ubicaci_n"]
+
+# Tiempo durante el que se reutiliza el último estado conocido de un item para aplicar
+# directamente el valor que trae el webhook, sin volver a consultar Monday (segundos)
+ITEM_SNAPSHOT_TTL = 300
+
 # --- CONFIGURACIÓN DE AUTOMATIZACIÓN ---
 
 # Usuario que representa la automatización del sistema
@@ -74,6 +82,114 @@ SYNC_COOLDOWN_SECONDS = 3  # Tiempo mínimo entre sincronizaciones del mismo ite
 AUTOMATION_DETECTION_WINDOW = 60  # Tiempo para detectar cambios de automatización (segundos)
 CONFLICT_RESOLUTION_WINDOW = 30  # Ventana para resolver conflictos entre Monday y Google (segundos)
 
+# --- CONFIGURACIÓN DE REINTENTOS DIFERIDOS ---
+
+# Los fallos transitorios (rate limit, timeouts, 5xx) no se reintentan dentro del hilo del webhook:
+# se entregan al planificador de reintentos, que los ejecuta en sus propios workers
+RETRY_QUEUE_FILE = "config/retry_queue.json"  # Tabla persistente de reintentos pendientes
+RETRY_WORKERS = 2  # Hilos que ejecutan reintentos en paralelo
+RETRY_MAX_ATTEMPTS = 6  # Intentos máximos antes de descartar una operación
+RETRY_BASE_DELAY_SECONDS = 2  # Espera base del backoff exponencial (con jitter)
+RETRY_MAX_DELAY_SECONDS = 300  # Tope de espera entre reintentos
+
+# --- COLA DE TRABAJO DEL WEBHOOK ---
+
+# El endpoint solo encola el webhook en una tabla SQLite y responde; los workers hacen la sincronización
+WORK_QUEUE_ENABLED = True
+WORK_QUEUE_DB = "config/work_queue.db"  # Trabajos pendientes y dead letter (sobreviven a reinicios)
+WORK_QUEUE_WORKERS = 4  # Hilos que consumen la cola
+WORK_QUEUE_MAX_ATTEMPTS = 6  # Intentos antes de mover un trabajo a dead letter
+WORK_QUEUE_LEASE_SECONDS = 300  # Un trabajo en curso sin confirmar se vuelve a entregar tras este tiempo
+WORK_QUEUE_POLL_SECONDS = 1  # Sondeo de trabajos diferidos o encolados por otros procesos
+WORK_QUEUE_FAILED_RESULT_TTL = 3600  # Segundos que se recuerda un trabajo cuyo handler devolvió False
+
+# Debounce por item: una edición en Monday suele disparar varios webhooks seguidos del mismo item.
+# Se funden en una sola sincronización cuando el item lleva esta ventana sin eventos nuevos
+WEBHOOK_DEBOUNCE_SECONDS = 0.5
+WEBHOOK_DEBOUNCE_MAX_DELAY_SECONDS = 5  # Tope de espera desde el primer webhook de la ráfaga
+
+# Prioridad: con la cola atascada se entregan antes las sincronizaciones de grabaciones próximas (fecha56).
+# Prioridad = días hasta la grabación (acotados al horizonte) + ajuste del origen; menor = antes
+WORK_QUEUE_PRIORITY_HORIZON_DAYS = 60  # Grabaciones más lejanas o ya pasadas cuentan como a este plazo
+WORK_QUEUE_PRIORITY_UNKNOWN_DATE_DAYS = 7  # Items cuya fecha aún no se conoce (p. ej. recién creados)
+WORK_QUEUE_PRIORITY_BY_SOURCE = {
+    'manual': -60,           # Scripts forzar_sincronizacion*: alguien está esperando el resultado
+    'webhook': 0,            # Cambios en Monday
+    'reconciliation': 30,    # Divergencias detectadas en Google y resincronizaciones del tablero completo
+}
+WORK_QUEUE_PRIORITY_AGE_BOOST_PER_MINUTE = 2  # Cada minuto en la cola adelanta un trabajo lo que 2 días de cercanía
+
+# Idempotencia: los reenvíos de Monday (mismo triggerUuid) se responden sin procesarlos
+WEBHOOK_DEDUP_WINDOW_SECONDS = 600  # Tiempo durante el que un webhook cuenta como ya recibido
+# Webhooks sin triggerUuid ni instante del cambio: dos cambios reales iguales solo se distinguen por
+# el momento en que llegan, así que la ventana cubre los reenvíos inmediatos y poco más
+WEBHOOK_DEDUP_UNTIMED_WINDOW_SECONDS = 30
+WEBHOOK_DEDUP_DB = WORK_QUEUE_DB  # Claves compartidas por todos los workers
+WEBHOOK_DEDUP_PURGE_INTERVAL = 60  # Segundos entre borrados de claves caducadas
+
+# --- SERVIDOR ---
+
+# Desarrollo: python app.py (un proceso). Producción: gunicorn -c gunicorn.conf.py (varios procesos)
+SERVER_PORT = 6754
+# Con varios procesos, el detector de divergencias y los reintentos diferidos corren solo en el que
+# consigue el lock de este archivo
+BACKGROUND_TASKS_LOCK_FILE = "config/background_tasks.lock"
+
+# --- LOGGING ---
+
+# Registros estructurados (item_id, change_uuid, stage) escritos desde un hilo aparte (ver sync_logging)
+LOG_LEVEL = "INFO"
+LOG_LEVELS = {  # Nivel por módulo; en DEBUG los bucles por perfil y por operación generan mucho volumen
+    'sync_logic': 'INFO',
+    'google_calendar_service': 'INFO',
+    'monday_api_handler': 'WARNING',
+    'werkzeug': 'WARNING',
+}
+LOG_FORMAT = "text"  # 'text' (una línea con campos clave=valor) o 'json' (una línea JSON por registro)
+LOG_DEBUG_SAMPLE_EVERY = 100  # De cada línea de depuración se emite 1 de cada N (1 = todas)
+LOG_QUEUE_SIZE = 10000  # Registros en espera de escribirse; si se llena se descartan en lugar de bloquear
+
+# --- MÉTRICAS ---
+
+# GET /metrics en formato texto de Prometheus (ver sync_metrics)
+METRICS_STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Segundos
+# Con varios procesos cada uno vuelca sus contadores aquí y /metrics suma los de todos
+METRICS_DIR = "config/metrics"
+METRICS_FLUSH_SECONDS = 10
+
+# --- CONEXIONES CON GOOGLE CALENDAR ---
+
+# Un único servicio de Google se comparte entre hilos; las peticiones se reparten en un pool de conexiones
+GOOGLE_HTTP_POOL_SIZE = 8  # Conexiones HTTP simultáneas con Google
+GOOGLE_HTTP_TIMEOUT = 60  # Timeout de cada petición a Google (segundos)
+GOOGLE_CREDENTIALS_REFRESH_MARGIN = 300  # Refrescar el token en segundo plano este tiempo antes de que caduque
+
+# Las escrituras se encolan por calendario y se envían por turnos, con un límite de ritmo por calendario
+CALENDAR_WRITE_SCHEDULER_ENABLED = True
+CALENDAR_WRITE_RATE_PER_SECOND = 5  # Escrituras por segundo en cada calendario
+CALENDAR_WRITE_BURST = 10  # Escrituras seguidas que admite un calendario inactivo
+CALENDAR_WRITE_CONCURRENCY = 4  # Lotes enviados a la vez (nunca dos del mismo calendario)
+CALENDAR_WRITE_TIMEOUT_SECONDS = 120  # Espera máxima de un llamador; después la escritura es un error transitorio
+
+# --- ÍNDICE DE EVENTOS POR CALENDARIO ---
+
+# (monday_item_id, calendar_id) → google event_id, para no listar calendarios al buscar copias.
+# Vive en la base SQLite de la cola: cada escritura toca solo su fila y es atómica entre procesos
+EVENT_INDEX_DB = WORK_QUEUE_DB
+EVENT_INDEX_FILE = "config/event_index.json"  # Formato antiguo: se importa una vez a EVENT_INDEX_DB
+
+# IDs de evento derivados de (board_id, item_id, calendar_id): crear es idempotente y no hay que buscar IDs.
+# Los items que ya tienen en Monday un ID asignado por Google siguen usándolo
+DETERMINISTIC_EVENT_IDS = True
+WRITE_EVENT_ID_TO_MONDAY = True  # Guardar también el ID en la columna de Monday (prescindible con IDs deterministas)
+
+# --- DETECCIÓN DE EDICIONES MANUALES EN GOOGLE ---
+
+# Consulta incremental (syncToken) de los calendarios sincronizados para re-empujar eventos editados a mano
+DRIFT_DETECTION_ENABLED = True
+DRIFT_POLL_INTERVAL_SECONDS = 300  # Segundos entre consultas incrementales
+SYNC_TOKENS_FILE = "config/sync_tokens.json"  # Último nextSyncToken de cada calendario
+
 # --- CONFIGURACIÓN DE FILMMAKERS ---
 
 # Lista de perfiles de filmmakers
@@ -0,0 +1,252 @@
+"""
+Drift Detector - Detección incremental de ediciones manuales en Google Calendar
+===============================================================================
+
+Los eventos sincronizados son de solo lectura, pero nada impide editarlos o
+borrarlos desde Google Calendar. Este módulo guarda un `nextSyncToken` por
+calendario (maestro + calendarios de FILMMAKER_PROFILES) y consulta
+periódicamente solo los eventos que cambiaron desde la última consulta.
+
+Un evento cambiado se considera divergente cuando su etag no coincide con el
+de nuestra última escritura (ver event_index) o cuando fue borrado. Para cada
+divergencia se invoca `on_drift(monday_item_id, calendar_id, event)`, que
+vuelve a empujar la versión de Monday.
+
+El coste de cada consulta es proporcional a los cambios, no al tamaño del calendario.
+"""
+
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+import config
+from event_index import event_index
+from google_calendar_service import CAMPOS_POR_OPERACION
+
+logger = logging.getLogger(__name__)
+
+
+class DriftDetector:
+    """
+    Detector de divergencias entre Google Calendar y la última versión sincronizada.
+    """
+
+    def __init__(
+        self,
+        state_file_path: str = config.SYNC_TOKENS_FILE,
+        poll_interval: float = config.DRIFT_POLL_INTERVAL_SECONDS
+    ):
+        """
+        Inicializa el detector. Los syncTokens guardados se cargan con la primera consulta.
+
+        Args:
+            state_file_path: Ruta al archivo JSON con un syncToken por calendario
+            poll_interval: Segundos entre consultas en segundo plano
+        """
+        self.state_file_path = Path(state_file_path)
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self._tokens: Dict[str, Dict[str, Any]] = {}
+        self._stats = {'polls': 0, 'changed_events': 0, 'drifts': 0, 'full_resyncs': 0, 'last_poll_at': None}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cargado = False
+
+    def _asegurar_estado(self) -> None:
+        """Crea el directorio de estado y carga los syncTokens la primera vez."""
+        with self.lock:
+            if self._cargado:
+                return
+            self._cargado = True
+            self.state_file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._load_state()
+
+    def _load_state(self) -> None:
+        """Carga los syncTokens desde disco."""
+        if not self.state_file_path.exists():
+            return
+        try:
+            with open(self.state_file_path, 'r', encoding='utf-8') as f:
+                self._tokens = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            logger.warning("Error al cargar syncTokens, se hará sincronización inicial: %s", e)
+            self._tokens = {}
+
+    def _save_state(self) -> None:
+        """Guarda los syncTokens en disco (escritura atómica)."""
+        try:
+            temp_file = self.state_file_path.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._tokens, f, indent=2, ensure_ascii=False)
+            temp_file.replace(self.state_file_path)
+        except Exception as e:
+            logger.error("Error al guardar syncTokens: %s", e)
+
+    def calendarios_vigilados(self) -> List[str]:
+        """Calendario maestro y todos los calendarios personales configurados."""
+        calendarios = [config.MASTER_CALENDAR_ID]
+        for perfil in config.FILMMAKER_PROFILES:
+            calendar_id = perfil.get('calendar_id')
+            if calendar_id and calendar_id not in calendarios:
+                calendarios.append(calendar_id)
+        return calendarios
+
+    def _listar(self, service, calendar_id: str, sync_token: Optional[str]) -> tuple:
+        """
+        Recorre todas las páginas de events.list.
+
+        Returns:
+            (eventos cambiados, nextSyncToken)
+        """
+        eventos = []
+        page_token = None
+        while True:
+            kwargs = {'calendarId': calendar_id, 'maxResults': 2500}
+            if sync_token:
+                kwargs.update({'syncToken': sync_token, 'fields': CAMPOS_POR_OPERACION['cambios']})
+            else:
+                kwargs['fields'] = CAMPOS_POR_OPERACION['solo_token']
+            if page_token:
+                kwargs['pageToken'] = page_token
+
+            response = service.events().list(**kwargs).execute()
+            eventos.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return eventos, response.get('nextSyncToken')
+
+    def consultar_cambios(self, service, calendar_id: str) -> List[Dict[str, Any]]:
+        """
+        Obtiene los eventos cambiados en un calendario desde la última consulta.
+
+        Sin token (primera vez o token caducado) se hace una sincronización inicial
+        que solo establece la línea base y no devuelve eventos.
+
+        Returns:
+            Lista de eventos cambiados (vacía en la sincronización inicial)
+        """
+        self._asegurar_estado()
+        with self.lock:
+            sync_token = (self._tokens.get(calendar_id) or {}).get('sync_token')
+
+        try:
+            eventos, next_token = self._listar(service, calendar_id, sync_token)
+        except HttpError as error:
+            if error.resp.status != 410:
+                raise
+            # Token caducado: Google exige una sincronización completa
+            logger.info("syncToken caducado para %s, nueva sincronización inicial", calendar_id)
+            self._stats['full_resyncs'] += 1
+            sync_token = None
+            eventos, next_token = self._listar(service, calendar_id, None)
+
+        with self.lock:
+            if next_token:
+                self._tokens[calendar_id] = {'sync_token': next_token, 'updated_at': time.time()}
+                self._save_state()
+
+        return eventos if sync_token else []
+
+    def detectar_divergencias(self, calendar_id: str, eventos: List[Dict[str, Any]]) -> List[tuple]:
+        """
+        Filtra los eventos cambiados que no corresponden a nuestra última escritura.
+
+        Returns:
+            Lista de (monday_item_id, evento) divergentes
+        """
+        divergencias = []
+        for evento in eventos:
+            monday_item_id = evento.get('extendedProperties', {}).get('private', {}).get('monday_item_id')
+            if monday_item_id:
+                entry = event_index.get(monday_item_id, calendar_id)
+            else:
+                # Los eventos borrados llegan solo con id y status
+                entry = event_index.find_by_event_id(calendar_id, evento.get('id'))
+            if not entry or entry.get('event_id') != evento.get('id'):
+                continue  # Evento no gestionado por la sincronización o sin línea base para comparar
+            monday_item_id = entry['item_id']
+            if evento.get('status') != 'cancelled':
+                if not entry.get('etag'):
+                    # Sin etag guardado no hay con qué comparar: el de ahora pasa a ser la línea base
+                    event_index.update_entry(monday_item_id, calendar_id, etag=evento.get('etag'))
+                    continue
+                if evento.get('etag') == entry.get('etag'):
+                    continue  # Es nuestra propia escritura
+
+            divergencias.append((monday_item_id, evento))
+        return divergencias
+
+    def poll(self, service, on_drift: Callable[[str, str, Dict[str, Any]], Any]) -> int:
+        """
+        Consulta todos los calendarios vigilados una vez.
+
+        Args:
+            service: Servicio de Google Calendar
+            on_drift: Función llamada con (monday_item_id, calendar_id, evento) por cada divergencia
+
+        Returns:
+            Número de divergencias detectadas
+        """
+        total = 0
+        for calendar_id in self.calendarios_vigilados():
+            try:
+                eventos = self.consultar_cambios(service, calendar_id)
+            except Exception as e:
+                logger.warning("Error consultando cambios en %s: %s", calendar_id, e)
+                continue
+
+            self._stats['changed_events'] += len(eventos)
+            for monday_item_id, evento in self.detectar_divergencias(calendar_id, eventos):
+                estado = 'borrado' if evento.get('status') == 'cancelled' else 'editado'
+                logger.warning("Evento %s del item %s %s en %s", evento.get('id'), monday_item_id, estado, calendar_id)
+                total += 1
+                try:
+                    on_drift(monday_item_id, calendar_id, evento)
+                except Exception as e:
+                    logger.error("Error re-sincronizando item %s: %s", monday_item_id, e)
+
+        self._stats['polls'] += 1
+        self._stats['drifts'] += total
+        self._stats['last_poll_at'] = time.time()
+        return total
+
+    def start(self, service_getter: Callable[[], Any], on_drift: Callable[[str, str, Dict[str, Any]], Any]) -> None:
+        """
+        Arranca la consulta periódica en un hilo en segundo plano.
+
+        Args:
+            service_getter: Función que devuelve el servicio de Google (o None si no está disponible)
+            on_drift: Ver poll()
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+
+        def _loop():
+            while not self._stop_event.wait(self.poll_interval):
+                service = service_getter()
+                if service:
+                    self.poll(service, on_drift)
+
+        self._thread = threading.Thread(target=_loop, name='drift-detector', daemon=True)
+        self._thread.start()
+        logger.info("Detector de divergencias iniciado (cada %ss)", self.poll_interval)
+
+    def stop(self) -> None:
+        """Detiene la consulta periódica."""
+        self._stop_event.set()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Obtiene estadísticas del detector."""
+        self._asegurar_estado()
+        with self.lock:
+            return dict(self._stats, calendars_with_token=len(self._tokens))
+
+
+# Instancia global del detector (el hilo se arranca explícitamente con start())
+drift_detector = DriftDetector()
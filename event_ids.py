@@ -0,0 +1,84 @@
+"""
+Event IDs - IDs de evento de Google derivados de los items de Monday
+====================================================================
+
+Google Calendar admite que el cliente elija el ID de un evento al crearlo,
+siempre que use el alfabeto base32hex en minúsculas (a-v y 0-9) y tenga entre
+5 y 1024 caracteres. Con IDs deterministas:
+
+- Crear es idempotente: repetir el insert responde 409 en lugar de duplicar.
+- item → evento es un cálculo: no hace falta guardar el ID en Monday ni
+  buscarlo en Google.
+- evento → item también: el ID lleva codificados board_id e item_id.
+
+Formato: 'mon' + base32hex("<board_id>.<item_id>") + 8 caracteres derivados
+del calendar_id (cada copia personal tiene su propio ID).
+"""
+
+import base64
+import hashlib
+import re
+from typing import Optional, Tuple
+
+# Prefijo fijo (dentro del alfabeto base32hex) que marca los IDs generados aquí
+PREFIJO_EVENT_ID = 'mon'
+LONGITUD_SUFIJO_CALENDARIO = 8
+
+_PATRON_EVENT_ID = re.compile(r'^[0-9a-v]{5,1024}$')
+_PATRON_CONTENIDO = re.compile(r'^(\d+)\.(\d+)$')
+
+
+def _sufijo_calendario(calendar_id: str) -> str:
+    """8 caracteres base32hex derivados del calendar_id (5 bytes de su SHA-256)."""
+    digest = hashlib.sha256(calendar_id.encode('utf-8')).digest()[:5]
+    return base64.b32hexencode(digest).decode('ascii').lower()
+
+
+def generar_event_id(board_id: str, item_id: str, calendar_id: str) -> str:
+    """
+    Genera el ID de evento de un item en un calendario.
+
+    Args:
+        board_id: ID del tablero de Monday.com
+        item_id: ID del item en Monday.com
+        calendar_id: ID del calendario de Google
+
+    Returns:
+        ID válido para events.insert (base32hex en minúsculas)
+    """
+    contenido = f"{board_id}.{item_id}".encode('ascii')
+    codificado = base64.b32hexencode(contenido).decode('ascii').lower().rstrip('=')
+    return f"{PREFIJO_EVENT_ID}{codificado}{_sufijo_calendario(calendar_id)}"
+
+
+def decodificar_event_id(event_id: str, calendar_id: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """
+    Obtiene board_id e item_id de un ID generado con generar_event_id.
+
+    Args:
+        event_id: ID del evento de Google
+        calendar_id: Si se indica, el ID solo es válido si se generó para ese calendario
+
+    Returns:
+        (board_id, item_id), o None si el ID no es determinista (p. ej. un ID asignado por Google)
+    """
+    if not event_id or not _PATRON_EVENT_ID.match(event_id) or not event_id.startswith(PREFIJO_EVENT_ID):
+        return None
+    codificado = event_id[len(PREFIJO_EVENT_ID):-LONGITUD_SUFIJO_CALENDARIO]
+    sufijo = event_id[-LONGITUD_SUFIJO_CALENDARIO:]
+    if not codificado or (calendar_id and sufijo != _sufijo_calendario(calendar_id)):
+        return None
+
+    try:
+        relleno = '=' * (-len(codificado) % 8)
+        contenido = base64.b32hexdecode(codificado.upper() + relleno).decode('ascii')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+    coincidencia = _PATRON_CONTENIDO.match(contenido)
+    return coincidencia.groups() if coincidencia else None
+
+
+def es_event_id_determinista(event_id: str) -> bool:
+    """True si el ID se generó con generar_event_id."""
+    return decodificar_event_id(event_id) is not None
@@ -0,0 +1,265 @@
+import json
+import os
+import sqlite3
+import time
+import threading
+import logging
+from typing import Dict, Optional, Any
+from pathlib import Path
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS event_index (
+    item_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (item_id, calendar_id)
+);
+CREATE INDEX IF NOT EXISTS event_index_event ON event_index (calendar_id, event_id);
+"""
+
+
+class EventIndex:
+    """
+    Índice persistente (monday_item_id, calendar_id) → google event_id.
+
+    Evita listar calendarios completos para encontrar la copia de un item:
+    se mantiene en cada creación y borrado de eventos, y solo cuando no hay
+    entrada se recurre a una búsqueda en el servidor por
+    `privateExtendedProperty=monday_item_id=...`.
+
+    Cada entrada puede guardar además metadatos del último evento escrito
+    en ese calendario (p. ej. el cuerpo completo, base de los parches).
+
+    Las entradas son filas de una tabla SQLite compartida por todos los
+    procesos: cada cambio lee y escribe su fila en una sola transacción.
+    """
+
+    def __init__(self, db_path: str = config.EVENT_INDEX_DB, legacy_file_path: str = config.EVENT_INDEX_FILE):
+        """
+        Inicializa el índice. La tabla se crea con la primera conexión, no al importar el módulo.
+
+        Args:
+            db_path: Ruta a la base de datos SQLite
+            legacy_file_path: Índice JSON de versiones anteriores, que se importa si existe
+        """
+        self.db_path = Path(db_path)
+        self.legacy_file_path = Path(legacy_file_path)
+        self._local = threading.local()
+        self._preparacion = threading.RLock()
+        self._preparado = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Conexión del hilo actual (SQLite no permite compartir conexiones entre hilos ni procesos)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._preparar(conn)
+        return conn
+
+    def _preparar(self, conn: sqlite3.Connection) -> None:
+        """Crea la tabla e importa el índice JSON antiguo con la primera conexión."""
+        with self._preparacion:
+            if self._preparado:
+                return
+            self._preparado = True
+            conn.executescript(_ESQUEMA)
+            self._importar_json()
+
+    def _importar_json(self) -> None:
+        """Pasa a la tabla el índice JSON antiguo. Si no se puede leer, se deja intacto."""
+        if not self.legacy_file_path.exists():
+            return
+        try:
+            with open(self.legacy_file_path, 'r', encoding='utf-8') as f:
+                antiguo = json.load(f)
+        except FileNotFoundError:
+            return  # Otro proceso lo importó a la vez
+        except json.JSONDecodeError as e:
+            logger.warning("Índice de eventos antiguo ilegible, no se importa (%s): %s", self.legacy_file_path, e)
+            return
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for entry in antiguo.values():
+                metadata = {k: v for k, v in entry.items()
+                            if k not in ('item_id', 'calendar_id', 'event_id', 'updated_at')}
+                conn.execute(
+                    'INSERT OR IGNORE INTO event_index (item_id, calendar_id, event_id, metadata, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (entry['item_id'], entry['calendar_id'], entry['event_id'],
+                     json.dumps(metadata, ensure_ascii=False), entry.get('updated_at', time.time()))
+                )
+        try:
+            self.legacy_file_path.replace(self.legacy_file_path.with_suffix('.json.importado'))
+        except FileNotFoundError:
+            pass
+        logger.info("Importadas %s entradas del índice de eventos antiguo", len(antiguo))
+
+    @staticmethod
+    def _entrada(row: sqlite3.Row) -> Dict[str, Any]:
+        """Convierte una fila en el diccionario de entrada."""
+        entry = json.loads(row['metadata'])
+        entry.update({
+            'item_id': row['item_id'],
+            'calendar_id': row['calendar_id'],
+            'event_id': row['event_id'],
+            'updated_at': row['updated_at']
+        })
+        return entry
+
+    def get(self, item_id: str, calendar_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene la entrada de un item en un calendario.
+
+        Args:
+            item_id: ID del item en Monday.com
+            calendar_id: ID del calendario de Google
+
+        Returns:
+            Copia de la entrada o None si no está indexado
+        """
+        row = self._connect().execute(
+            'SELECT * FROM event_index WHERE item_id = ? AND calendar_id = ?', (str(item_id), calendar_id)
+        ).fetchone()
+        return self._entrada(row) if row else None
+
+    def get_event_id(self, item_id: str, calendar_id: str) -> Optional[str]:
+        """Devuelve el event_id indexado para un item en un calendario, o None."""
+        row = self._connect().execute(
+            'SELECT event_id FROM event_index WHERE item_id = ? AND calendar_id = ?', (str(item_id), calendar_id)
+        ).fetchone()
+        return row['event_id'] if row else None
+
+    def set_event(self, item_id: str, calendar_id: str, event_id: str, **metadata: Any) -> None:
+        """
+        Registra (o reemplaza) el evento de un item en un calendario.
+
+        Args:
+            item_id: ID del item en Monday.com
+            calendar_id: ID del calendario de Google
+            event_id: ID del evento de Google
+            **metadata: Campos adicionales a guardar en la entrada
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT event_id, metadata FROM event_index WHERE item_id = ? AND calendar_id = ?',
+                (str(item_id), calendar_id)
+            ).fetchone()
+            # Evento distinto: los metadatos del anterior ya no valen
+            actuales = json.loads(row['metadata']) if row and row['event_id'] == event_id else {}
+            actuales.update(metadata)
+            conn.execute(
+                'INSERT OR REPLACE INTO event_index (item_id, calendar_id, event_id, metadata, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (str(item_id), calendar_id, event_id, json.dumps(actuales, ensure_ascii=False), time.time())
+            )
+
+    def update_entry(self, item_id: str, calendar_id: str, **fields: Any) -> bool:
+        """
+        Actualiza campos de una entrada existente.
+
+        Returns:
+            True si la entrada existía y se actualizó
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT metadata FROM event_index WHERE item_id = ? AND calendar_id = ?',
+                (str(item_id), calendar_id)
+            ).fetchone()
+            if not row:
+                return False
+            metadata = json.loads(row['metadata'])
+            metadata.update(fields)
+            conn.execute(
+                'UPDATE event_index SET metadata = ?, updated_at = ? WHERE item_id = ? AND calendar_id = ?',
+                (json.dumps(metadata, ensure_ascii=False), time.time(), str(item_id), calendar_id)
+            )
+            return True
+
+    def remove(self, item_id: str, calendar_id: str) -> bool:
+        """
+        Elimina la entrada de un item en un calendario (p. ej. tras borrar el evento).
+
+        Returns:
+            True si existía
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'DELETE FROM event_index WHERE item_id = ? AND calendar_id = ?', (str(item_id), calendar_id)
+            )
+        return cursor.rowcount > 0
+
+    def find_by_event_id(self, calendar_id: str, event_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca la entrada de un evento por su ID (p. ej. eventos borrados, que Google
+        devuelve sin propiedades extendidas).
+
+        Returns:
+            Copia de la entrada o None si el evento no está indexado
+        """
+        row = self._connect().execute(
+            'SELECT * FROM event_index WHERE calendar_id = ? AND event_id = ?', (calendar_id, event_id)
+        ).fetchone()
+        return self._entrada(row) if row else None
+
+    def get_entries_for_item(self, item_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Obtiene todas las entradas de un item.
+
+        Returns:
+            Diccionario {calendar_id: entrada}
+        """
+        rows = self._connect().execute('SELECT * FROM event_index WHERE item_id = ?', (str(item_id),))
+        return {row['calendar_id']: self._entrada(row) for row in rows}
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Obtiene estadísticas del índice."""
+        conn = self._connect()
+        calendars = {
+            row['calendar_id']: row['total']
+            for row in conn.execute('SELECT calendar_id, COUNT(*) AS total FROM event_index GROUP BY calendar_id')
+        }
+        items = conn.execute('SELECT COUNT(DISTINCT item_id) FROM event_index').fetchone()[0]
+        return {
+            'total_entries': sum(calendars.values()),
+            'items': items,
+            'entries_by_calendar': calendars
+        }
+
+
+# Instancia global del índice
+event_index = EventIndex()
+
+
+# Funciones de conveniencia para uso directo
+def get_indexed_event_id(item_id: str, calendar_id: str) -> Optional[str]:
+    """Función de conveniencia para obtener el event_id indexado."""
+    return event_index.get_event_id(item_id, calendar_id)
+
+
+def index_event(item_id: str, calendar_id: str, event_id: str, **metadata: Any) -> None:
+    """Función de conveniencia para registrar un evento en el índice."""
+    event_index.set_event(item_id, calendar_id, event_id, **metadata)
+
+
+def unindex_event(item_id: str, calendar_id: str) -> bool:
+    """Función de conveniencia para eliminar un evento del índice."""
+    return event_index.remove(item_id, calendar_id)
@@ -1,20 +1,48 @@
 import os
 import json
+import logging
 import time
+import hashlib
 import ssl
 import socket
+import threading
 from datetime import datetime, timedelta
-from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
 from googleapiclient.errors import HttpError
 from googleapiclient.http import HttpRequest
 import httplib2
 
+from google_service_pool import PooledAuthorizedHttp
+from retry_scheduler import RetryableError, parse_retry_after, calcular_backoff
+from sync_metrics import GOOGLE_BATCH_PARTS, RETRIES, THROTTLES
+
+logger = logging.getLogger(__name__)
+
 # Configuración de la API de Google Calendar
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# Máscaras de campos (respuesta parcial) por operación: cada llamada declara lo que
+# realmente lee y Google no envía el resto del recurso (descripción, asistentes...)
+CAMPOS_POR_OPERACION = {
+    # insert/update/patch: el ID y el etag alimentan el índice de eventos
+    'escritura': 'id,etag,updated',
+    # Comprobación de ediciones manuales
+    'verificacion': 'id,etag,status,updated',
+    # Copia de un item en un calendario (búsqueda por monday_item_id)
+    'buscar_por_item': 'items(id,etag,extendedProperties/private/monday_item_id)',
+    # Copia de un evento maestro (scripts y sincronización multi-calendario)
+    'buscar_copia': 'items(id,summary,start,end,extendedProperties/private)',
+    # Eventos actualizados recientemente
+    'recientes': 'items(id,summary,status,updated,start,end,extendedProperties/private)',
+    # Detección incremental de cambios (syncToken)
+    'cambios': 'nextPageToken,nextSyncToken,items(id,etag,status,updated,extendedProperties/private/monday_item_id)',
+    # Sincronización inicial: solo interesa el token final
+    'solo_token': 'nextPageToken,nextSyncToken',
+}
+
 def create_http_with_retries():
     """
     Crea un objeto HTTP con configuración robusta para evitar errores SSL.
@@ -42,9 +70,21 @@ def create_http_with_retries():
     
     return http
 
-def get_calendar_service():
+def _guardar_credenciales(creds):
+    """Guarda las credenciales en config/token.json para la próxima ejecución."""
+    with open('config/token.json', 'w') as token:
+        token.write(creds.to_json())
+
+def _cargar_credenciales():
     """
-    Obtiene el servicio de Google Calendar autenticado con manejo robusto de errores SSL.
+    Carga las credenciales de Google desde config/token.json.
+    
+    Si el token ha caducado pero tiene refresh_token se devuelve tal cual: el pool
+    lo refresca en la primera petición. Solo sin token válido se lanza el flujo
+    de autenticación interactivo.
+    
+    Raises:
+        Exception: Si no hay forma de obtener credenciales
     """
     creds = None
     
@@ -52,44 +92,237 @@ def get_calendar_service():
     if os.path.exists('config/token.json'):
         creds = Credentials.from_authorized_user_file('config/token.json', SCOPES)
     
+    if creds and (creds.valid or (creds.expired and creds.refresh_token)):
+        return creds
+    
     # Si no hay credenciales válidas disponibles, deja que el usuario se autentique
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"❌ Error refrescando credenciales: {e}")
-                return None
-        else:
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            except Exception as e:
-                print(f"❌ Error en autenticación: {e}")
-                return None
-        
-        # Guarda las credenciales para la próxima ejecución
-        try:
-            with open('config/token.json', 'w') as token:
-                token.write(creds.to_json())
-        except Exception as e:
-            print(f"❌ Error guardando credenciales: {e}")
+    try:
+        flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+        creds = flow.run_local_server(port=0)
+    except Exception as e:
+        logger.error("Error en autenticación: %s", e)
+        raise
     
+    # Guarda las credenciales para la próxima ejecución
     try:
-        # Crear servicio con configuración simplificada para unidirectional sync
-        service = build(
-            'calendar', 
-            'v3', 
-            credentials=creds, 
-            cache_discovery=False
-        )
+        _guardar_credenciales(creds)
+    except Exception as e:
+        logger.error("Error guardando credenciales: %s", e)
+    return creds
+
+# Documento discovery de Calendar v3, incluido en google-api-python-client (se lee una vez por proceso)
+_documento_discovery = None
+
+def _obtener_documento_discovery():
+    """Devuelve el documento discovery empaquetado, sin ninguna petición de red."""
+    global _documento_discovery
+    if _documento_discovery is None:
+        _documento_discovery = discovery_cache.get_static_doc('calendar', 'v3')
+    return _documento_discovery
+
+def get_calendar_service():
+    """
+    Obtiene el servicio de Google Calendar autenticado con manejo robusto de errores SSL.
+    
+    El servicio se construye al instante: el documento discovery es el empaquetado
+    con la librería y las credenciales se cargan (y refrescan si hace falta) en la
+    primera petición, no aquí. Después se refrescan en segundo plano antes de caducar.
+    
+    El servicio devuelto puede compartirse entre hilos: sus peticiones se reparten
+    en un pool de conexiones (ver google_service_pool) con credenciales compartidas.
+    """
+    try:
+        # Crear servicio con configuración simplificada para unidirectional sync.
+        # El transporte es un pool de conexiones: el servicio es seguro entre hilos
+        http = PooledAuthorizedHttp(on_refresh=_guardar_credenciales)
+        service = build_from_document(_obtener_documento_discovery(), http=http)
+        # El cargador se asigna tras construir: build_from_document consulta http.credentials
+        # y, con el cargador ya puesto, cargaría las credenciales al arrancar
+        http.credentials_loader = _cargar_credenciales
         
         return service
     except Exception as e:
-        print(f"❌ Error al crear el servicio de Google Calendar: {e}")
+        logger.error("Error al crear el servicio de Google Calendar: %s", e)
         return None
 
-def create_google_event(service, calendar_id, event_body, extended_properties=None):
+# --- Clasificación de errores de Google y su política de reintento ---
+
+ERROR_CUOTA = 'cuota'                # 429, 403 rateLimitExceeded/userRateLimitExceeded/quotaExceeded
+ERROR_SERVIDOR = 'servidor'          # 5xx
+ERROR_RED = 'red'                    # SSL, socket, timeouts
+ERROR_NO_ENCONTRADO = 'no_encontrado'  # 404, 410: el evento no existe (o ya se borró)
+ERROR_CONFLICTO = 'conflicto'        # 409: el evento ya existe
+ERROR_PRECONDICION = 'precondicion'  # 412: el etag no coincide (edición manual)
+ERROR_PERMANENTE = 'permanente'      # 400, 401, 403 sin cuota... reintentar no lo arregla
+
+MOTIVOS_CUOTA = ('rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded')
+
+# Errores de conexión y timeouts. No vale OSError en general (socket.error es OSError):
+# un archivo que no se puede leer o un permiso denegado no se arreglan reintentando
+ERRORES_RED = (
+    ssl.SSLError, ConnectionError, TimeoutError, socket.timeout, socket.gaierror, httplib2.HttpLib2Error
+)
+
+# Etiqueta 'outcome'/'reason' de cada clase de error en las métricas (mismos valores que sync_metrics)
+RESULTADO_METRICA = {
+    ERROR_CUOTA: 'rate_limited',
+    ERROR_SERVIDOR: 'server_error',
+    ERROR_RED: 'network_error',
+    ERROR_NO_ENCONTRADO: 'not_found',
+    ERROR_CONFLICTO: 'conflict',
+    ERROR_PRECONDICION: 'precondition_failed',
+    ERROR_PERMANENTE: 'client_error',
+}
+
+def _motivos_error(error):
+    """Extrae los 'reason' del cuerpo JSON de un HttpError de Google."""
+    try:
+        contenido = json.loads(error.content.decode('utf-8') if isinstance(error.content, bytes) else error.content)
+        return [e.get('reason') for e in contenido.get('error', {}).get('errors', []) if e.get('reason')]
+    except (AttributeError, TypeError, ValueError):
+        return []
+
+def clasificar_error_google(error):
+    """
+    Clasifica un error de la API de Google Calendar.
+    
+    Returns:
+        str: Una de las constantes ERROR_* de este módulo
+    """
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status == 429:
+            return ERROR_CUOTA
+        if status == 403:
+            motivos = _motivos_error(error) or [m for m in MOTIVOS_CUOTA if m in str(error)]
+            return ERROR_CUOTA if any(m in MOTIVOS_CUOTA for m in motivos) else ERROR_PERMANENTE
+        if status in (404, 410):
+            return ERROR_NO_ENCONTRADO
+        if status == 409:
+            return ERROR_CONFLICTO
+        if status == 412:
+            return ERROR_PRECONDICION
+        if status >= 500:
+            return ERROR_SERVIDOR
+        return ERROR_PERMANENTE
+    if isinstance(error, ERRORES_RED):
+        return ERROR_RED
+    return ERROR_PERMANENTE
+
+def es_error_reintentable(error, method=None, id_propio=False):
+    """
+    Indica si una operación fallida se puede repetir tal cual.
+    
+    Los errores de cuota siempre (la petición se rechazó sin aplicarse). Los 5xx y
+    errores de red solo si la operación es idempotente: un insert sin ID propio que
+    falla así puede haberse aplicado, y repetirlo duplicaría el evento. Con ID propio
+    (ver event_ids) la repetición responde 409 en vez de duplicar.
+    """
+    clase = clasificar_error_google(error)
+    if clase == ERROR_CUOTA:
+        return True
+    if clase in (ERROR_SERVIDOR, ERROR_RED):
+        return method != 'insert' or id_propio
+    return False
+
+def _es_error_transitorio(error):
+    """
+    Indica si un error de Google merece un reintento diferido.
+    
+    Son transitorios los de cuota, los 5xx y los errores de red/SSL. El resto
+    (400, 404, 409, permisos...) no se arregla reintentando.
+    """
+    return clasificar_error_google(error) in (ERROR_CUOTA, ERROR_SERVIDOR, ERROR_RED)
+
+def _como_error_reintentable(error, operacion):
+    """Convierte un error transitorio de Google en RetryableError con su Retry-After."""
+    if isinstance(error, RetryableError):
+        return error
+    retry_after = None
+    if isinstance(error, HttpError):
+        retry_after = parse_retry_after(error.resp.get('retry-after'))
+    return RetryableError(f"Google {operacion}: {error}", retry_after=retry_after)
+
+# --- Enfriamiento por calendario tras errores de cuota ---
+# Google limita las escrituras por calendario: tras un error de cuota no se vuelve a
+# escribir en ese calendario hasta que pase el backoff, sin frenar a los demás
+
+_cooldowns = {}  # {calendar_id: timestamp hasta el que no se escribe}
+_errores_cuota_seguidos = {}  # {calendar_id: errores de cuota consecutivos}
+_cooldowns_lock = threading.Lock()
+
+def registrar_error_cuota(calendar_id, error=None):
+    """
+    Pone un calendario en enfriamiento tras un error de cuota (backoff exponencial con jitter).
+    
+    Returns:
+        float: Segundos de enfriamiento
+    """
+    retry_after = None
+    if isinstance(error, HttpError):
+        retry_after = parse_retry_after(error.resp.get('retry-after'))
+    with _cooldowns_lock:
+        intentos = _errores_cuota_seguidos.get(calendar_id, 0)
+        _errores_cuota_seguidos[calendar_id] = intentos + 1
+        espera = calcular_backoff(intentos, retry_after=retry_after)
+        _cooldowns[calendar_id] = max(_cooldowns.get(calendar_id, 0), time.time() + espera)
+    THROTTLES.inc('google', 'quota_cooldown')
+    logger.warning("Calendario %s... en enfriamiento %.1fs por cuota", calendar_id[:20], espera)
+    return espera
+
+def registrar_exito_calendario(calendar_id):
+    """Una escritura correcta reinicia el backoff de cuota del calendario."""
+    with _cooldowns_lock:
+        _errores_cuota_seguidos.pop(calendar_id, None)
+
+def segundos_enfriamiento(calendar_id):
+    """Segundos que faltan para poder escribir en un calendario (0 si no está enfriándose)."""
+    with _cooldowns_lock:
+        return max(0.0, _cooldowns.get(calendar_id, 0) - time.time())
+
+def _esperar_enfriamiento(calendar_id, defer_retries, operacion):
+    """Espera a que termine el enfriamiento del calendario o, en modo diferido, lo delega."""
+    espera = segundos_enfriamiento(calendar_id)
+    if not espera:
+        return
+    THROTTLES.inc('google', 'cooldown_wait')
+    if defer_retries:
+        raise RetryableError(f"Google {operacion}: calendario en enfriamiento por cuota", retry_after=espera)
+    time.sleep(espera)
+
+def _gestionar_error_escritura(error, calendar_id, method, attempt, max_retries, defer_retries, operacion):
+    """
+    Aplica la política de reintento a un error de escritura.
+    
+    Returns:
+        bool: True si hay que reintentar (tras la espera ya hecha aquí)
+        
+    Raises:
+        RetryableError: En modo diferido, si el error es transitorio
+    """
+    clase = clasificar_error_google(error)
+    if clase == ERROR_CUOTA:
+        espera = registrar_error_cuota(calendar_id, error)
+        if defer_retries:
+            raise RetryableError(f"Google {operacion}: {error}", retry_after=espera)
+    elif defer_retries and es_error_reintentable(error, method):
+        raise _como_error_reintentable(error, operacion)
+    
+    if attempt >= max_retries - 1 or not es_error_reintentable(error, method):
+        if clase in (ERROR_SERVIDOR, ERROR_RED) and method == 'insert':
+            logger.warning("No se reintenta: el insert pudo aplicarse y se duplicaría el evento")
+        return False
+    
+    RETRIES.inc('google', RESULTADO_METRICA[clase])
+    if clase != ERROR_CUOTA:
+        espera = calcular_backoff(attempt)
+        logger.info("Reintentando en %.1f segundos...", espera)
+        time.sleep(espera)
+    else:
+        _esperar_enfriamiento(calendar_id, False, operacion)
+    return True
+
+def create_google_event(service, calendar_id, event_body, extended_properties=None, defer_retries=False):
     """
     Crea un nuevo evento en un calendario de Google con manejo robusto de errores.
     
@@ -98,9 +331,11 @@ def create_google_event(service, calendar_id, event_body, extended_properties=No
         calendar_id: ID del calendario donde crear el evento
         event_body: Diccionario con el cuerpo del evento (summary, description, start, end, etc.)
         extended_properties: Propiedades extendidas opcionales para el evento
+        defer_retries: Si es True no se reintenta en este hilo: los errores transitorios
+            se lanzan como RetryableError para el planificador de reintentos
     """
     if not service:
-        print("  ❌ Servicio de Google Calendar no disponible")
+        logger.error("Servicio de Google Calendar no disponible")
         return None
         
     # Crear una copia del event_body para no modificar el original
@@ -110,37 +345,108 @@ def create_google_event(service, calendar_id, event_body, extended_properties=No
     if extended_properties:
         event['extendedProperties'] = extended_properties
 
-    # Reintentos para manejar errores SSL
-    max_retries = 3
+    # Reintentos según la clase de error (en modo diferido, un único intento)
+    max_retries = 1 if defer_retries else 3
     for attempt in range(max_retries):
+        # Fuera del try: en modo diferido el enfriamiento se propaga como RetryableError
+        _esperar_enfriamiento(calendar_id, defer_retries, "crear evento")
         try:
             event_name = event.get('summary', 'Sin título')
-            print(f"  -> Creando evento en Google Calendar: '{event_name}' (intento {attempt + 1}/{max_retries})")
+            logger.debug("Creando evento en Google Calendar: '%s' (intento %s/%s)", event_name, attempt + 1, max_retries)
             
             # Configurar timeout más largo para evitar errores SSL
-            request = service.events().insert(calendarId=calendar_id, body=event)
+            request = service.events().insert(
+                calendarId=calendar_id, body=event, fields=CAMPOS_POR_OPERACION['escritura']
+            )
             created_event = request.execute()
             
-            print(f"  ✅ ¡Evento creado! ID: {created_event.get('id')}")
+            logger.info("¡Evento creado! ID: %s", created_event.get('id'))
+            registrar_exito_calendario(calendar_id)
             return created_event.get('id')
-        except HttpError as error:
-            print(f"  ❌ Error HTTP al crear evento: {error}")
-            if attempt < max_retries - 1:
-                print(f"  🔄 Reintentando en 2 segundos...")
-                time.sleep(2)
-                continue
-            return None
-        except Exception as e:
-            print(f"  ❌ Error inesperado al crear evento: {e}")
-            if attempt < max_retries - 1:
-                print(f"  🔄 Reintentando en 2 segundos...")
-                time.sleep(2)
+        except Exception as error:
+            logger.error("Error al crear evento (%s): %s", clasificar_error_google(error), error)
+            if _gestionar_error_escritura(
+                error, calendar_id, 'insert', attempt, max_retries, defer_retries, "crear evento"
+            ):
                 continue
             return None
     
     return None
 
-def update_google_event(service, calendar_id, event_id, event_body):
+# Propiedades privadas que cambian en cada render sin que cambie el evento
+PROPIEDADES_VOLATILES = ('sync_version',)
+
+def _cuerpo_canonico(event_body):
+    """Devuelve el cuerpo sin las propiedades volátiles, para comparar renders."""
+    cuerpo = dict(event_body)
+    extended = cuerpo.get('extendedProperties')
+    if extended and extended.get('private'):
+        private = {k: v for k, v in extended['private'].items() if k not in PROPIEDADES_VOLATILES}
+        cuerpo['extendedProperties'] = dict(extended, private=private)
+    return cuerpo
+
+def fingerprint_evento(event_body):
+    """
+    Calcula la huella de un cuerpo de evento renderizado.
+    
+    Dos renders con la misma huella producen el mismo evento en Google,
+    así que la segunda escritura se puede omitir.
+    """
+    canonico = json.dumps(_cuerpo_canonico(event_body), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+def _diferencia_anidada(anterior, nuevo):
+    """
+    Parche de merge entre dos diccionarios: claves nuevas o cambiadas, y None para las que desaparecen.
+    
+    events.patch fusiona los objetos anidados con los que ya tiene el evento, así que
+    una clave que no se envía se conserva: para quitarla hay que mandarla a None.
+    """
+    parche = {}
+    for clave, valor in nuevo.items():
+        previo = anterior.get(clave)
+        if previo == valor:
+            continue
+        if isinstance(previo, dict) and isinstance(valor, dict):
+            parche[clave] = _diferencia_anidada(previo, valor)
+        else:
+            parche[clave] = valor
+    for clave in anterior:
+        if clave not in nuevo:
+            parche[clave] = None
+    return parche
+
+def calcular_parche_evento(cuerpo_anterior, cuerpo_nuevo):
+    """
+    Calcula los campos que cambian entre dos cuerpos de evento.
+    
+    Las propiedades volátiles (ver PROPIEDADES_VOLATILES) no cuentan como cambio.
+    Dentro de los objetos anidados (start, end, extendedProperties...) solo van las
+    claves cambiadas, y las que desaparecen van a None: así un paso de día completo
+    ('date') a hora ('dateTime', 'timeZone') no deja la clave anterior en el evento.
+    
+    Args:
+        cuerpo_anterior: Último cuerpo escrito en Google para ese evento
+        cuerpo_nuevo: Cuerpo recién generado
+        
+    Returns:
+        dict: Cuerpo para events.patch con solo los campos cambiados
+            (los campos que desaparecen se envían como None para borrarlos)
+    """
+    anterior = _cuerpo_canonico(cuerpo_anterior)
+    nuevo = _cuerpo_canonico(cuerpo_nuevo)
+    parche = {}
+    for campo in list(nuevo) + [campo for campo in anterior if campo not in nuevo]:
+        if anterior.get(campo) == nuevo.get(campo):
+            continue
+        previo, valor = cuerpo_anterior.get(campo), cuerpo_nuevo.get(campo)
+        if isinstance(previo, dict) and isinstance(valor, dict):
+            parche[campo] = _diferencia_anidada(previo, valor)
+        else:
+            parche[campo] = valor
+    return parche
+
+def update_google_event(service, calendar_id, event_id, event_body, defer_retries=False, previous_body=None):
     """
     Actualiza un evento existente en Google Calendar con manejo robusto de errores.
     
@@ -149,45 +455,252 @@ def update_google_event(service, calendar_id, event_id, event_body):
         calendar_id: ID del calendario donde actualizar el evento
         event_id: ID del evento a actualizar
         event_body: Diccionario con el cuerpo del evento (summary, description, start, end, etc.)
+        defer_retries: Si es True no se reintenta en este hilo: los errores transitorios
+            se lanzan como RetryableError para el planificador de reintentos
+        previous_body: Último cuerpo escrito para este evento; si se indica, solo se envían
+            los campos cambiados con events.patch en lugar del cuerpo completo
     """
     if not service:
-        print("  ❌ Servicio de Google Calendar no disponible")
+        logger.error("Servicio de Google Calendar no disponible")
         return None
+    
+    parche = calcular_parche_evento(previous_body, event_body) if previous_body else None
         
-    # Reintentos para manejar errores SSL
-    max_retries = 3
+    # Reintentos según la clase de error (en modo diferido, un único intento)
+    max_retries = 1 if defer_retries else 3
     for attempt in range(max_retries):
+        _esperar_enfriamiento(calendar_id, defer_retries, "actualizar evento")
         try:
             event_name = event_body.get('summary', 'Sin título')
-            print(f"  -> Actualizando evento en Google Calendar: '{event_name}' (ID: {event_id}) (intento {attempt + 1}/{max_retries})")
+            logger.debug("Actualizando evento en Google Calendar: '%s' (ID: %s) (intento %s/%s)", event_name, event_id, attempt + 1, max_retries)
             
             # Configurar timeout más largo para evitar errores SSL
-            request = service.events().update(
-                calendarId=calendar_id, 
-                eventId=event_id, 
-                body=event_body
-            )
+            if parche is not None:
+                request = service.events().patch(
+                    calendarId=calendar_id,
+                    eventId=event_id,
+                    body=parche,
+                    fields=CAMPOS_POR_OPERACION['escritura']
+                )
+            else:
+                request = service.events().update(
+                    calendarId=calendar_id, 
+                    eventId=event_id, 
+                    body=event_body,
+                    fields=CAMPOS_POR_OPERACION['escritura']
+                )
             updated_event = request.execute()
             
-            print(f"  ✅ ¡Evento actualizado! ID: {updated_event.get('id')}")
+            logger.info("¡Evento actualizado! ID: %s", updated_event.get('id'))
+            registrar_exito_calendario(calendar_id)
             return updated_event.get('id')
-        except HttpError as error:
-            print(f"  ❌ Error HTTP al actualizar evento: {error}")
-            if attempt < max_retries - 1:
-                print(f"  🔄 Reintentando en 2 segundos...")
-                time.sleep(2)
-                continue
-            return None
-        except Exception as e:
-            print(f"  ❌ Error inesperado al actualizar evento: {e}")
-            if attempt < max_retries - 1:
-                print(f"  🔄 Reintentando en 2 segundos...")
-                time.sleep(2)
+        except Exception as error:
+            logger.error("Error al actualizar evento (%s): %s", clasificar_error_google(error), error)
+            if _gestionar_error_escritura(
+                error, calendar_id, 'update', attempt, max_retries, defer_retries, "actualizar evento"
+            ):
                 continue
             return None
     
     return None
 
+# Máximo de sub-peticiones que admite un batch de Google Calendar
+BATCH_MAX_SIZE = 50
+
+def _construir_peticion_batch(service, operation):
+    """
+    Construye la petición de la API para una operación de batch.
+    
+    Si la operación trae 'etag', la escritura es condicional (If-Match): Google
+    responde 412 si el evento cambió desde nuestra última escritura. La respuesta
+    se limita a 'fields' (por defecto, el perfil 'escritura').
+    """
+    method = operation['method']
+    calendar_id = operation['calendar_id']
+    fields = operation.get('fields', CAMPOS_POR_OPERACION['escritura'])
+    events = service.events()
+    if method == 'insert':
+        request = events.insert(calendarId=calendar_id, body=operation['body'], fields=fields)
+    elif method == 'update':
+        request = events.update(
+            calendarId=calendar_id, eventId=operation['event_id'], body=operation['body'], fields=fields
+        )
+    elif method == 'patch':
+        request = events.patch(
+            calendarId=calendar_id, eventId=operation['event_id'], body=operation['body'], fields=fields
+        )
+    elif method == 'delete':
+        request = events.delete(calendarId=calendar_id, eventId=operation['event_id'])
+    else:
+        raise ValueError(f"Operación de batch no soportada: {method}")
+    
+    if operation.get('etag') and method != 'insert':
+        request.headers['If-Match'] = operation['etag']
+    return request
+
+def es_conflicto_etag(error):
+    """True si una escritura condicional falló porque el evento cambió en Google (412)."""
+    return isinstance(error, HttpError) and error.resp.status == 412
+
+def get_event_if_changed(service, calendar_id, event_id, etag=None, fields=None):
+    """
+    Lee un evento de forma condicional (If-None-Match).
+    
+    Args:
+        service: Objeto de servicio de Google Calendar
+        calendar_id: ID del calendario
+        event_id: ID del evento
+        etag: ETag conocido del evento; si no ha cambiado, Google responde 304 sin cuerpo
+        fields: Máscara de campos opcional para la respuesta
+        
+    Returns:
+        tuple: (evento, modificado). Con 304 devuelve (None, False).
+        
+    Raises:
+        HttpError: Errores distintos de 304 (p. ej. 404 si el evento ya no existe)
+    """
+    kwargs = {'calendarId': calendar_id, 'eventId': event_id}
+    if fields:
+        kwargs['fields'] = fields
+    request = service.events().get(**kwargs)
+    if etag:
+        request.headers['If-None-Match'] = etag
+    try:
+        return request.execute(), True
+    except HttpError as error:
+        if error.resp.status == 304:
+            return None, False
+        raise
+
+def execute_event_batch(service, operations, defer_retries=False, max_part_retries=2):
+    """
+    Ejecuta varias operaciones de eventos (en uno o varios calendarios) en un único
+    round trip HTTP usando el endpoint batch de la API de Google Calendar.
+    
+    Cada sub-respuesta se asocia a su operación mediante 'key'. Las partes que fallan
+    de forma transitoria (rate limit, 5xx) se reintentan en un nuevo batch solo con
+    ellas; en modo diferido no se reintenta en este hilo y el llamador decide.
+    
+    Args:
+        service: Objeto de servicio de Google Calendar
+        operations: Lista de diccionarios con:
+            - key: Identificador único de la operación (p. ej. el calendar_id)
+            - method: 'insert', 'update', 'patch' o 'delete'
+            - calendar_id: Calendario destino
+            - event_id: Evento destino (update, patch y delete)
+            - body: Cuerpo del evento (insert, update y patch)
+        defer_retries: Si es True, las partes transitorias no se reintentan aquí
+        max_part_retries: Rondas extra de reintento para las partes transitorias
+    
+    Returns:
+        dict: {key: {'ok': bool, 'response': dict o None, 'error': excepción o None,
+                     'retryable': bool, 'clase': clase de error (ver clasificar_error_google) o None}}
+        'retryable' es False para los inserts sin ID propio que fallan con 5xx/red: pueden haberse aplicado
+    """
+    results = {}
+    if not operations:
+        return results
+    if not service:
+        logger.error("Servicio de Google Calendar no disponible")
+        return {
+            op['key']: {'ok': False, 'response': None, 'error': None, 'retryable': False, 'clase': None}
+            for op in operations
+        }
+    
+    pending = list(operations)
+    rounds = 1 if defer_retries else 1 + max_part_retries
+    
+    for attempt in range(rounds):
+        round_results = {}
+        
+        def _callback(request_id, response, exception):
+            round_results[request_id] = (response, exception)
+        
+        # Calendarios en enfriamiento por cuota: en modo diferido no se envían; si no, se espera
+        enviables = []
+        for operation in pending:
+            espera = segundos_enfriamiento(operation['calendar_id'])
+            if espera and defer_retries:
+                round_results[operation['key']] = (None, RetryableError(
+                    f"Calendario {operation['calendar_id']} en enfriamiento por cuota", retry_after=espera
+                ))
+            else:
+                enviables.append(operation)
+        if not defer_retries:
+            espera = max((segundos_enfriamiento(op['calendar_id']) for op in enviables), default=0)
+            if espera:
+                THROTTLES.inc('google', 'cooldown_wait')
+                logger.info("Esperando %.1fs de enfriamiento por cuota...", espera)
+                time.sleep(espera)
+        
+        # Google limita el tamaño del batch: trocear si hace falta
+        for start in range(0, len(enviables), BATCH_MAX_SIZE):
+            chunk = enviables[start:start + BATCH_MAX_SIZE]
+            batch = service.new_batch_http_request(callback=_callback)
+            for operation in chunk:
+                batch.add(_construir_peticion_batch(service, operation), request_id=operation['key'])
+            
+            logger.debug("Batch de %s operaciones en Google Calendar (intento %s/%s)", len(chunk), attempt + 1, rounds)
+            try:
+                batch.execute()
+            except Exception as e:
+                # Fallo del batch completo (red, SSL...): todas sus partes fallan igual
+                for operation in chunk:
+                    round_results[operation['key']] = (None, e)
+        
+        retry_ops = []
+        retry_after = None
+        for operation in pending:
+            response, error = round_results.get(operation['key'], (None, None))
+            GOOGLE_BATCH_PARTS.inc(
+                operation['method'],
+                'ok' if error is None else 'cooldown' if isinstance(error, RetryableError)
+                else RESULTADO_METRICA[clasificar_error_google(error)]
+            )
+            if error is None:
+                registrar_exito_calendario(operation['calendar_id'])
+                results[operation['key']] = {
+                    'ok': True, 'response': response, 'error': None, 'retryable': False, 'clase': None
+                }
+                continue
+            
+            if isinstance(error, RetryableError):
+                # No se envió por el enfriamiento del calendario
+                results[operation['key']] = {
+                    'ok': False, 'response': None, 'error': error, 'retryable': True, 'clase': ERROR_CUOTA
+                }
+                continue
+            
+            clase = clasificar_error_google(error)
+            if clase == ERROR_CUOTA:
+                registrar_error_cuota(operation['calendar_id'], error)
+            retryable = es_error_reintentable(
+                error, operation['method'], id_propio=bool((operation.get('body') or {}).get('id'))
+            )
+            results[operation['key']] = {
+                'ok': False, 'response': None, 'error': error, 'retryable': retryable, 'clase': clase
+            }
+            if retryable:
+                retry_ops.append(operation)
+                if isinstance(error, HttpError):
+                    retry_after = parse_retry_after(error.resp.get('retry-after')) or retry_after
+            else:
+                logger.error("Error en %s (%s...) [%s]: %s", operation['method'], operation['calendar_id'][:20], clase, error)
+        
+        if not retry_ops or attempt == rounds - 1:
+            break
+        
+        # Las partes de cuota esperan además al enfriamiento de su calendario al inicio de la ronda
+        delay = calcular_backoff(attempt, retry_after=retry_after)
+        RETRIES.inc('google_batch', 'transient', amount=len(retry_ops))
+        logger.info("Reintentando %s partes del batch en %.1fs...", len(retry_ops), delay)
+        time.sleep(delay)
+        pending = retry_ops
+    
+    ok = sum(1 for r in results.values() if r['ok'])
+    logger.debug("Batch completado: %s/%s operaciones exitosas", ok, len(operations))
+    return results
+
 def update_google_event_by_id(service, calendar_id, event_id, event_body, extended_properties=None):
     """
     Actualiza un evento específico en Google Calendar por su ID.
@@ -208,16 +721,17 @@ def update_google_event_by_id(service, calendar_id, event_id, event_body, extend
 
     try:
         event_name = event_body.get('summary', 'Sin título')
-        print(f"  -> Actualizando evento en Google Calendar: '{event_name}' (ID: {event_id})")
+        logger.debug("Actualizando evento en Google Calendar: '%s' (ID: %s)", event_name, event_id)
         updated_event = service.events().update(
             calendarId=calendar_id, 
             eventId=event_id, 
-            body=event
+            body=event,
+            fields=CAMPOS_POR_OPERACION['escritura']
         ).execute()
-        print(f"  ✅ ¡Evento actualizado! ID: {updated_event.get('id')}")
+        logger.info("¡Evento actualizado! ID: %s", updated_event.get('id'))
         return updated_event.get('id')
     except HttpError as error:
-        print(f"  ❌ Error al actualizar evento en Google Calendar: {error}")
+        logger.error("Error al actualizar evento en Google Calendar: %s", error)
         return None
 
 def find_event_copy_by_master_id(service, calendar_id, master_event_id):
@@ -233,28 +747,61 @@ def find_event_copy_by_master_id(service, calendar_id, master_event_id):
         dict: El evento copia encontrado, o None si no se encuentra
     """
     try:
-        print(f"  -> Buscando evento copia para master_id: {master_event_id} en calendario {calendar_id}")
+        logger.debug("Buscando evento copia para master_id: %s en calendario %s", master_event_id, calendar_id)
         
         # Buscar eventos con la propiedad extendida específica
         response = service.events().list(
             calendarId=calendar_id, 
-            privateExtendedProperty=f"master_event_id={master_event_id}"
+            privateExtendedProperty=f"master_event_id={master_event_id}",
+            fields=CAMPOS_POR_OPERACION['buscar_copia']
         ).execute()
         
         items = response.get('items', [])
         
         if items:
             found_event = items[0]
-            print(f"  ✅ Evento copia encontrado: {found_event.get('summary', 'Sin título')} (ID: {found_event.get('id')})")
+            logger.info("Evento copia encontrado: %s (ID: %s)", found_event.get('summary', 'Sin título'), found_event.get('id'))
             return found_event
         else:
-            print(f"  ℹ️  No se encontró evento copia para master_id: {master_event_id}")
+            logger.info("No se encontró evento copia para master_id: %s", master_event_id)
             return None
             
     except HttpError as error:
-        print(f"  ❌ Error al buscar evento copia: {error}")
+        logger.error("Error al buscar evento copia: %s", error)
         return None
 
+def find_event_by_monday_item_id(service, calendar_id, monday_item_id):
+    """
+    Busca en el servidor el evento de un item de Monday en un calendario.
+    
+    Usa la propiedad extendida privada `monday_item_id`, así que no depende de
+    cuántos eventos tenga el calendario. Solo se usa cuando el índice local
+    no tiene entrada para el item.
+    
+    Args:
+        service: Objeto de servicio de Google Calendar
+        calendar_id: ID del calendario donde buscar
+        monday_item_id: ID del item de Monday.com
+        
+    Returns:
+        dict: El evento encontrado, o None si no existe
+        
+    Raises:
+        HttpError: Si la búsqueda falla (no se puede concluir que el evento no exista)
+    """
+    response = service.events().list(
+        calendarId=calendar_id,
+        privateExtendedProperty=f"monday_item_id={monday_item_id}",
+        showDeleted=False,
+        maxResults=5,
+        fields=CAMPOS_POR_OPERACION['buscar_por_item']
+    ).execute()
+    
+    items = response.get('items', [])
+    if len(items) > 1:
+        logger.warning("%s eventos con monday_item_id=%s en %s, se usa el primero", len(items), monday_item_id, calendar_id)
+    return items[0] if items else None
+
 def delete_event_by_id(service, calendar_id, event_id):
     """
     Elimina un evento específico de un calendario de Google.
@@ -268,18 +815,18 @@ def delete_event_by_id(service, calendar_id, event_id):
         bool: True si el evento fue eliminado exitosamente, False si hubo error
     """
     try:
-        print(f"  -> Eliminando evento {event_id} del calendario {calendar_id}")
+        logger.debug("Eliminando evento %s del calendario %s", event_id, calendar_id)
         
         service.events().delete(
             calendarId=calendar_id, 
             eventId=event_id
         ).execute()
         
-        print(f"  ✅ Evento {event_id} eliminado exitosamente")
+        logger.info("Evento %s eliminado exitosamente", event_id)
         return True
         
     except HttpError as error:
-        print(f"  ❌ Error al eliminar evento {event_id}: {error}")
+        logger.error("Error al eliminar evento %s: %s", event_id, error)
         return False
 
 def get_recently_updated_events(service, calendar_id, minutes_ago=5):
@@ -295,18 +842,19 @@ def get_recently_updated_events(service, calendar_id, minutes_ago=5):
     try:
         time_min = datetime.utcnow() - timedelta(minutes=minutes_ago)
         time_min_iso = time_min.isoformat() + 'Z'
-        print(f"  -> Buscando eventos actualizados desde: {time_min_iso}")
+        logger.debug("Buscando eventos actualizados desde: %s", time_min_iso)
         response = service.events().list(
             calendarId=calendar_id,
-            timeMin=time_min_iso,
+            updatedMin=time_min_iso,
             showDeleted=True,
-            singleEvents=True
+            singleEvents=True,
+            fields=CAMPOS_POR_OPERACION['recientes']
         ).execute()
         events = response.get('items', [])
-        print(f"  ✅ Encontrados {len(events)} eventos actualizados recientemente")
+        logger.info("Encontrados %s eventos actualizados recientemente", len(events))
         return events
     except HttpError as error:
-        print(f"  ❌ Error al obtener eventos actualizados: {error}")
+        logger.error("Error al obtener eventos actualizados: %s", error)
         return []
 
 # get_incremental_sync_events REMOVED for unidirectional sync
@@ -335,13 +883,13 @@ def create_and_share_calendar(service, filmmaker_name, filmmaker_email):
         }
         
         # Crear el calendario
-        print(f"  -> Creando calendario para {filmmaker_name}...")
-        created_calendar = service.calendars().insert(body=calendar_body).execute()
+        logger.debug("Creando calendario para %s...", filmmaker_name)
+        created_calendar = service.calendars().insert(body=calendar_body, fields='id').execute()
         
         # Obtener el ID del calendario recién creado
         new_calendar_id = created_calendar.get('id')
         
-        print(f"  ✅ Calendario creado para {filmmaker_name}.")
+        logger.info("Calendario creado para %s.", filmmaker_name)
         
         # Definir la regla de compartición (ACL)
         rule = {
@@ -353,15 +901,15 @@ def create_and_share_calendar(service, filmmaker_name, filmmaker_email):
         }
         
         # Aplicar la regla de compartición
-        print(f"  -> Compartiendo calendario con {filmmaker_email}...")
-        service.acl().insert(calendarId=new_calendar_id, body=rule).execute()
+        logger.debug("Compartiendo calendario con %s...", filmmaker_email)
+        service.acl().insert(calendarId=new_calendar_id, body=rule, fields='id').execute()
         
-        print(f"  ↪️  Compartido con {filmmaker_email}.")
+        logger.info("Compartido con %s.", filmmaker_email)
         
         return new_calendar_id
         
     except HttpError as error:
-        print(f"  ❌ Error al crear/compartir calendario para {filmmaker_name}: {error}")
+        logger.error("Error al crear/compartir calendario para %s: %s", filmmaker_name, error)
         return None
 
 def sync_event_to_multiple_calendars_optimized(service, master_event, target_calendars, master_calendar_id):
@@ -381,7 +929,7 @@ def sync_event_to_multiple_calendars_optimized(service, master_event, target_cal
     import concurrent.futures
     import threading
     
-    print(f"⚡ SINCRONIZACIÓN INSTANTÁNEA a {len(target_calendars)} calendarios")
+    logger.info("Sincronización instantánea a %s calendarios", len(target_calendars))
     
     results = {}
     master_event_id = master_event.get('id')
@@ -390,7 +938,7 @@ def sync_event_to_multiple_calendars_optimized(service, master_event, target_cal
     def sync_to_single_calendar(calendar_id):
         """Sincronizar a un solo calendario - función interna para threading"""
         try:
-            print(f"  🔄 Sincronizando '{event_summary}' → {calendar_id[:20]}...")
+            logger.info("Sincronizando '%s' → %s...", event_summary, calendar_id[:20])
             
             # Buscar si ya existe una copia del evento
             existing_copy = find_event_copy_by_master_id(service, calendar_id, master_event_id)
@@ -418,19 +966,25 @@ def sync_event_to_multiple_calendars_optimized(service, master_event, target_cal
                     service, calendar_id, copy_id, event_body
                 )
                 success = updated_id is not None
-                print(f"    ✅ Actualizado en {calendar_id[:20]}" if success else f"    ❌ Error actualizando en {calendar_id[:20]}")
+                if success:
+                    logger.info("Actualizado en %s", calendar_id[:20])
+                else:
+                    logger.error("Error actualizando en %s", calendar_id[:20])
             else:
                 # Crear nuevo evento
                 created_id = create_google_event(
                     service, calendar_id, event_body
                 )
                 success = created_id is not None
-                print(f"    ✅ Creado en {calendar_id[:20]}" if success else f"    ❌ Error creando en {calendar_id[:20]}")
+                if success:
+                    logger.info("Creado en %s", calendar_id[:20])
+                else:
+                    logger.error("Error creando en %s", calendar_id[:20])
             
             return calendar_id, success
             
         except Exception as e:
-            print(f"    ❌ Error sincronizando a {calendar_id[:20]}: {e}")
+            logger.error("Error sincronizando a %s: %s", calendar_id[:20], e)
             return calendar_id, False
     
     # Ejecutar sincronización en paralelo para máxima velocidad
@@ -447,6 +1001,6 @@ def sync_event_to_multiple_calendars_optimized(service, master_event, target_cal
             results[calendar_id] = success
     
     successful_syncs = sum(1 for success in results.values() if success)
-    print(f"⚡ SINCRONIZACIÓN INSTANTÁNEA COMPLETADA: {successful_syncs}/{len(target_calendars)} exitosas")
+    logger.info("Sincronización instantánea completada: %s/%s exitosas", successful_syncs, len(target_calendars))
     
     return results
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+Google Service Pool - Transporte HTTP thread-safe para Google Calendar
+======================================================================
+
+`httplib2.Http` no es thread-safe: compartir un único servicio de Google entre
+los hilos de Flask, los workers de reintentos o un ThreadPoolExecutor puede
+mezclar respuestas entre conexiones. Este módulo ofrece un transporte que el
+servicio usa en lugar de un `Http` único:
+
+- Un pool de ranuras `AuthorizedHttp`, cada una con su propio `httplib2.Http`
+  (las conexiones keep-alive se reutilizan dentro de cada ranura).
+- Cada petición toma una ranura libre, la usa y la devuelve al pool.
+- Todas las ranuras comparten el mismo objeto de credenciales, que se refresca
+  una sola vez bajo un lock cuando caduca.
+- Las credenciales se cargan en el primer uso (no al arrancar el proceso) y un
+  hilo en segundo plano las refresca poco antes de que caduquen.
+
+El objeto de servicio construido con `build(..., http=PooledAuthorizedHttp(...))`
+puede compartirse entre hilos sin cambios en el código que lo usa.
+"""
+
+import queue
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+
+import config
+from sync_metrics import GOOGLE_REQUESTS, operacion_google, resultado_http
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow() -> datetime:
+    """Hora UTC sin zona, el formato de `Credentials.expiry` en google-auth."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class PooledAuthorizedHttp:
+    """
+    Sustituto de `httplib2.Http` que reparte las peticiones entre un pool de conexiones.
+
+    Implementa la parte de la interfaz de `httplib2.Http` que usa googleapiclient
+    (`request`, `close` y el atributo `credentials`), de modo que se puede pasar a
+    `build()` y a las peticiones batch.
+    """
+
+    def __init__(
+        self,
+        credentials: Any = None,
+        pool_size: int = config.GOOGLE_HTTP_POOL_SIZE,
+        timeout: float = config.GOOGLE_HTTP_TIMEOUT,
+        on_refresh: Optional[Callable[[Any], None]] = None,
+        credentials_loader: Optional[Callable[[], Any]] = None,
+        refresh_margin: float = config.GOOGLE_CREDENTIALS_REFRESH_MARGIN
+    ):
+        """
+        Inicializa el pool (las ranuras y las credenciales se crean bajo demanda).
+
+        Args:
+            credentials: Credenciales de Google compartidas por todas las ranuras
+            pool_size: Número máximo de conexiones simultáneas
+            timeout: Timeout de cada petición HTTP en segundos
+            on_refresh: Función llamada con las credenciales tras refrescarlas (p. ej. para guardarlas)
+            credentials_loader: Función que carga las credenciales en el primer uso, si no se pasan
+            refresh_margin: Segundos antes de la caducidad en que se refrescan en segundo plano
+        """
+        self._credentials = credentials
+        self.credentials_loader = credentials_loader
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.on_refresh = on_refresh
+        self.refresh_margin = refresh_margin
+
+        self._slots: "queue.LifoQueue[google_auth_httplib2.AuthorizedHttp]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+
+    @property
+    def credentials(self) -> Any:
+        """Credenciales compartidas; se cargan con `credentials_loader` la primera vez que se usan."""
+        if self._credentials is None and self.credentials_loader:
+            with self._refresh_lock:
+                if self._credentials is None:
+                    self._credentials = self.credentials_loader()
+                    logger.info("Credenciales de Google cargadas")
+            self._start_background_refresh()
+        return self._credentials
+
+    def _new_slot(self) -> google_auth_httplib2.AuthorizedHttp:
+        """Crea una ranura nueva con su propio transporte httplib2."""
+        return google_auth_httplib2.AuthorizedHttp(
+            self.credentials,
+            http=httplib2.Http(timeout=self.timeout)
+        )
+
+    def _checkout(self) -> google_auth_httplib2.AuthorizedHttp:
+        """Toma una ranura libre; crea una nueva si no se ha llegado al máximo, si no espera."""
+        try:
+            return self._slots.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                return self._new_slot()
+
+        return self._slots.get()
+
+    def _checkin(self, slot: google_auth_httplib2.AuthorizedHttp) -> None:
+        """Devuelve una ranura al pool."""
+        self._slots.put(slot)
+
+    def _necesita_refresco(self, credentials: Any, proactive: bool) -> bool:
+        """True si las credenciales han caducado o, en modo proactivo, caducan dentro del margen."""
+        if not credentials.valid:
+            return True
+        if proactive and credentials.expiry:
+            return (credentials.expiry - _utcnow()).total_seconds() < self.refresh_margin
+        return False
+
+    def _ensure_valid_credentials(self, proactive: bool = False) -> None:
+        """Refresca las credenciales compartidas una sola vez si han caducado (o caducan pronto, si es proactivo)."""
+        credentials = self.credentials
+        if not self._necesita_refresco(credentials, proactive):
+            return
+        with self._refresh_lock:
+            # Otro hilo puede haberlas refrescado mientras esperábamos el lock
+            if not self._necesita_refresco(credentials, proactive):
+                return
+            credentials.refresh(Request())
+            logger.info("Credenciales de Google refrescadas")
+            if self.on_refresh:
+                try:
+                    self.on_refresh(credentials)
+                except Exception as e:
+                    logger.warning("No se pudieron guardar las credenciales refrescadas: %s", e)
+
+    def _start_background_refresh(self) -> None:
+        """Arranca (una sola vez) el hilo que refresca las credenciales antes de que caduquen."""
+        with self._lock:
+            if self._refresh_thread is not None or self._credentials is None:
+                return
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_loop,
+                name='google-credentials-refresh',
+                daemon=True
+            )
+            self._refresh_thread.start()
+
+    def _refresh_loop(self) -> None:
+        """Duerme hasta `refresh_margin` segundos antes de la caducidad y refresca."""
+        while True:
+            expiry = self._credentials.expiry
+            if expiry:
+                espera = (expiry - _utcnow()).total_seconds() - self.refresh_margin
+            else:
+                espera = self.refresh_margin
+            # Tras un fallo (espera negativa) se reintenta cada 30 segundos
+            time.sleep(max(30, espera))
+            try:
+                self._ensure_valid_credentials(proactive=True)
+            except Exception as e:
+                logger.warning("Error refrescando credenciales de Google en segundo plano: %s", e)
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None, **kwargs):
+        """Ejecuta una petición HTTP usando una ranura del pool (misma firma que httplib2.Http.request)."""
+        self._ensure_valid_credentials()
+        slot = self._checkout()
+        operacion = operacion_google(uri, method)
+        try:
+            response, content = slot.request(
+                uri,
+                method=method,
+                body=body,
+                headers=headers,
+                redirections=redirections,
+                connection_type=connection_type,
+                **kwargs
+            )
+            GOOGLE_REQUESTS.inc(operacion, resultado_http(response.status))
+            return response, content
+        except Exception:
+            GOOGLE_REQUESTS.inc(operacion, 'network_error')
+            # Una conexión que falló a medias no se reutiliza
+            slot.close()
+            raise
+        finally:
+            self._checkin(slot)
+
+    def close(self) -> None:
+        """Cierra las conexiones de las ranuras libres."""
+        while True:
+            try:
+                slot = self._slots.get_nowait()
+            except queue.Empty:
+                break
+            slot.close()
+            with self._lock:
+                self._created -= 1
+
+    def get_statistics(self) -> dict:
+        """Obtiene estadísticas del pool."""
+        return {
+            'pool_size': self.pool_size,
+            'slots_created': self._created,
+            'slots_idle': self._slots.qsize()
+        }
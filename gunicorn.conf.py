@@ -0,0 +1,56 @@
+"""
+Configuración de gunicorn para el servidor de sincronización en producción.
+
+    gunicorn -c gunicorn.conf.py
+
+Arranca varios procesos worker (pre-fork) que atienden los webhooks en hilos.
+La aplicación se importa una vez en el proceso maestro (`preload_app`) sin
+crear clientes ni hilos; cada worker crea los suyos después del fork con
+`init_worker()` y calienta la conexión con Google antes de recibir tráfico.
+
+Los workers comparten la cola de trabajo (SQLite) y el índice de eventos.
+El detector de divergencias y los reintentos diferidos corren en uno solo.
+GET /metrics suma los contadores de todos los workers (ver sync_metrics).
+
+Variables de entorno:
+    PORT              Puerto (por defecto config.SERVER_PORT)
+    WEB_CONCURRENCY   Procesos worker (por defecto, uno por núcleo)
+    GUNICORN_THREADS  Hilos por worker para atender peticiones (por defecto 4)
+"""
+
+import multiprocessing
+import os
+
+# Solo SERVER_PORT: gunicorn toma los nombres de este módulo como ajustes (y 'config' es uno de ellos)
+from config import SERVER_PORT
+
+bind = f"0.0.0.0:{os.getenv('PORT', SERVER_PORT)}"
+wsgi_app = 'app:create_app()'
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+accesslog = '-'
+
+
+def on_starting(server):
+    """Descarta las métricas volcadas por los workers de una ejecución anterior."""
+    from sync_metrics import metrics
+    metrics.limpiar_directorio()
+
+
+def post_fork(server, worker):
+    """Inicializa el worker recién creado: clientes propios, workers de la cola y conexiones calientes."""
+    import app
+    app.init_worker(procesos=server.cfg.workers)
+
+
+def worker_exit(server, worker):
+    """Los workers de la cola terminan su trabajo actual; lo pendiente sigue en SQLite."""
+    from work_queue import work_queue
+    from sync_metrics import metrics
+    work_queue.stop()
+    # Los contadores de un worker que termina se siguen sumando en /metrics
+    metrics.guardar()
@@ -0,0 +1,62 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+
+class KeyedLock:
+    """
+    Locks por clave (p. ej. item de Monday) creados bajo demanda.
+
+    Las sincronizaciones de un mismo item se ejecutan de una en una, vengan de
+    donde vengan (workers de la cola, reintentos diferidos, divergencias en
+    Google); las de items distintos siguen en paralelo. Cada lock se libera de
+    memoria cuando nadie lo usa ni lo espera.
+    """
+
+    def __init__(self):
+        """Inicializa el gestor sin locks."""
+        self._lock = threading.Lock()
+        self._entries: Dict[str, list] = {}  # {clave: [RLock, hilos que lo tienen o lo esperan]}
+        self._stats = {'acquisitions': 0, 'contended': 0}
+
+    @contextmanager
+    def hold(self, key: Any) -> Iterator[None]:
+        """
+        Mantiene el lock de una clave durante el bloque `with`.
+
+        Es reentrante: un mismo hilo puede volver a tomar el lock de la clave que ya tiene.
+        """
+        key = str(key)
+        with self._lock:
+            entry = self._entries.setdefault(key, [threading.RLock(), 0])
+            entry[1] += 1
+            self._stats['acquisitions'] += 1
+            if entry[1] > 1:
+                self._stats['contended'] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._entries[key]
+
+    def depth(self, key: Any) -> int:
+        """Hilos que tienen o esperan el lock de una clave."""
+        with self._lock:
+            entry = self._entries.get(str(key))
+            return entry[1] if entry else 0
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Obtiene estadísticas de los locks (claves activas y las que tienen hilos esperando)."""
+        with self._lock:
+            return dict(
+                self._stats,
+                active_keys=len(self._entries),
+                waiting={key: entry[1] - 1 for key, entry in self._entries.items() if entry[1] > 1}
+            )
+
+
+# Instancia global: un lock por item de Monday
+item_locks = KeyedLock()
@@ -19,11 +19,17 @@ Fecha: 2025-08-01
 import requests
 import json
 import time
+import copy
 import logging
 from typing import Dict, List, Optional, Any, Union
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 import threading
+import re
+
+from retry_scheduler import RetryableError, parse_retry_after
+from event_ids import decodificar_event_id
+from sync_metrics import MONDAY_REQUESTS, RETRIES, THROTTLES, operacion_monday, registrar_cache
 
 @dataclass
 class ColumnInfo:
@@ -40,10 +46,19 @@ class ItemInfo:
     column_values: List[Dict] = None
     subitems: List[Dict] = None
 
+class _InFlightRequest:
+    """Petición GraphQL en curso compartida entre hilos (single-flight)"""
+    
+    def __init__(self, generation: int):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.generation = generation  # Generación de lecturas en la que empezó
+
 class MondayAPIHandler:
     """Handler centralizado para Monday.com API con mejores prácticas y caché optimizado"""
     
-    def __init__(self, api_token: str, logger: Optional[logging.Logger] = None):
+    def __init__(self, api_token: str, logger: Optional[logging.Logger] = None, blocking_retries: bool = True):
         self.API_TOKEN = api_token
         self.HEADERS = {
             'Authorization': self.API_TOKEN,
@@ -58,6 +73,10 @@ class MondayAPIHandler:
         self.MAX_RETRIES = 3
         self.BASE_WAIT_TIME = 30
         self.COMPLEXITY_WAIT_TIME = 60
+        self.REQUEST_TIMEOUT = 30  # Segundos por petición HTTP
+        # Con blocking_retries=False los fallos transitorios no duermen en el hilo actual:
+        # se lanza RetryableError para que el llamador lo entregue al planificador de reintentos
+        self.blocking_retries = blocking_retries
         
         # Sistema de caché en memoria para búsquedas frecuentes
         self._cache_lock = threading.RLock()
@@ -68,6 +87,16 @@ class MondayAPIHandler:
         # Límites de optimización
         self.MAX_SCAN_ITEMS = 200  # Máximo items escaneados en búsquedas
         
+        # Single-flight para lecturas concurrentes idénticas (ráfagas de webhooks)
+        # Las lecturas con la misma query y variables comparten una única petición en vuelo
+        self._inflight_lock = threading.Lock()
+        self._inflight_requests = {}  # {clave: _InFlightRequest}
+        self._recent_reads = {}  # {clave: (resultado, timestamp)}
+        self._reads_generation = 0  # Sube con cada mutación: lo leído antes ya no se reutiliza
+        self.READ_COALESCE_WINDOW = 0.5  # Segundos que un resultado sigue siendo reutilizable (0 = desactivado)
+        # Espera máxima a una petición en vuelo ajena; después se lee directamente
+        self.INFLIGHT_WAIT_TIMEOUT = self.REQUEST_TIMEOUT + 5
+        
         # Tipos de columna soportados con sus configuraciones
         self.COLUMN_TYPES = {
             'text': {'api_name': 'text', 'mutation_type': 'simple'},
@@ -89,7 +118,8 @@ class MondayAPIHandler:
     def _setup_default_logger(self) -> logging.Logger:
         """Configurar logger por defecto"""
         logger = logging.getLogger('monday_api_handler')
-        if not logger.handlers:
+        # Si el proceso ya configuró el logging (ver sync_logging), los registros van al logger raíz
+        if not logger.handlers and not logging.getLogger().handlers:
             handler = logging.StreamHandler()
             formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
             handler.setFormatter(formatter)
@@ -108,11 +138,13 @@ class MondayAPIHandler:
                 value, timestamp = cache_dict[key]
                 if self._is_cache_valid(timestamp):
                     self.logger.debug(f"Cache hit para {key}")
+                    registrar_cache('monday_id', True)
                     return value
                 else:
                     # Limpiar entrada expirada
                     del cache_dict[key]
                     self.logger.debug(f"Cache expirado para {key}")
+        registrar_cache('monday_id', False)
         return None
     
     def _update_cache(self, item_id: str, google_event_id: str):
@@ -168,10 +200,95 @@ class MondayAPIHandler:
             if expired_items or expired_google:
                 self.logger.debug(f"Cache limpiado: {len(expired_items)} items, {len(expired_google)} google events")
     
+    def _coalesce_key(self, query: str, variables: Optional[Dict], max_retries: Optional[int] = None) -> Optional[str]:
+        """Clave de single-flight para una lectura, o None si la petición no es coalescible"""
+        if query.lstrip().startswith('mutation'):
+            return None
+        # Las opciones de la petición también cuentan: una lectura sin reintentos no espera a una con muchos
+        return query + '\x00' + json.dumps(variables or {}, sort_keys=True, default=str) + '\x00' + str(max_retries)
+    
+    def _invalidate_recent_reads(self):
+        """
+        Descartar resultados recientes tras una mutación para no servir datos obsoletos.
+        
+        Las lecturas en vuelo terminan, pero no guardan su resultado ni admiten nuevos
+        seguidores: las lecturas que lleguen a partir de ahora salen a la API.
+        """
+        with self._inflight_lock:
+            self._reads_generation += 1
+            self._recent_reads.clear()
+            self._inflight_requests.clear()
+    
     def _make_request(self, query: str, variables: Optional[Dict] = None, max_retries: Optional[int] = None) -> Optional[Dict]:
+        """
+        Realizar petición GraphQL con single-flight para lecturas.
+        
+        Las lecturas concurrentes idénticas (misma query y variables) esperan a la
+        petición que ya está en vuelo y reciben su resultado. Tras completarse, el
+        resultado se reutiliza durante READ_COALESCE_WINDOW segundos. Las mutaciones
+        nunca se coalescen e invalidan los resultados recientes.
+        """
+        key = self._coalesce_key(query, variables, max_retries)
+        if key is None:
+            data = self._execute_request(query, variables, max_retries)
+            self._invalidate_recent_reads()
+            return data
+        
+        with self._inflight_lock:
+            recent = self._recent_reads.get(key)
+            if recent is not None:
+                result, timestamp = recent
+                if (time.time() - timestamp) < self.READ_COALESCE_WINDOW:
+                    self.logger.debug("Lectura servida desde ventana de coalescencia")
+                    registrar_cache('monday_read', True)
+                    return copy.deepcopy(result)
+                del self._recent_reads[key]
+            
+            inflight = self._inflight_requests.get(key)
+            is_leader = inflight is None
+            if is_leader:
+                inflight = _InFlightRequest(self._reads_generation)
+                self._inflight_requests[key] = inflight
+        registrar_cache('monday_read', not is_leader)
+        
+        if not is_leader:
+            # Otra petición idéntica ya está en vuelo: esperar su resultado
+            self.logger.debug("Lectura coalescida con petición en vuelo")
+            if not inflight.done.wait(self.INFLIGHT_WAIT_TIMEOUT):
+                # El líder sigue reintentando o se colgó: no quedarse bloqueado con él
+                self.logger.warning("Petición en vuelo sin respuesta tras %ss, se lee directamente", self.INFLIGHT_WAIT_TIMEOUT)
+                return self._execute_request(query, variables, max_retries)
+            if inflight.error is not None:
+                raise inflight.error
+            return copy.deepcopy(inflight.result)
+        
+        try:
+            inflight.result = self._execute_request(query, variables, max_retries)
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                if self._inflight_requests.get(key) is inflight:
+                    del self._inflight_requests[key]
+                # Una mutación durante la lectura la deja obsoleta: no se reutiliza
+                vigente = inflight.generation == self._reads_generation
+                if vigente and inflight.error is None and inflight.result is not None and self.READ_COALESCE_WINDOW > 0:
+                    now = time.time()
+                    # Purgar resultados caducados para que el diccionario no crezca sin límite
+                    expired = [k for k, (_, ts) in self._recent_reads.items() if (now - ts) >= self.READ_COALESCE_WINDOW]
+                    for k in expired:
+                        del self._recent_reads[k]
+                    self._recent_reads[key] = (copy.deepcopy(inflight.result), now)
+            inflight.done.set()
+        
+        return inflight.result
+    
+    def _execute_request(self, query: str, variables: Optional[Dict] = None, max_retries: Optional[int] = None) -> Optional[Dict]:
         """Realizar petición GraphQL con manejo de errores y reintentos"""
         max_retries = max_retries or self.MAX_RETRIES
         wait_time = self.BASE_WAIT_TIME
+        operacion = operacion_monday(query)
         
         for retry in range(max_retries + 1):
             try:
@@ -179,7 +296,7 @@ class MondayAPIHandler:
                 if variables:
                     payload['variables'] = variables
                 
-                response = requests.post(self.API_URL, json=payload, headers=self.HEADERS, timeout=30)
+                response = requests.post(self.API_URL, json=payload, headers=self.HEADERS, timeout=self.REQUEST_TIMEOUT)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -190,7 +307,15 @@ class MondayAPIHandler:
                         
                         # Manejo específico de ComplexityException
                         if 'ComplexityException' in error_msg:
+                            MONDAY_REQUESTS.inc(operacion, 'complexity')
+                            THROTTLES.inc('monday', 'complexity')
+                            if not self.blocking_retries:
+                                # Monday indica cuándo se recarga el presupuesto ("reset in N seconds")
+                                reset_match = re.search(r'reset in (\d+) seconds?', error_msg)
+                                retry_after = float(reset_match.group(1)) if reset_match else self.COMPLEXITY_WAIT_TIME
+                                raise RetryableError("Monday ComplexityException", retry_after=retry_after)
                             if retry < max_retries:
+                                RETRIES.inc('monday', 'complexity')
                                 self.logger.warning(f"ComplexityException - Esperando {self.COMPLEXITY_WAIT_TIME}s (intento {retry + 1}/{max_retries + 1})")
                                 time.sleep(self.COMPLEXITY_WAIT_TIME)
                                 continue
@@ -199,13 +324,21 @@ class MondayAPIHandler:
                                 return None
                         
                         # Otros errores GraphQL
+                        MONDAY_REQUESTS.inc(operacion, 'graphql_error')
                         self.logger.error(f"Error GraphQL: {error_msg}")
                         return None
                     
+                    MONDAY_REQUESTS.inc(operacion, 'ok')
                     return data
                 
                 elif response.status_code == 429:  # Rate limit
+                    MONDAY_REQUESTS.inc(operacion, 'rate_limited')
+                    THROTTLES.inc('monday', 'rate_limit')
+                    if not self.blocking_retries:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        raise RetryableError("Monday rate limit (HTTP 429)", retry_after=retry_after or wait_time)
                     if retry < max_retries:
+                        RETRIES.inc('monday', 'rate_limit')
                         self.logger.warning(f"Rate limit - Esperando {wait_time}s (intento {retry + 1}/{max_retries + 1})")
                         time.sleep(wait_time)
                         wait_time += 15
@@ -214,19 +347,46 @@ class MondayAPIHandler:
                         self.logger.error("Rate limit - Max reintentos alcanzados")
                         return None
                 
+                elif response.status_code >= 500 and not self.blocking_retries:
+                    MONDAY_REQUESTS.inc(operacion, 'server_error')
+                    raise RetryableError(f"Monday HTTP {response.status_code}",
+                                         retry_after=parse_retry_after(response.headers.get('Retry-After')))
+                
                 else:
+                    MONDAY_REQUESTS.inc(operacion, 'server_error' if response.status_code >= 500 else 'http_error')
                     self.logger.error(f"Error HTTP {response.status_code}: {response.text}")
                     return None
                     
             except requests.exceptions.Timeout:
+                MONDAY_REQUESTS.inc(operacion, 'timeout')
+                if not self.blocking_retries:
+                    raise RetryableError("Timeout en petición a Monday")
                 self.logger.warning(f"Timeout - Reintentando en {wait_time}s (intento {retry + 1}/{max_retries + 1})")
                 if retry < max_retries:
+                    RETRIES.inc('monday', 'timeout')
                     time.sleep(wait_time)
                     wait_time += 10
                     continue
                 return None
+
+            except requests.exceptions.ConnectionError as e:
+                # Conexión rechazada o cortada, DNS...: transitorio igual que un timeout
+                MONDAY_REQUESTS.inc(operacion, 'connection_error')
+                if not self.blocking_retries:
+                    raise RetryableError(f"Error de conexión con Monday: {e}")
+                self.logger.warning(f"Error de conexión - Reintentando en {wait_time}s (intento {retry + 1}/{max_retries + 1})")
+                if retry < max_retries:
+                    RETRIES.inc('monday', 'connection_error')
+                    time.sleep(wait_time)
+                    wait_time += 10
+                    continue
+                return None
+
+            except RetryableError:
+                raise
                 
             except Exception as e:
+                MONDAY_REQUESTS.inc(operacion, 'error')
                 self.logger.error(f"Excepción en petición: {str(e)}")
                 return None
         
@@ -597,8 +757,14 @@ class MondayAPIHandler:
         self.logger.info(f"Obtenidos {len(all_items)} items totales con fragmentos en línea")
         return all_items
     
-    def get_item_by_id(self, board_id: str, item_id: str, column_ids: Optional[List[str]] = None) -> Optional[Dict]:
-        """Obtiene un item específico por su ID"""
+    def get_item_by_id(self, board_id: str, item_id: str, column_ids: Optional[List[str]] = None,
+                       updates_limit: int = 0) -> Optional[Dict]:
+        """
+        Obtiene un item específico por su ID.
+        
+        Con updates_limit > 0 incluye en la misma query las últimas actualizaciones del item
+        (id, created_at, creator_id), que es lo que necesita la detección de automatización.
+        """
         self.logger.info(f"Obteniendo item específico {item_id} del tablero {board_id}")
         
         column_ids = column_ids or []
@@ -633,12 +799,22 @@ class MondayAPIHandler:
                 }
             }'''
         
+        updates_query = ''
+        if updates_limit:
+            updates_query = f'''
+            updates(limit: {int(updates_limit)}) {{
+                id
+                created_at
+                creator_id
+            }}'''
+        
         query = f'''
         query($itemId: [ID!]!) {{
             items(ids: $itemId) {{
                 id
                 name
                 {column_query}
+                {updates_query}
             }}
         }}
         '''
@@ -1138,6 +1314,7 @@ class MondayAPIHandler:
         Búsqueda ultra-optimizada de item_id por Google Event ID.
         
         Estrategia de optimización:
+        0. IDs deterministas (ver event_ids): el item se obtiene del propio ID, sin consultas
         1. Revisar caché primero (TTL: 5 minutos)
         2. Usar items_page_by_column_values (query más eficiente)
         3. Solo como último recurso hacer búsqueda paginada (máximo 200 items)
@@ -1152,7 +1329,12 @@ class MondayAPIHandler:
         """
         # Limpiar Google Event ID
         cleaned_event_id = google_event_id.strip().replace('"', '').replace("'", "")
-        
+
+        # 0. IDS DETERMINISTAS: el item va codificado en el propio ID
+        decodificado = decodificar_event_id(cleaned_event_id)
+        if decodificado and decodificado[0] == str(board_id):
+            return decodificado[1]
+
         # 1. REVISAR CACHÉ PRIMERO
         cached_item_id = self._get_from_cache(self._google_to_item_cache, cleaned_event_id)
         if cached_item_id:
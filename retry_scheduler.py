@@ -0,0 +1,422 @@
+"""
+Retry Scheduler - Reintentos diferidos fuera del hilo de la petición
+====================================================================
+
+Cuando una llamada a Monday.com o Google Calendar falla de forma transitoria
+(rate limit, ComplexityException, timeout, 5xx), el webhook no debe dormir
+dentro del hilo de Flask: Monday agota su timeout y reenvía el webhook,
+multiplicando la carga. En su lugar la operación se entrega a este
+planificador, que la reintenta en hilos propios con backoff exponencial
+con jitter y respetando `Retry-After`.
+
+Los reintentos pendientes se guardan en `config/retry_queue.json` para que
+sobrevivan a un reinicio del servidor. Un trabajo sigue en la tabla (marcado
+'en curso') hasta que su handler termina: si el proceso muere a mitad, se
+vuelve a ejecutar al arrancar (entrega al menos una vez).
+
+La tabla solo la escribe el proceso que ejecuta los reintentos. Con varios
+procesos, los demás entregan sus reintentos a la cola de trabajo SQLite
+(ver `delegar_en`).
+"""
+
+import heapq
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+from sync_metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+
+class RetryableError(Exception):
+    """
+    Error transitorio de un servicio externo que merece un reintento diferido.
+
+    Args:
+        message: Descripción del error
+        retry_after: Segundos que el servicio pidió esperar (cabecera Retry-After), si los indicó
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Interpreta el valor de una cabecera Retry-After.
+
+    Args:
+        value: Segundos ("120") o fecha HTTP ("Wed, 21 Oct 2015 07:28:00 GMT")
+
+    Returns:
+        Segundos a esperar, o None si la cabecera no existe o no es válida
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def calcular_backoff(
+    attempt: int,
+    base_delay: float = config.RETRY_BASE_DELAY_SECONDS,
+    max_delay: float = config.RETRY_MAX_DELAY_SECONDS,
+    retry_after: Optional[float] = None
+) -> float:
+    """
+    Calcula la espera antes del siguiente intento (backoff exponencial con full jitter).
+
+    Args:
+        attempt: Número de intentos ya fallidos (0 para el primer reintento)
+        base_delay: Espera base en segundos
+        max_delay: Tope de la espera exponencial en segundos
+        retry_after: Espera mínima pedida por el servicio, si la hay
+
+    Returns:
+        Segundos a esperar
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    if retry_after is not None:
+        # Nunca antes de lo que pidió el servicio; el jitter evita que todos vuelvan a la vez
+        delay = retry_after + random.uniform(0, base_delay)
+    return delay
+
+
+class RetryScheduler:
+    """
+    Planificador de reintentos diferidos con tabla persistente.
+
+    Un hilo temporizador duerme hasta el siguiente reintento vencido y lo entrega
+    a un pool de workers. Cada operación se identifica por un nombre registrado
+    con `register_handler`, de modo que los trabajos pendientes pueden
+    reconstruirse desde disco tras un reinicio.
+
+    Un handler indica el resultado así:
+    - Devuelve cualquier valor: el trabajo termina (éxito o fallo permanente)
+    - Lanza RetryableError: se reprograma con backoff hasta `max_attempts`
+    """
+
+    def __init__(
+        self,
+        state_file_path: str = config.RETRY_QUEUE_FILE,
+        max_workers: int = config.RETRY_WORKERS,
+        max_attempts: int = config.RETRY_MAX_ATTEMPTS
+    ):
+        """
+        Inicializa el planificador. Los reintentos pendientes se cargan de disco
+        la primera vez que se usa, no al importar el módulo.
+
+        Args:
+            state_file_path: Ruta al archivo JSON de la tabla de reintentos
+            max_workers: Hilos que ejecutan reintentos en paralelo
+            max_attempts: Intentos máximos antes de marcar el trabajo como fallido
+        """
+        self.state_file_path = Path(state_file_path)
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._jobs: Dict[str, Dict[str, Any]] = {}  # {job_id: trabajo}
+        self._failed: List[Dict[str, Any]] = []
+        self._heap: List[tuple] = []  # [(run_at, job_id)]
+        self._condition = threading.Condition(threading.RLock())
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._timer_thread: Optional[threading.Thread] = None
+        self._running = False
+        # Destino de los reintentos en los procesos que no ejecutan este planificador
+        self._delegado: Optional[Callable[[str, Dict[str, Any], float, Optional[str]], Any]] = None
+        self._cargado = False
+
+    def _asegurar_estado(self) -> None:
+        """Crea el directorio de estado y carga la tabla de reintentos la primera vez."""
+        with self._condition:
+            if self._cargado:
+                return
+            self._cargado = True
+            self.state_file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._load_state()
+
+    def _load_state(self) -> None:
+        """Carga la tabla de reintentos desde disco."""
+        if not self.state_file_path.exists():
+            return
+        try:
+            with open(self.state_file_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            logger.warning("Error al cargar tabla de reintentos, se ignora: %s", e)
+            return
+
+        for job in state.get('pending', []):
+            # Un trabajo en curso cuando el proceso murió se vuelve a ejecutar
+            job['in_flight'] = False
+            self._jobs[job['id']] = job
+            heapq.heappush(self._heap, (job['run_at'], job['id']))
+        self._failed = state.get('failed', [])
+
+        if self._jobs:
+            logger.info("Recuperados %s reintentos pendientes de %s", len(self._jobs), self.state_file_path)
+
+    def _save_state(self) -> None:
+        """Guarda la tabla de reintentos en disco (escritura atómica)."""
+        state = {
+            'pending': list(self._jobs.values()),
+            'failed': self._failed[-100:]  # Solo los últimos fallos definitivos
+        }
+        try:
+            temp_file = self.state_file_path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2, ensure_ascii=False)
+            temp_file.replace(self.state_file_path)
+        except Exception as e:
+            logger.error("Error al guardar tabla de reintentos: %s", e)
+
+    def register_handler(self, operation: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+        """
+        Registra la función que ejecuta una operación reintentable.
+
+        Args:
+            operation: Nombre de la operación (p. ej. "sync_item")
+            handler: Función que recibe el payload del trabajo
+        """
+        with self._condition:
+            self._handlers[operation] = handler
+            self._condition.notify()
+
+    def delegar_en(self, funcion: Optional[Callable[[str, Dict[str, Any], float, Optional[str]], Any]]) -> None:
+        """
+        Entrega los reintentos a otro mecanismo mientras este planificador no esté arrancado.
+
+        Con varios procesos solo uno ejecuta (y escribe) la tabla de reintentos; si
+        los demás la escribieran, se pisarían los cambios. Sus reintentos se envían
+        con `funcion(operation, payload, delay, dedup_key)`, que devuelve el ID del trabajo.
+        """
+        self._delegado = funcion
+
+    def schedule(
+        self,
+        operation: str,
+        payload: Dict[str, Any],
+        attempt: int = 0,
+        retry_after: Optional[float] = None,
+        error: Optional[str] = None,
+        dedup_key: Optional[str] = None
+    ) -> str:
+        """
+        Programa un reintento diferido.
+
+        Args:
+            operation: Nombre de la operación registrada
+            payload: Datos serializables en JSON que recibirá el handler
+            attempt: Intentos ya fallidos
+            retry_after: Espera mínima pedida por el servicio externo
+            error: Último error, para diagnóstico
+            dedup_key: Si ya hay un reintento pendiente con la misma clave, se fusiona con él
+
+        Returns:
+            ID del trabajo programado
+        """
+        delay = calcular_backoff(attempt, retry_after=retry_after)
+        if self._delegado is not None and not self._running:
+            job_id = str(self._delegado(operation, payload, delay, dedup_key))
+            logger.info("Reintento %s (%s) delegado en %.1fs", job_id, operation, delay)
+            return job_id
+        run_at = time.time() + delay
+        self._asegurar_estado()
+
+        with self._condition:
+            if dedup_key:
+                for job in self._jobs.values():
+                    # Un trabajo en curso ya leyó su payload: el nuevo no se funde con él
+                    if job['operation'] == operation and job.get('dedup_key') == dedup_key \
+                            and not job.get('in_flight'):
+                        # Un reintento ya pendiente cubre este: usar el payload más reciente
+                        job['payload'] = payload
+                        job['last_error'] = error or job.get('last_error')
+                        self._save_state()
+                        logger.info("Reintento %s (%s) ya pendiente para %s, fusionado", job['id'], operation, dedup_key)
+                        return job['id']
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'operation': operation,
+                'payload': payload,
+                'attempt': attempt,
+                'run_at': run_at,
+                'dedup_key': dedup_key,
+                'last_error': error,
+                'created_at': time.time(),
+                'in_flight': False
+            }
+            self._jobs[job['id']] = job
+            RETRIES.inc('retry_scheduler', operation)
+            heapq.heappush(self._heap, (run_at, job['id']))
+            self._save_state()
+            self._condition.notify()
+
+        logger.info("Reintento %s (%s) programado en %.1fs (intento %s/%s)",
+                    job['id'], operation, delay, attempt + 1, self.max_attempts)
+        return job['id']
+
+    def start(self) -> None:
+        """Arranca el hilo temporizador y el pool de workers."""
+        self._asegurar_estado()
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='retry-worker')
+            self._timer_thread = threading.Thread(target=self._timer_loop, name='retry-timer', daemon=True)
+            self._timer_thread.start()
+        logger.info("Planificador de reintentos iniciado (%s workers)", self.max_workers)
+
+    def stop(self) -> None:
+        """Detiene el planificador; los reintentos pendientes quedan en disco."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _timer_loop(self) -> None:
+        """Duerme hasta el siguiente reintento vencido y lo entrega a los workers."""
+        while True:
+            with self._condition:
+                if not self._running:
+                    return
+
+                job = None
+                waiting_for_handler = False
+                while self._heap:
+                    run_at, job_id = self._heap[0]
+                    candidate = self._jobs.get(job_id)
+                    if candidate is None or candidate['run_at'] != run_at or candidate.get('in_flight'):
+                        heapq.heappop(self._heap)  # Entrada obsoleta
+                        continue
+                    if run_at > time.time():
+                        break
+                    if candidate['operation'] not in self._handlers:
+                        # Aún no hay handler registrado; register_handler() despertará al temporizador
+                        waiting_for_handler = True
+                        break
+                    heapq.heappop(self._heap)
+                    # Sigue en la tabla hasta que termine: si el proceso muere, se repite al arrancar
+                    job = candidate
+                    job['in_flight'] = True
+                    self._save_state()
+                    break
+
+                if job is None:
+                    timeout = None
+                    if self._heap and not waiting_for_handler:
+                        timeout = max(0.05, self._heap[0][0] - time.time())
+                    self._condition.wait(timeout=timeout)
+                    continue
+
+                executor = self._executor
+
+            executor.submit(self._execute, job)
+
+    def _execute(self, job: Dict[str, Any]) -> None:
+        """Ejecuta un trabajo y, según el resultado, lo borra de la tabla, lo reprograma o lo marca fallido."""
+        handler = self._handlers[job['operation']]
+        attempt = job['attempt'] + 1
+
+        try:
+            handler(job['payload'])
+            logger.info("Reintento %s (%s) completado en el intento %s", job['id'], job['operation'], attempt)
+        except RetryableError as e:
+            if attempt >= self.max_attempts:
+                self._mark_failed(job, str(e))
+                return
+            self._reprogramar(job, attempt, e)
+            return
+        except Exception as e:
+            # Errores no transitorios: reintentar no los va a arreglar
+            self._mark_failed(job, str(e))
+            return
+
+        with self._condition:
+            self._jobs.pop(job['id'], None)
+            self._save_state()
+
+    def _reprogramar(self, job: Dict[str, Any], attempt: int, error: RetryableError) -> None:
+        """Devuelve a la tabla un trabajo que volvió a fallar de forma transitoria."""
+        delay = calcular_backoff(attempt, retry_after=error.retry_after)
+        with self._condition:
+            job.update(attempt=attempt, run_at=time.time() + delay, last_error=str(error), in_flight=False)
+            heapq.heappush(self._heap, (job['run_at'], job['id']))
+            RETRIES.inc('retry_scheduler', job['operation'])
+            self._save_state()
+            self._condition.notify()
+        logger.info("Reintento %s (%s) reprogramado en %.1fs (intento %s/%s)",
+                    job['id'], job['operation'], delay, attempt + 1, self.max_attempts)
+
+    def _mark_failed(self, job: Dict[str, Any], error: str) -> None:
+        """Mueve un trabajo a la lista de fallos definitivos."""
+        job['last_error'] = error
+        job['failed_at'] = time.time()
+        job.pop('in_flight', None)
+        with self._condition:
+            self._jobs.pop(job['id'], None)
+            self._failed.append(job)
+            self._save_state()
+        logger.error("Reintento %s (%s) descartado tras %s intentos: %s", job['id'], job['operation'], job['attempt'] + 1, error)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        Obtiene estadísticas de la tabla de reintentos.
+
+        Returns:
+            Diccionario con pendientes, fallidos y el próximo reintento programado
+        """
+        self._asegurar_estado()
+        with self._condition:
+            esperando = [job for job in self._jobs.values() if not job.get('in_flight')]
+            next_run = min((job['run_at'] for job in esperando), default=None)
+            return {
+                'running': self._running,
+                'pending': len(self._jobs),
+                'in_flight': len(self._jobs) - len(esperando),
+                'failed': len(self._failed),
+                'next_retry_at': datetime.fromtimestamp(next_run).isoformat() if next_run else None,
+                'pending_by_operation': {
+                    op: sum(1 for job in self._jobs.values() if job['operation'] == op)
+                    for op in {job['operation'] for job in self._jobs.values()}
+                }
+            }
+
+
+# Instancia global del planificador (los hilos se arrancan explícitamente con start())
+retry_scheduler = RetryScheduler()
+
+
+def schedule_retry(
+    operation: str,
+    payload: Dict[str, Any],
+    retry_after: Optional[float] = None,
+    error: Optional[str] = None,
+    dedup_key: Optional[str] = None
+) -> str:
+    """Función de conveniencia para programar un reintento diferido."""
+    return retry_scheduler.schedule(operation, payload, retry_after=retry_after, error=error, dedup_key=dedup_key)
@@ -10,6 +10,7 @@ from dotenv import load_dotenv
 from google_calendar_service import get_calendar_service
 from monday_api_handler import MondayAPIHandler
 from sync_logic import sincronizar_item_via_webhook
+from sync_priority import encolar_sincronizacion, esperar_trabajo, ORIGEN_MANUAL
 import config
 
 # Cargar variables de entorno
@@ -39,12 +40,22 @@ def forzar_sincronizacion():
         
         print(f"🔄 Forzando sincronización para item {item_id}...")
         
-        # Usar la función de sincronización existente
-        success = sincronizar_item_via_webhook(
-            item_id=item_id,
-            monday_handler=monday_handler,
-            google_service=google_service
-        )
+        if config.WORK_QUEUE_ENABLED:
+            # La sincronizan los workers del servidor, por delante de los webhooks pendientes
+            job_id = encolar_sincronizacion(item_id, ORIGEN_MANUAL)
+            print(f"📥 Sincronización encolada (trabajo {job_id}), esperando a los workers...")
+            resultado = esperar_trabajo(job_id)
+            success = resultado['status'] == 'done'
+            if not success:
+                print(f"⚠️ Trabajo {job_id}: {resultado['status']}"
+                      + (f" ({resultado['error']})" if resultado.get('error') else ''))
+        else:
+            # Usar la función de sincronización existente
+            success = sincronizar_item_via_webhook(
+                item_id=item_id,
+                monday_handler=monday_handler,
+                google_service=google_service
+            )
         
         if success:
             print("✅ Sincronización forzada exitosa")
@@ -9,7 +9,8 @@ import os
 from dotenv import load_dotenv
 from monday_api_handler import MondayAPIHandler
 from google_calendar_service import get_calendar_service
-from sync_logic import sincronizar_item_especifico
+from sync_logic import sincronizar_item_via_webhook
+from sync_priority import encolar_sincronizacion, esperar_trabajo, ORIGEN_MANUAL
 import config
 
 # Cargar variables de entorno
@@ -72,11 +73,21 @@ def forzar_sincronizacion_elemento(item_name):
         
         # Forzar sincronización
         print(f"🔄 Iniciando sincronización forzada...")
-        success = sincronizar_item_especifico(
-            item_id=item_id,
-            monday_handler=monday_handler,
-            google_service=google_service
-        )
+        if config.WORK_QUEUE_ENABLED:
+            # La sincronizan los workers del servidor, por delante de los webhooks pendientes
+            job_id = encolar_sincronizacion(item_id, ORIGEN_MANUAL)
+            print(f"📥 Sincronización encolada (trabajo {job_id}), esperando a los workers...")
+            resultado = esperar_trabajo(job_id)
+            success = resultado['status'] == 'done'
+            if not success:
+                print(f"⚠️ Trabajo {job_id}: {resultado['status']}"
+                      + (f" ({resultado['error']})" if resultado.get('error') else ''))
+        else:
+            success = sincronizar_item_via_webhook(
+                item_id=item_id,
+                monday_handler=monday_handler,
+                google_service=google_service
+            )
         
         if success:
             print(f"✅ Sincronización forzada exitosa para {item_name}")
@@ -8,8 +8,9 @@ import os
 from dotenv import load_dotenv
 from monday_api_handler import MondayAPIHandler
 from google_calendar_service import get_calendar_service
-from config import BOARD_ID_GRABACIONES, MASTER_CALENDAR_ID
+from config import BOARD_ID_GRABACIONES, MASTER_CALENDAR_ID, WORK_QUEUE_ENABLED
 from sync_logic import sincronizar_item_via_webhook
+from sync_priority import encolar_sincronizacion, esperar_trabajo, ORIGEN_MANUAL
 
 def forzar_sincronizacion_manual():
     """Fuerza la sincronización manual del item"""
@@ -90,12 +91,23 @@ def forzar_sincronizacion_manual():
         
         # Forzar sincronización
         print("🔄 Ejecutando sincronización...")
-        success = sincronizar_item_via_webhook(
-            item_id=item_id,
-            monday_handler=monday_handler,
-            google_service=google_service,
-            change_uuid="manual-sync-" + str(int(time.time()))
-        )
+        change_uuid = "manual-sync-" + str(int(time.time()))
+        if WORK_QUEUE_ENABLED:
+            # La sincronizan los workers del servidor, por delante de los webhooks pendientes
+            job_id = encolar_sincronizacion(item_id, ORIGEN_MANUAL, change_uuid=change_uuid)
+            print(f"📥 Sincronización encolada (trabajo {job_id}), esperando a los workers...")
+            resultado = esperar_trabajo(job_id)
+            success = resultado['status'] == 'done'
+            if not success:
+                print(f"⚠️ Trabajo {job_id}: {resultado['status']}"
+                      + (f" ({resultado['error']})" if resultado.get('error') else ''))
+        else:
+            success = sincronizar_item_via_webhook(
+                item_id=item_id,
+                monday_handler=monday_handler,
+                google_service=google_service,
+                change_uuid=change_uuid
+            )
         
         if success:
             print("✅ Sincronización forzada completada")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Replay Dead Letters
+
+Lista y reencola los trabajos de la cola de trabajo del webhook que acabaron
+en dead letter (agotaron sus intentos o fallaron de forma no transitoria).
+Los workers del servidor los recogen en su siguiente sondeo.
+
+Usage:
+    python scripts/utilities/replay_dead_letters.py            # Listar
+    python scripts/utilities/replay_dead_letters.py <id>       # Reencolar uno
+    python scripts/utilities/replay_dead_letters.py --all      # Reencolar todos
+"""
+
+import os
+import sys
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+os.chdir(project_root)
+
+from work_queue import work_queue
+
+
+def listar():
+    """Muestra los trabajos en dead letter."""
+    dead_letters = work_queue.list_dead_letters(limit=1000)
+    if not dead_letters:
+        print("✅ No hay trabajos en dead letter")
+        return
+    for row in dead_letters:
+        event = row['payload'].get('event_data', {}).get('event', {})
+        print(f"#{row['id']} [{row['kind']}] item {event.get('pulseId', '?')} - "
+              f"{row['attempts']} intentos - {row['error']}")
+    print(f"\n{len(dead_letters)} trabajos en dead letter")
+
+
+def main():
+    if len(sys.argv) < 2:
+        listar()
+    elif sys.argv[1] == '--all':
+        print(f"🔁 {work_queue.replay()} trabajos reencolados")
+    else:
+        print(f"🔁 {work_queue.replay(int(sys.argv[1]))} trabajos reencolados")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Resincronizar Tablero
+
+Encola la sincronización de todos los items del tablero de grabaciones en la
+cola de trabajo del servidor, con prioridad de reconciliación: las
+grabaciones más próximas se sincronizan primero y los webhooks que lleguen
+mientras tanto no esperan detrás del tablero completo.
+
+Usage:
+    python scripts/utilities/resincronizar_tablero.py
+"""
+
+import os
+import sys
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+os.chdir(project_root)
+
+from dotenv import load_dotenv
+
+import config
+from monday_api_handler import MondayAPIHandler
+from sync_logic import parse_monday_item
+from sync_priority import encolar_sincronizacion, parsear_fecha, ORIGEN_RECONCILIACION
+from work_queue import work_queue
+
+
+def main():
+    load_dotenv()
+    monday_handler = MondayAPIHandler(api_token=os.getenv("MONDAY_API_KEY"))
+    items = monday_handler.get_items(str(config.BOARD_ID_GRABACIONES), column_ids=[config.COL_FECHA])
+    print(f"📋 {len(items)} items en el tablero {config.BOARD_ID_GRABACIONES}")
+
+    encolados = 0
+    for item in items:
+        item_procesado = parse_monday_item(item)
+        if not item_procesado or not item_procesado.get('fecha_inicio'):
+            continue
+        encolar_sincronizacion(
+            item_procesado['id'], ORIGEN_RECONCILIACION, fecha=parsear_fecha(item_procesado['fecha_inicio'])
+        )
+        encolados += 1
+
+    print(f"📥 {encolados} sincronizaciones encoladas ({work_queue.get_statistics()['pending']} trabajos pendientes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Sync Logging - Logging estructurado, asíncrono y con muestreo
+=============================================================
+
+Cada webhook escribía en stdout con `print` (el payload completo con
+`json.dumps(indent=2)` y decenas de líneas por sincronización) desde el hilo
+que lo atendía: E/S síncrona en el camino crítico. Este módulo configura el
+logging del proceso:
+
+- No bloqueante: los registros pasan por una cola en memoria y un hilo
+  (`QueueListener`) los escribe. Si la cola se llena se descartan y se cuentan,
+  nunca se espera.
+- Estructurado: cada registro lleva `item_id`, `change_uuid` y `stage` del
+  contexto en curso (ver `contexto_log` y `marcar_etapa`). En formato 'text'
+  salen como `clave=valor` (fáciles de filtrar con grep); en 'json', una línea
+  JSON por registro.
+- Niveles por módulo (`config.LOG_LEVELS`): en producción los `debug` de los
+  bucles calientes ni siquiera formatean su mensaje.
+- Muestreo: con DEBUG activo, de cada línea de depuración solo se emite una de
+  cada `config.LOG_DEBUG_SAMPLE_EVERY`.
+
+La configuración es por proceso: tras un fork se vuelve a llamar a
+`configurar_logging()` para arrancar el hilo escritor del nuevo proceso.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+import config
+from sync_metrics import LOG_RECORDS_DROPPED
+
+CAMPOS_CONTEXTO = ('item_id', 'change_uuid', 'stage')
+
+# Campos del registro en curso; cada hilo (y cada worker de la cola) tiene los suyos
+_contexto: ContextVar[Dict[str, Any]] = ContextVar('contexto_log', default={})
+
+_estado = {'pid': None, 'listener': None, 'handler': None}
+_estado_lock = threading.Lock()
+
+
+@contextmanager
+def contexto_log(**campos: Any) -> Iterator[None]:
+    """
+    Añade campos (item_id, change_uuid, stage...) a todos los registros del bloque `with`.
+
+    Los campos con valor None no se tocan; al salir se restaura el contexto anterior.
+    """
+    nuevos = {clave: valor for clave, valor in campos.items() if valor is not None}
+    token = _contexto.set({**_contexto.get(), **nuevos})
+    try:
+        yield
+    finally:
+        _contexto.reset(token)
+
+
+def anotar_contexto(**campos: Any) -> None:
+    """
+    Añade campos al contexto en curso hasta que termine su `contexto_log` (o hasta
+    `limpiar_contexto`, en hilos que se reutilizan entre peticiones).
+    """
+    _contexto.set({**_contexto.get(), **{clave: valor for clave, valor in campos.items() if valor is not None}})
+
+
+def marcar_etapa(stage: str) -> None:
+    """Cambia la etapa del contexto en curso."""
+    anotar_contexto(stage=stage)
+
+
+def limpiar_contexto() -> None:
+    """Vacía el contexto del hilo actual (p. ej. al empezar cada petición HTTP)."""
+    _contexto.set({})
+
+
+class _FiltroContexto(logging.Filter):
+    """Copia en el registro los campos del contexto (se ejecuta en el hilo que registra)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        contexto = _contexto.get()
+        for campo in CAMPOS_CONTEXTO:
+            if not hasattr(record, campo):
+                setattr(record, campo, contexto.get(campo, '-'))
+        return True
+
+
+class _FiltroMuestreo(logging.Filter):
+    """Deja pasar una de cada N líneas de depuración, contando por línea de código."""
+
+    def __init__(self, cada: int):
+        super().__init__()
+        self.cada = cada
+        self._contadores: Dict[tuple, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.cada <= 1:
+            return True
+        clave = (record.name, record.lineno)
+        n = self._contadores.get(clave, 0)
+        self._contadores[clave] = n + 1
+        return n % self.cada == 0
+
+
+class _QueueHandlerSinBloqueo(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) los registros si la cola está llena."""
+
+    def __init__(self, cola: queue.Queue):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+            LOG_RECORDS_DROPPED.inc()
+
+
+class FormatoTexto(logging.Formatter):
+    """Una línea por registro: fecha, nivel, módulo, campos clave=valor y mensaje."""
+
+    def __init__(self):
+        super().__init__(
+            '%(asctime)s %(levelname)s %(name)s pid=%(process)d '
+            'item=%(item_id)s change=%(change_uuid)s stage=%(stage)s | %(message)s'
+        )
+
+
+class FormatoJson(logging.Formatter):
+    """Una línea JSON por registro."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        datos = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for campo in CAMPOS_CONTEXTO:
+            valor = getattr(record, campo, '-')
+            if valor != '-':
+                datos[campo] = valor
+        if record.exc_info:
+            datos['exc'] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def configurar_logging(force: bool = False) -> None:
+    """
+    Configura el logging del proceso actual (idempotente por proceso).
+
+    Sustituye los handlers del logger raíz por el handler de cola, arranca el hilo
+    que escribe en stdout y aplica los niveles de `config.LOG_LEVEL` y `config.LOG_LEVELS`.
+
+    Args:
+        force: Reconfigurar aunque este proceso ya lo estuviera
+    """
+    pid = os.getpid()
+    with _estado_lock:
+        if _estado['pid'] == pid and not force:
+            return
+        if _estado['pid'] == pid and _estado['listener']:
+            _estado['listener'].stop()
+
+        salida = logging.StreamHandler(sys.stdout)
+        salida.setFormatter(FormatoJson() if config.LOG_FORMAT == 'json' else FormatoTexto())
+
+        # Tras un fork la cola heredada no tiene quien la lea: cada proceso usa una nueva
+        handler = _QueueHandlerSinBloqueo(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+        handler.addFilter(_FiltroMuestreo(config.LOG_DEBUG_SAMPLE_EVERY))
+        handler.addFilter(_FiltroContexto())
+        listener = logging.handlers.QueueListener(handler.queue, salida, respect_handler_level=False)
+        listener.start()
+
+        raiz = logging.getLogger()
+        raiz.handlers = [handler]
+        raiz.setLevel(config.LOG_LEVEL)
+        for nombre, nivel in config.LOG_LEVELS.items():
+            logging.getLogger(nombre).setLevel(nivel)
+
+        _estado.update(pid=pid, listener=listener, handler=handler)
+
+
+def detener_logging() -> None:
+    """Escribe los registros pendientes y detiene el hilo escritor del proceso."""
+    with _estado_lock:
+        if _estado['pid'] == os.getpid() and _estado['listener']:
+            _estado['listener'].stop()
+            _estado['listener'] = None
+
+
+def get_statistics() -> Dict[str, Any]:
+    """Registros en cola y descartados por cola llena en este proceso."""
+    handler: Optional[_QueueHandlerSinBloqueo] = _estado['handler'] if _estado['pid'] == os.getpid() else None
+    return {
+        'configured': handler is not None,
+        'queued': handler.queue.qsize() if handler else 0,
+        'dropped': handler.descartados if handler else 0,
+        'format': config.LOG_FORMAT,
+        'debug_sample_every': config.LOG_DEBUG_SAMPLE_EVERY,
+    }
+
+
+atexit.register(detener_logging)
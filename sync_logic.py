@@ -7,22 +7,43 @@ All Google → Monday functions have been removed for unidirectional sync.
 
 Functions included:
 - sincronizar_item_via_webhook() - Main Monday → Google sync function
+- cargar_contexto_item() - Request-scoped item context shared by app.py and the sync
 - generate_content_hash() - Content hashing for change detection
 - Supporting utility functions
 """
 
 import json
+import logging
 import requests
 import time
 import hashlib
+import threading
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
+
+from googleapiclient.errors import HttpError
 
 # Importaciones de nuestros módulos
 import config
-from google_calendar_service import create_google_event, update_google_event
-from sync_state_manager import update_sync_state
+from google_calendar_service import (
+    execute_event_batch, find_event_by_monday_item_id, calcular_parche_evento, fingerprint_evento,
+    es_conflicto_etag, get_event_if_changed, CAMPOS_POR_OPERACION, ERROR_SERVIDOR, ERROR_RED, ERROR_CONFLICTO,
+    _es_error_transitorio, _como_error_reintentable
+)
+from sync_state_manager import get_sync_state, update_sync_state
+from event_index import event_index
+from event_ids import generar_event_id, decodificar_event_id, es_event_id_determinista
+from calendar_write_scheduler import calendar_write_scheduler
+from item_locks import item_locks
+from retry_scheduler import RetryableError
+from sync_logging import contexto_log, marcar_etapa
+from sync_metrics import medir_etapa, registrar_cache
+
+logger = logging.getLogger(__name__)
 
 
+@medir_etapa('hash')
 def generate_content_hash(content_data):
     """
     Genera un hash MD5 determinístico del contenido relevante de un item/evento.
@@ -46,6 +67,10 @@ def generate_content_hash(content_data):
         relevant_data['fecha_fin'] = content_data['fecha_fin']
     if 'operario' in content_data:
         relevant_data['operario'] = content_data['operario']
+    if 'cliente' in content_data:
+        relevant_data['cliente'] = content_data['cliente']
+    if 'ubicacion' in content_data:
+        relevant_data['ubicacion'] = content_data['ubicacion']
     
     # Ordenar el diccionario para consistencia
     sorted_content = json.dumps(relevant_data, sort_keys=True, ensure_ascii=False)
@@ -56,6 +81,175 @@ def generate_content_hash(content_data):
     return content_hash
 
 
+# Número de actualizaciones recientes que se piden junto al item para detectar automatizaciones
+AUTOMATION_UPDATES_LIMIT = 5
+
+# Columnas que necesita todo el pipeline del webhook (eco, automatización y sincronización)
+SYNC_COLUMN_IDS = [config.COL_GOOGLE_EVENT_ID, config.COL_FECHA, "personas1", "name", config.COL_CLIENTE, "ubicaci_n"]
+
+
+@dataclass
+class ItemSyncContext:
+    """
+    Contexto de una petición de sincronización.
+    
+    El item se obtiene de Monday una sola vez (con la unión de columnas que usan
+    app.py y la sincronización) y se comparte a lo largo del pipeline: detección
+    de eco, detección de automatización y escritura en Google parten de los
+    mismos datos y del mismo hash.
+    """
+    item_id: str
+    event_data: Optional[dict] = None
+    change_uuid: Optional[str] = None
+    item_data: Optional[dict] = None
+    item_procesado: Optional[dict] = None
+    content_hash: Optional[str] = None
+    sync_state: Optional[dict] = None
+    escrituras: Optional[dict] = None  # {'enviadas': n, 'omitidas': n, 'restauradas': n} tras escribir en Google
+    event_id_resuelto: Optional[str] = None  # ID del evento maestro encontrado en el índice o en Google
+    
+    @property
+    def google_event_id(self):
+        google_event_id = (self.item_procesado or {}).get('google_event_id')
+        if google_event_id or not self.item_procesado:
+            return google_event_id
+        if self.event_id_resuelto:
+            return self.event_id_resuelto
+        # Sin ID guardado en Monday, un item antiguo puede tener en el índice un ID asignado por Google
+        google_event_id = event_index.get_event_id(str(self.item_procesado.get('id')), config.MASTER_CALENDAR_ID)
+        if google_event_id:
+            self.event_id_resuelto = google_event_id
+        elif config.DETERMINISTIC_EVENT_IDS:
+            # Si no, el del calendario maestro se calcula
+            google_event_id = _event_id_determinista(self.item_procesado.get('id'), config.MASTER_CALENDAR_ID)
+        return google_event_id
+
+
+def cargar_contexto_item(item_id, monday_handler, event_data=None, change_uuid=None):
+    """
+    Obtiene el item de Monday una sola vez y construye su contexto de sincronización.
+    
+    Args:
+        item_id: ID del item de Monday.com
+        monday_handler: Instancia de MondayAPIHandler
+        event_data: Payload del webhook que originó la sincronización (opcional)
+        change_uuid: UUID único del cambio (opcional)
+        
+    Returns:
+        ItemSyncContext con el item parseado, su hash y su estado de sincronización,
+        o None si el item no se pudo obtener
+        
+    Raises:
+        RetryableError: Fallo transitorio de Monday (solo con handler no bloqueante)
+    """
+    with medir_etapa('monday_read'):
+        item_data = monday_handler.get_item_by_id(
+            board_id=str(config.BOARD_ID_GRABACIONES),
+            item_id=str(item_id),
+            column_ids=SYNC_COLUMN_IDS,
+            updates_limit=AUTOMATION_UPDATES_LIMIT
+        )
+    if not item_data:
+        return None
+    
+    item_procesado = parse_monday_item(item_data)
+    if not item_procesado:
+        return None
+    
+    guardar_snapshot_item(item_procesado)
+    return _construir_contexto(item_id, item_procesado, item_data, event_data, change_uuid)
+
+
+def _construir_contexto(item_id, item_procesado, item_data=None, event_data=None, change_uuid=None):
+    """Construye el contexto a partir de un item ya parseado."""
+    contexto = ItemSyncContext(
+        item_id=str(item_id),
+        event_data=event_data,
+        change_uuid=change_uuid,
+        item_data=item_data,
+        item_procesado=item_procesado,
+        content_hash=generate_content_hash(item_procesado)
+    )
+    if contexto.google_event_id:
+        contexto.sync_state = get_sync_state(str(item_id), contexto.google_event_id)
+    
+    return contexto
+
+
+# Último estado conocido de cada item: {item_id: (item_procesado, timestamp, sync_version)}
+# Permite aplicar el valor que trae un webhook sin volver a consultar Monday. Cada proceso tiene
+# el suyo: la versión del estado de sincronización (compartido en disco) al guardarlo dice si
+# otro proceso ha sincronizado el item después, y entonces la copia ya no vale
+_item_snapshots = {}
+_item_snapshots_lock = threading.Lock()
+
+
+def _version_sincronizacion(item_procesado):
+    """Versión del estado de sincronización del item, o None si no tiene evento o estado."""
+    google_event_id = item_procesado.get('google_event_id')
+    if not google_event_id:
+        return None
+    estado = get_sync_state(str(item_procesado['id']), google_event_id)
+    return estado.get('sync_version') if estado else None
+
+
+def guardar_snapshot_item(item_procesado):
+    """Guarda una copia del último estado conocido de un item."""
+    item_id = str(item_procesado.get('id', ''))
+    if not item_id:
+        return
+    version = _version_sincronizacion(item_procesado)
+    with _item_snapshots_lock:
+        _item_snapshots[item_id] = (dict(item_procesado), time.time(), version)
+
+
+def obtener_snapshot_item(item_id):
+    """
+    Devuelve una copia del último estado conocido del item, o None si no hay, ha caducado
+    o el item se ha vuelto a sincronizar desde que se guardó (p. ej. en otro worker).
+    """
+    with _item_snapshots_lock:
+        snapshot = _item_snapshots.get(str(item_id))
+        if not snapshot:
+            return None
+        item_procesado, timestamp, version = snapshot
+        if (time.time() - timestamp) >= config.ITEM_SNAPSHOT_TTL:
+            del _item_snapshots[str(item_id)]
+            return None
+    
+    if not item_procesado.get('google_event_id') or _version_sincronizacion(item_procesado) != version:
+        with _item_snapshots_lock:
+            if _item_snapshots.get(str(item_id)) is snapshot:
+                del _item_snapshots[str(item_id)]
+        return None
+    return dict(item_procesado)
+
+
+def construir_contexto_desde_payload(clasificacion, event_data=None, change_uuid=None):
+    """
+    Construye el contexto aplicando el valor del webhook sobre el último estado conocido del item.
+    
+    Args:
+        clasificacion: WebhookClassification con acción 'apply'
+        event_data: Payload del webhook
+        change_uuid: UUID único del cambio (opcional)
+        
+    Returns:
+        ItemSyncContext sin consultar Monday, o None si no hay un estado reciente del item
+    """
+    item_procesado = obtener_snapshot_item(clasificacion.item_id)
+    registrar_cache('item_snapshot', item_procesado is not None)
+    if item_procesado is None:
+        return None
+    
+    item_procesado[clasificacion.field] = clasificacion.new_text
+    if clasificacion.extra_fields:
+        item_procesado.update(clasificacion.extra_fields)
+    
+    guardar_snapshot_item(item_procesado)
+    return _construir_contexto(clasificacion.item_id, item_procesado, event_data=event_data, change_uuid=change_uuid)
+
+
 def get_monday_user_directory(monday_handler):
     """Obtiene el directorio de usuarios de Monday.com"""
     try:
@@ -75,7 +269,7 @@ def get_monday_user_directory(monday_handler):
         response_data = response.json()
         
         if 'errors' in response_data:
-            print(f"❌ Error al obtener directorio de usuarios: {response_data['errors']}")
+            logger.error("Error al obtener directorio de usuarios: %s", response_data['errors'])
             return None
         
         users = response_data.get('data', {}).get('users', [])
@@ -84,7 +278,7 @@ def get_monday_user_directory(monday_handler):
         return user_directory
         
     except Exception as e:
-        print(f"❌ Error al obtener directorio de usuarios: {e}")
+        logger.error("Error al obtener directorio de usuarios: %s", e)
         return None
 
 
@@ -129,7 +323,7 @@ def parse_monday_item(item):
         return parsed_item
         
     except Exception as e:
-        print(f"❌ Error parseando item de Monday: {e}")
+        logger.error("Error parseando item de Monday: %s", e)
         return None
 
 
@@ -142,10 +336,10 @@ def _get_personal_calendar_ids_for_item(item_procesado):
     """
     try:
         operarios_texto = item_procesado.get('operario', '')
-        print(f"🔍 Debug: Operarios del item: '{operarios_texto}'")
+        logger.debug("Operarios del item: '%s'", operarios_texto)
         
         if not operarios_texto:
-            print("❌ Debug: No hay operarios asignados")
+            logger.debug("No hay operarios asignados")
             return []
 
         # Separar múltiples operarios (pueden estar separados por comas, punto y coma, etc.)
@@ -157,10 +351,10 @@ def _get_personal_calendar_ids_for_item(item_procesado):
         else:
             operarios_lista = [operarios_texto.strip()]
         
-        print(f"🔍 Debug: Operarios separados: {operarios_lista}")
+        logger.debug("Operarios separados: %s", operarios_lista)
 
         profiles = getattr(config, 'FILMMAKER_PROFILES', [])
-        print(f"🔍 Debug: Buscando en {len(profiles)} perfiles disponibles")
+        logger.debug("Buscando en %s perfiles disponibles", len(profiles))
         
         calendar_ids = []
         
@@ -170,27 +364,27 @@ def _get_personal_calendar_ids_for_item(item_procesado):
             
             for profile in profiles:
                 monday_name = profile.get('monday_name', '').strip()
-                print(f"🔍 Debug: Comparando '{operario_limpio}' con '{monday_name}'")
+                logger.debug("Comparando '%s' con '%s'", operario_limpio, monday_name)
                 
                 # Comparación exacta
                 if monday_name == operario_limpio:
                     calendar_id = profile.get('calendar_id')
                     if calendar_id:
-                        print(f"✅ Debug: Coincidencia encontrada para '{operario_limpio}': {calendar_id}")
+                        logger.debug("Coincidencia encontrada para '%s': %s", operario_limpio, calendar_id)
                         calendar_ids.append(calendar_id)
                         encontrado = True
                         break
                     else:
-                        print(f"⚠️  Debug: Perfil encontrado pero sin calendar_id para '{operario_limpio}'")
+                        logger.debug("Perfil encontrado pero sin calendar_id para '%s'", operario_limpio)
             
             if not encontrado:
-                print(f"❌ Debug: No se encontró perfil para operario '{operario_limpio}'")
+                logger.debug("No se encontró perfil para operario '%s'", operario_limpio)
         
-        print(f"✅ Debug: Calendar IDs encontrados: {calendar_ids}")
+        logger.debug("Calendar IDs encontrados: %s", calendar_ids)
         return calendar_ids
         
     except Exception as e:
-        print(f"❌ Debug: Error en _get_personal_calendar_ids_for_item: {e}")
+        logger.warning("Error en _get_personal_calendar_ids_for_item: %s", e)
         return []
 
 
@@ -216,25 +410,25 @@ def _get_personal_calendar_id_by_name(operario_name):
 def _handle_operarios_change(google_service, monday_item_id, old_operarios, new_operarios):
     """Maneja el cambio de operarios sincronizando eventos en calendarios personales."""
     try:
-        print(f"👤 Detectado cambio de operarios: '{old_operarios}' → '{new_operarios}'")
+        logger.info("Detectado cambio de operarios: '%s' → '%s'", old_operarios, new_operarios)
         
         # Obtener calendarios personales anteriores y nuevos
         old_calendar_ids = _get_personal_calendar_ids_from_text(old_operarios)
         new_calendar_ids = _get_personal_calendar_ids_from_text(new_operarios)
         
-        print(f"🔍 Calendarios anteriores: {old_calendar_ids}")
-        print(f"🔍 Calendarios nuevos: {new_calendar_ids}")
+        logger.debug("Calendarios anteriores: %s", old_calendar_ids)
+        logger.debug("Calendarios nuevos: %s", new_calendar_ids)
         
         # Eliminar eventos de calendarios que ya no corresponden
         for old_calendar_id in old_calendar_ids:
             if old_calendar_id not in new_calendar_ids:
-                print(f"🗑️  Eliminando evento del calendario que ya no corresponde: {old_calendar_id}")
+                logger.info("Eliminando evento del calendario que ya no corresponde: %s", old_calendar_id)
                 _remove_event_from_calendar(google_service, old_calendar_id, monday_item_id)
         
         return new_calendar_ids
         
     except Exception as e:
-        print(f"⚠️  Error manejando cambio de operarios: {e}")
+        logger.warning("Error manejando cambio de operarios: %s", e)
         return []
 
 
@@ -264,35 +458,170 @@ def _get_personal_calendar_ids_from_text(operarios_texto):
 def _remove_event_from_calendar(google_service, calendar_id, monday_item_id):
     """Elimina un evento específico de un calendario."""
     try:
-        # Buscar el evento en el calendario
-        events_result = google_service.events().list(
-            calendarId=calendar_id,
-            maxResults=50,
-            singleEvents=True
-        ).execute()
-        
-        events = events_result.get('items', [])
-        
-        # Buscar el evento que tenga el mismo monday_item_id
-        for event in events:
-            extended_props = event.get('extendedProperties', {}).get('private', {})
-            if extended_props.get('monday_item_id') == str(monday_item_id):
-                event_id = event.get('id')
-                print(f"🗑️  Eliminando evento {event_id} del calendario {calendar_id}")
-                google_service.events().delete(
-                    calendarId=calendar_id,
-                    eventId=event_id
-                ).execute()
-                print(f"✅ Evento eliminado del calendario {calendar_id}")
-                return True
-        
-        print(f"ℹ️  No se encontró evento para eliminar en calendario {calendar_id}")
-        return False
+        event_id = _resolver_evento_en_calendario(google_service, calendar_id, monday_item_id)
+        if not event_id:
+            logger.info("No se encontró evento para eliminar en calendario %s", calendar_id)
+            return False
+        
+        logger.info("Eliminando evento %s del calendario %s", event_id, calendar_id)
+        try:
+            google_service.events().delete(
+                calendarId=calendar_id,
+                eventId=event_id
+            ).execute()
+        except HttpError as error:
+            # 404/410: ya no existía, el índice estaba desfasado
+            if error.resp.status not in (404, 410):
+                raise
+        event_index.remove(monday_item_id, calendar_id)
+        logger.info("Evento eliminado del calendario %s", calendar_id)
+        return True
         
     except Exception as e:
-        print(f"⚠️  Error eliminando evento del calendario {calendar_id}: {e}")
+        logger.warning("Error eliminando evento del calendario %s: %s", calendar_id, e)
         return False
 
+def _resolver_evento_en_calendario(google_service, calendar_id, monday_item_id):
+    """
+    Obtiene el event_id de la copia de un item en un calendario.
+    
+    Consulta primero el índice local; solo si no hay entrada busca en Google por
+    `privateExtendedProperty` y guarda el resultado en el índice.
+    
+    Returns:
+        str: ID del evento, o None si el item no tiene evento en ese calendario
+    """
+    monday_item_id = str(monday_item_id)
+    event_id = event_index.get_event_id(monday_item_id, calendar_id)
+    if event_id:
+        return event_id
+    
+    event = find_event_by_monday_item_id(google_service, calendar_id, monday_item_id)
+    if not event:
+        return None
+    
+    logger.debug("Encontrado evento con ID: %s (añadido al índice)", event.get('id'))
+    event_index.set_event(monday_item_id, calendar_id, event['id'])
+    return event['id']
+
+
+def _operacion_actualizar_evento(monday_item_id, calendar_id, event_id, event_body, huella):
+    """
+    Construye la operación de batch para actualizar un evento existente.
+    
+    Si la huella del último cuerpo escrito en ese calendario coincide con la del
+    nuevo, la operación se marca para omitirse ('omitir'). Si el índice guarda el
+    último cuerpo, se envía un events.patch solo con los campos cambiados; si no,
+    un events.update completo. Con el etag de la última escritura la operación es
+    condicional (If-Match).
+    """
+    operation = {
+        'key': calendar_id,
+        'method': 'update',
+        'calendar_id': calendar_id,
+        'event_id': event_id,
+        'body': event_body
+    }
+    entry = event_index.get(monday_item_id, calendar_id)
+    if entry and entry.get('event_id') == event_id and entry.get('etag'):
+        operation['etag'] = entry['etag']
+    if entry and entry.get('event_id') == event_id and entry.get('fingerprint') == huella:
+        logger.debug("Sin cambios en %s..., escritura omitida", calendar_id[:20])
+        operation['omitir'] = True
+    elif entry and entry.get('event_id') == event_id and entry.get('body'):
+        parche = calcular_parche_evento(entry['body'], event_body)
+        logger.debug("Parche para %s...: %s", calendar_id[:20], ', '.join(sorted(parche)) or 'sin cambios')
+        operation.update({'method': 'patch', 'body': parche})
+    return operation
+
+
+def _event_id_determinista(monday_item_id, calendar_id):
+    """ID de evento de un item en un calendario derivado de (board_id, item_id, calendar_id)."""
+    return generar_event_id(str(config.BOARD_ID_GRABACIONES), str(monday_item_id), calendar_id)
+
+
+def _operacion_escribir_evento_determinista(monday_item_id, calendar_id, event_body, huella):
+    """
+    Construye la operación de batch para un evento con ID determinista.
+
+    Si el índice ya tiene ese evento se actualiza (o parchea, u omite). Si no, se
+    inserta con el ID calculado: si ya existía en Google, el insert responde 409
+    y la sincronización lo convierte en un update, sin buscar nada antes.
+    """
+    event_id = _event_id_determinista(monday_item_id, calendar_id)
+    if event_index.get_event_id(monday_item_id, calendar_id) == event_id:
+        return _operacion_actualizar_evento(monday_item_id, calendar_id, event_id, event_body, huella)
+    return {
+        'key': calendar_id,
+        'method': 'insert',
+        'calendar_id': calendar_id,
+        'event_id': event_id,
+        'body': dict(event_body, id=event_id)
+    }
+
+
+@medir_etapa('google_write')
+def _ejecutar_escrituras(google_service, operations, defer_retries):
+    """Envía escrituras a Google a través del planificador por calendario (o en un batch directo)."""
+    if config.CALENDAR_WRITE_SCHEDULER_ENABLED:
+        return calendar_write_scheduler.execute(google_service, operations, defer_retries=defer_retries)
+    return execute_event_batch(google_service, operations, defer_retries=defer_retries)
+
+
+def _es_evento_inexistente(error):
+    """True si Google indica que el evento ya no existe (404/410)."""
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
+
+
+def marcar_evento_divergente(monday_item_id, calendar_id, event):
+    """
+    Prepara el índice para que la próxima sincronización reescriba un evento editado o borrado en Google.
+    
+    Se olvidan la huella, el cuerpo y el etag de la última escritura, de modo que
+    no se omite la escritura ni se envía un parche sobre una base que ya no es real.
+    """
+    if event.get('status') == 'cancelled':
+        # Copia borrada: la sincronización la buscará de nuevo (o la recreará)
+        event_index.remove(monday_item_id, calendar_id)
+    else:
+        event_index.update_entry(monday_item_id, calendar_id, fingerprint=None, body=None, etag=None)
+
+
+def verificar_eventos_item(google_service, monday_item_id):
+    """
+    Comprueba si los eventos indexados de un item siguen como los dejó la sincronización.
+    
+    Usa lecturas condicionales con el etag de la última escritura: si el evento no
+    ha cambiado, Google responde 304 sin cuerpo.
+    
+    Returns:
+        dict: {calendar_id: {'event_id': ..., 'estado': 'sin_cambios' | 'editado_manualmente'
+               | 'no_existe' | 'sin_etag' | 'error'}}
+    """
+    resultado = {}
+    for calendar_id, entry in event_index.get_entries_for_item(monday_item_id).items():
+        estado = {'event_id': entry['event_id']}
+        etag = entry.get('etag')
+        try:
+            event, modificado = get_event_if_changed(
+                google_service, calendar_id, entry['event_id'], etag=etag, fields=CAMPOS_POR_OPERACION['verificacion']
+            )
+            if not etag:
+                estado['estado'] = 'sin_etag'
+            elif not modificado or event.get('etag') == etag:
+                estado['estado'] = 'sin_cambios'
+            elif event.get('status') == 'cancelled':
+                estado['estado'] = 'no_existe'
+            else:
+                estado.update({'estado': 'editado_manualmente', 'updated': event.get('updated')})
+        except HttpError as error:
+            estado['estado'] = 'no_existe' if _es_evento_inexistente(error) else 'error'
+            if estado['estado'] == 'error':
+                estado['detalle'] = str(error)
+        resultado[calendar_id] = estado
+    return resultado
+
+
 def _adaptar_item_monday_a_evento_google(item_procesado, board_id=None):
     """
     Adapta un item de Monday.com al formato de evento de Google Calendar.
@@ -365,7 +694,7 @@ def _adaptar_item_monday_a_evento_google(item_procesado, board_id=None):
                     }
                     
             except Exception as e:
-                print(f"⚠️  Error parseando fecha '{fecha_inicio_str}': {e}")
+                logger.warning("Error parseando fecha '%s': %s", fecha_inicio_str, e)
                 # Fecha por defecto
                 fecha_inicio = datetime.now() + timedelta(days=1)
                 fecha_fin = fecha_inicio + timedelta(hours=2)
@@ -394,6 +723,8 @@ def _adaptar_item_monday_a_evento_google(item_procesado, board_id=None):
                     'read_only': 'true'
                 }
             },
+            # Un evento borrado a mano en Google vuelve a aparecer al re-sincronizar
+            'status': 'confirmed',
             # Marcar como solo lectura para prevenir ediciones manuales
             'transparency': 'opaque',
             'visibility': 'default',
@@ -405,74 +736,88 @@ def _adaptar_item_monday_a_evento_google(item_procesado, board_id=None):
         return event_body
         
     except Exception as e:
-        print(f"❌ Error adaptando item Monday a evento Google: {e}")
+        logger.error("Error adaptando item Monday a evento Google: %s", e)
         return None
 
 
-def sincronizar_item_via_webhook(item_id, monday_handler, google_service=None, change_uuid=None):
+def sincronizar_item_via_webhook(item_id, monday_handler, google_service=None, change_uuid=None, defer_retries=False,
+                                 context=None):
     """
     Sincroniza un item específico de Monday.com con Google Calendar.
     Versión limpia y simplificada para sistema unidireccional.
     
+    Las sincronizaciones de un mismo item se serializan (ver item_locks): dos hilos
+    no pueden decidir a la vez que el evento no existe y crearlo dos veces. Las de
+    items distintos se ejecutan en paralelo.
+    
     Args:
         item_id (int): ID del item de Monday.com a sincronizar
         monday_handler: Instancia de MondayAPIHandler ya inicializada
         google_service: Instancia del servicio de Google Calendar
         change_uuid (str): UUID único del cambio (opcional)
+        defer_retries (bool): Si es True, los errores transitorios de Google no se reintentan
+            aquí sino que se propagan como RetryableError para el planificador de reintentos
+        context (ItemSyncContext): Contexto ya cargado por el llamador; si se pasa,
+            no se vuelve a consultar el item en Monday
         
     Returns:
         bool: True si la sincronización fue exitosa, False en caso contrario
+        
+    Raises:
+        RetryableError: Fallo transitorio de Monday o Google (solo en modo no bloqueante)
     """
-    print(f"⚡ INICIANDO SINCRONIZACIÓN WEBHOOK - Item {item_id}")
-    print("=" * 50)
+    with item_locks.hold(item_id), contexto_log(item_id=str(item_id), change_uuid=change_uuid, stage='sync'):
+        return _sincronizar_item(item_id, monday_handler, google_service, change_uuid, defer_retries, context)
+
+
+def _sincronizar_item(item_id, monday_handler, google_service, change_uuid, defer_retries, context):
+    """Cuerpo de sincronizar_item_via_webhook, con el lock del item ya tomado."""
+    logger.info("Iniciando sincronización del item %s", item_id)
     
     try:
         # 1. Verificar parámetros de entrada
         if not item_id:
-            print("❌ Error: item_id no proporcionado")
+            logger.error("Error: item_id no proporcionado")
             return False
             
         # 2. Verificar servicios
         if not google_service:
-            print("❌ Error: google_service no disponible")
+            logger.error("Error: google_service no disponible")
             return False
             
         if not monday_handler:
-            print("❌ Error: monday_handler no disponible")
+            logger.error("Error: monday_handler no disponible")
             return False
         
-        # 2. Obtener datos del item
-        print(f"📋 Obteniendo datos del item {item_id}...")
-        
-        try:
-            item_data = monday_handler.get_item_by_id(
-                board_id=str(config.BOARD_ID_GRABACIONES),
-                item_id=str(item_id),
-                column_ids=[config.COL_GOOGLE_EVENT_ID, config.COL_FECHA, "personas1", "name", config.COL_CLIENTE, "ubicaci_n"]
-            )
+        # 2. Obtener datos del item (solo si el llamador no trae ya el contexto)
+        if context is None or context.item_procesado is None:
+            marcar_etapa('monday_read')
+            logger.debug("Obteniendo datos del item %s...", item_id)
             
-            if not item_data:
-                print(f"❌ No se pudo obtener datos del item {item_id}")
-                return False
+            try:
+                context = cargar_contexto_item(item_id, monday_handler, change_uuid=change_uuid)
                 
-        except Exception as e:
-            print(f"❌ Error obteniendo item {item_id}: {e}")
-            return False
+                if not context:
+                    logger.error("No se pudo obtener datos del item %s", item_id)
+                    return False
+                    
+            except RetryableError:
+                raise
+            except Exception as e:
+                logger.error("Error obteniendo item %s: %s", item_id, e)
+                return False
         
-        # 3. Procesar item
-        item_procesado = parse_monday_item(item_data)
-        if not item_procesado:
-            print(f"❌ Error procesando item {item_id}")
-            return False
+        # 3. Item ya procesado en el contexto
+        item_procesado = context.item_procesado
         
         # 4. Verificar que tiene fecha
         if not item_procesado.get('fecha_inicio'):
-            print(f"⚠️  Item {item_id} no tiene fecha asignada")
+            logger.warning("Item %s no tiene fecha asignada", item_id)
             return False
         
         # 4.1 Verificar que tiene nombre
         if not item_procesado.get('name'):
-            print(f"⚠️  Item {item_id} no tiene nombre")
+            logger.warning("Item %s no tiene nombre", item_id)
             return False
         
         # 4.2 Verificar que la fecha es válida (permitir fechas pasadas para testing)
@@ -487,181 +832,276 @@ def sincronizar_item_via_webhook(item_id, monday_handler, google_service=None, c
                 # Solo validar que la fecha no sea muy antigua (más de 1 año)
                 fecha_limite = datetime.now() - timedelta(days=365)
                 if fecha < fecha_limite:
-                    print(f"⚠️  Item {item_id} tiene fecha muy antigua: {fecha_str}")
+                    logger.warning("Item %s tiene fecha muy antigua: %s", item_id, fecha_str)
                     return False
         except Exception as e:
-            print(f"⚠️  Error validando fecha del item {item_id}: {e}")
+            logger.warning("Error validando fecha del item %s: %s", item_id, e)
             return False
         
-        # 5. Generar hash para detección de cambios
-        monday_content_hash = generate_content_hash(item_procesado)
-        print(f"📊 Hash del contenido: {monday_content_hash[:16]}...")
+        # 5. Hash para detección de cambios (el mismo que usó app.py para el eco)
+        monday_content_hash = context.content_hash
+        logger.debug("Hash del contenido: %s...", monday_content_hash[:16])
         
         # 6. Sincronizar con Google
+        marcar_etapa('google_write')
         google_event_id = item_procesado.get('google_event_id')
         
         # Adaptar datos de Monday a formato de Google
         event_body = _adaptar_item_monday_a_evento_google(item_procesado, config.BOARD_ID_GRABACIONES)
         
         if not event_body:
-            print(f"❌ Error adaptando datos para Google")
+            logger.error("Error adaptando datos para Google")
             return False
         
-        if google_event_id:
+        personal_calendar_ids = _get_personal_calendar_ids_for_item(item_procesado)
+        monday_item_id = str(item_procesado.get('id', ''))
+        huella = fingerprint_evento(event_body)
+
+        # Sin ID en Monday el evento puede existir igualmente (un insert anterior que falló
+        # con 5xx después de aplicarse, o un ID que no se llegó a guardar): buscarlo antes de crear.
+        # También con IDs deterministas: el evento pudo crearse antes con un ID asignado por Google,
+        # y un insert con el ID calculado lo duplicaría (la búsqueda mira primero el índice)
+        if not google_event_id:
+            try:
+                google_event_id = _resolver_evento_en_calendario(
+                    google_service, config.MASTER_CALENDAR_ID, monday_item_id
+                )
+            except Exception as e:
+                if defer_retries and _es_error_transitorio(e):
+                    raise _como_error_reintentable(e, "buscar evento maestro")
+                logger.warning("No se pudo comprobar si el evento ya existe: %s", e)
+            if google_event_id:
+                logger.debug("El item ya tenía evento en Google: %s", google_event_id)
+                # El resto del pipeline debe ver el mismo ID, no el determinista
+                context.event_id_resuelto = google_event_id
+        
+        # Con IDs deterministas cada evento se calcula y los inserts son idempotentes.
+        # Los items antiguos, con un ID asignado por Google, siguen el camino clásico
+        usar_ids_deterministas = config.DETERMINISTIC_EVENT_IDS and (
+            not google_event_id or es_event_id_determinista(google_event_id)
+        )
+        
+        # Todas las escrituras del item (maestro + calendarios personales) viajan en un único batch HTTP
+        operations = []
+        if usar_ids_deterministas:
+            google_event_id = _event_id_determinista(monday_item_id, config.MASTER_CALENDAR_ID)
+            logger.info("Evento con ID determinista: %s", google_event_id)
+            for calendar_id in [config.MASTER_CALENDAR_ID] + personal_calendar_ids:
+                operations.append(
+                    _operacion_escribir_evento_determinista(monday_item_id, calendar_id, event_body, huella)
+                )
+        elif google_event_id:
             # Actualizar evento existente
-            print(f"🔄 Actualizando evento existente: {google_event_id}")
-            
-            success = update_google_event(
-                google_service, 
-                config.MASTER_CALENDAR_ID, 
-                google_event_id, 
-                event_body
+            logger.info("Actualizando evento existente: %s", google_event_id)
+            operations.append(
+                _operacion_actualizar_evento(
+                    monday_item_id, config.MASTER_CALENDAR_ID, google_event_id, event_body, huella
+                )
             )
             
-            if success:
-                print(f"✅ Evento actualizado exitosamente")
-                
-                # También actualizar en calendarios personales si existen
-                personal_calendar_ids = _get_personal_calendar_ids_for_item(item_procesado)
-                if personal_calendar_ids:
-                    try:
-                        print(f"👤 Verificando eventos personales para actualización...")
-                        monday_item_id = str(item_procesado.get('id', ''))
-                        
-                        if monday_item_id:
-                            # Actualizar eventos en todos los calendarios personales
-                            for personal_calendar_id in personal_calendar_ids:
-                                try:
-                                    print(f"🔄 Procesando calendario personal: {personal_calendar_id}")
-                                    
-                                    # Listar eventos del calendario personal
-                                    events_result = google_service.events().list(
-                                        calendarId=personal_calendar_id,
-                                        maxResults=50,
-                                        singleEvents=True
-                                    ).execute()
-                                    
-                                    events = events_result.get('items', [])
-                                    personal_event_id = None
-                                    
-                                    # Buscar el evento que tenga el mismo monday_item_id en extendedProperties
-                                    for event in events:
-                                        extended_props = event.get('extendedProperties', {}).get('private', {})
-                                        if extended_props.get('monday_item_id') == monday_item_id:
-                                            personal_event_id = event.get('id')
-                                            print(f"🔍 Encontrado evento personal con ID: {personal_event_id}")
-                                            break
-                                    
-                                    if personal_event_id:
-                                        print(f"🔄 Actualizando evento personal: {personal_event_id}")
-                                        update_success = update_google_event(
-                                            google_service,
-                                            personal_calendar_id,
-                                            personal_event_id,
-                                            event_body
-                                        )
-                                        if update_success:
-                                            print(f"✅ Evento personal actualizado correctamente")
-                                        else:
-                                            print(f"⚠️  Error actualizando evento personal")
-                                    else:
-                                        print(f"ℹ️  No se encontró evento personal en este calendario")
-                                        print(f"ℹ️  Esto puede ser normal si es la primera sincronización")
-                                        
-                                except Exception as calendar_error:
-                                    print(f"⚠️  Error procesando calendario {personal_calendar_id}: {calendar_error}")
-                        else:
-                            print(f"⚠️  No se puede buscar evento personal sin monday_item_id")
-                    except Exception as e:
-                        print(f"⚠️  Error actualizando eventos personales: {e}")
+            # También actualizar en calendarios personales si existen
+            if personal_calendar_ids:
+                logger.debug("Verificando eventos personales para actualización...")
+            for personal_calendar_id in personal_calendar_ids:
+                try:
+                    logger.debug("Procesando calendario personal: %s", personal_calendar_id)
+                    personal_event_id = _resolver_evento_en_calendario(google_service, personal_calendar_id, monday_item_id)
+                    
+                    if personal_event_id:
+                        operations.append(
+                            _operacion_actualizar_evento(
+                                monday_item_id, personal_calendar_id, personal_event_id, event_body, huella
+                            )
+                        )
+                    else:
+                        # Operario nuevo en el item (o copia nunca creada): crear su copia
+                        logger.info("No hay evento personal en este calendario, se creará")
+                        operations.append({
+                            'key': personal_calendar_id,
+                            'method': 'insert',
+                            'calendar_id': personal_calendar_id,
+                            'body': event_body
+                        })
+                except Exception as calendar_error:
+                    logger.warning("Error procesando calendario %s: %s", personal_calendar_id, calendar_error)
+        else:
+            # Crear nuevo evento (maestro y, si hay operarios configurados, copias personales)
+            logger.info("Creando nuevo evento en Google Calendar")
+            operations.append({
+                'key': config.MASTER_CALENDAR_ID,
+                'method': 'insert',
+                'calendar_id': config.MASTER_CALENDAR_ID,
+                'body': event_body
+            })
+            if personal_calendar_ids:
+                logger.info("Creando eventos en %s calendarios personales", len(personal_calendar_ids))
             else:
-                print(f"❌ Error actualizando evento")
-                return False
-                
+                logger.info("No hay calendarios personales configurados para estos operarios")
+            for personal_calendar_id in personal_calendar_ids:
+                operations.append({
+                    'key': personal_calendar_id,
+                    'method': 'insert',
+                    'calendar_id': personal_calendar_id,
+                    'body': event_body
+                })
+        
+        # Las escrituras cuyo render coincide con lo ya escrito no se envían
+        escrituras = [op for op in operations if not op.get('omitir')]
+        for operation in operations:
+            registrar_cache('event_fingerprint', bool(operation.get('omitir')))
+        resultados = _ejecutar_escrituras(google_service, escrituras, defer_retries)
+        for operation in operations:
+            if operation.get('omitir'):
+                resultados[operation['key']] = {
+                    'ok': True, 'response': None, 'error': None, 'retryable': False, 'omitida': True
+                }
+        
+        # Conflicto de ETag (412): el evento se editó a mano en Google. Monday manda: se restaura completo
+        conflictos = [op for op in escrituras if es_conflicto_etag(resultados.get(op['key'], {}).get('error'))]
+        if conflictos:
+            for operation in conflictos:
+                logger.info("Evento %s editado manualmente en %s..., se restaura desde Monday", operation['event_id'], operation['calendar_id'][:20])
+            restauraciones = [dict(op, method='update', body=event_body, etag=None) for op in conflictos]
+        else:
+            restauraciones = []
+
+        # Insert con ID determinista que responde 409: el evento ya existe (un insert anterior que
+        # sí se aplicó, o una copia borrada que Google conserva cancelada). Se sobrescribe completo
+        existentes = [
+            op for op in escrituras
+            if op['method'] == 'insert' and op.get('event_id')
+            and resultados.get(op['key'], {}).get('clase') == ERROR_CONFLICTO
+        ]
+        for operation in existentes:
+            logger.info("El evento %s ya existía en %s..., se actualiza", operation['event_id'], operation['calendar_id'][:20])
+            restauraciones.append(dict(operation, method='update', body=event_body))
+        if restauraciones:
+            resultados.update(_ejecutar_escrituras(google_service, restauraciones, defer_retries))
+        
+        # Restauradas: las reescritas por un conflicto de ETag o por un insert que ya existía
+        context.escrituras = {
+            'enviadas': len(escrituras),
+            'omitidas': len(operations) - len(escrituras),
+            'restauradas': len(restauraciones)
+        }
+        logger.info("Escrituras en Google: %s enviadas, %s omitidas sin cambios", context.escrituras['enviadas'], context.escrituras['omitidas'])
+        
+        # Resultado del evento maestro
+        master_result = resultados.get(config.MASTER_CALENDAR_ID, {})
+        if not master_result.get('ok'):
+            # Un insert sin ID propio con 5xx/red no se repite en el batch, pero sí en diferido: el
+            # reintento busca el evento antes de crearlo (o usa el ID determinista), así que no se duplica
+            if defer_retries and (master_result.get('retryable') or master_result.get('clase') in (ERROR_SERVIDOR, ERROR_RED)):
+                raise _como_error_reintentable(master_result['error'], "batch evento maestro")
+            if usar_ids_deterministas and _es_evento_inexistente(master_result.get('error')):
+                # El índice apuntaba a un evento que ya no existe: el próximo sync lo vuelve a insertar
+                event_index.remove(monday_item_id, config.MASTER_CALENDAR_ID)
+            logger.error("Error %s evento en calendario master", 'creando' if operations[0]['method'] == 'insert' else 'actualizando')
+            return False
+        
+        if master_result.get('omitida'):
+            logger.info("Evento maestro ya al día")
+        elif google_event_id:
+            logger.info("Evento %s exitosamente", 'creado' if operations[0]['method'] == 'insert' else 'actualizado')
+            event_index.set_event(
+                monday_item_id, config.MASTER_CALENDAR_ID, google_event_id, body=event_body, fingerprint=huella,
+                etag=(master_result.get('response') or {}).get('etag')
+            )
         else:
-            # Crear nuevo evento
-            print(f"🆕 Creando nuevo evento en Google Calendar")
+            new_event_id = (master_result.get('response') or {}).get('id')
+            if not new_event_id or not new_event_id.strip():
+                logger.error("Error creando evento - no se recibió ID válido")
+                return False
             
+            logger.info("Evento creado: %s", new_event_id)
+            google_event_id = new_event_id
+            event_index.set_event(
+                monday_item_id, config.MASTER_CALENDAR_ID, new_event_id, body=event_body, fingerprint=huella,
+                etag=master_result['response'].get('etag')
+            )
+        
+        # Guardar el ID en Monday si no lo tenía (evento recién creado o encontrado en Google).
+        # Con IDs deterministas es opcional: el ID se puede calcular a partir del item
+        if not item_procesado.get('google_event_id') and (config.WRITE_EVENT_ID_TO_MONDAY or not usar_ids_deterministas):
+            marcar_etapa('monday_writeback')
             try:
-                new_event_id = create_google_event(
-                    google_service,
-                    config.MASTER_CALENDAR_ID,
-                    event_body
+                update_success = monday_handler.update_column_value(
+                    item_procesado['id'], 
+                    config.BOARD_ID_GRABACIONES, 
+                    config.COL_GOOGLE_EVENT_ID, 
+                    google_event_id,
+                    'text'
                 )
             except Exception as e:
-                print(f"❌ Error creando evento en calendario master: {e}")
-                return False
+                logger.error("Error guardando ID en Monday: %s", e)
+                update_success = False
             
-            if new_event_id and new_event_id.strip():
-                print(f"✅ Evento creado: {new_event_id}")
-                google_event_id = new_event_id
-                
-                # Guardar el ID en Monday
-                try:
-                    update_success = monday_handler.update_column_value(
-                        item_procesado['id'], 
-                        config.BOARD_ID_GRABACIONES, 
-                        config.COL_GOOGLE_EVENT_ID, 
-                        new_event_id,
-                        'text'
+            if update_success:
+                logger.info("ID guardado en Monday.com")
+            else:
+                logger.warning("Evento creado pero no se pudo guardar ID en Monday")
+                # Continuar de todas formas, el evento ya existe en Google
+        
+        # Resultados de los calendarios personales
+        marcar_etapa('google_write')
+        fallo_transitorio_personal = None
+        for operation in operations[1:]:
+            personal_result = resultados.get(operation['key'], {})
+            if personal_result.get('omitida'):
+                logger.info("Evento personal ya al día en %s...", operation['calendar_id'][:20])
+            elif personal_result.get('ok'):
+                personal_event_id = (personal_result.get('response') or {}).get('id') or operation.get('event_id')
+                accion = 'creado en calendario personal' if operation['method'] == 'insert' else 'actualizado'
+                logger.info("Evento personal %s: %s", accion, personal_event_id)
+                if personal_event_id:
+                    # Guardar el cuerpo completo escrito: es la base del próximo parche
+                    event_index.set_event(
+                        monday_item_id, operation['calendar_id'], personal_event_id, body=event_body, fingerprint=huella,
+                        etag=(personal_result.get('response') or {}).get('etag')
                     )
-                except Exception as e:
-                    print(f"❌ Error guardando ID en Monday: {e}")
-                    update_success = False
-                
-                if update_success:
-                    print(f"💾 ID guardado en Monday.com")
-                else:
-                    print(f"⚠️  Evento creado pero no se pudo guardar ID en Monday")
-                    # Continuar de todas formas, el evento ya existe en Google
-
-                # Intentar crear también en calendarios personales (si hay operarios configurados)
-                print(f"🔍 Debug: Verificando calendarios personales para operarios...")
-                personal_calendar_ids = _get_personal_calendar_ids_for_item(item_procesado)
-                if personal_calendar_ids:
-                    print(f"👤 Creando eventos en {len(personal_calendar_ids)} calendarios personales")
-                    for personal_calendar_id in personal_calendar_ids:
-                        try:
-                            print(f"👤 Creando evento en calendario personal: {personal_calendar_id}")
-                            personal_event_id = create_google_event(
-                                google_service,
-                                personal_calendar_id,
-                                event_body
-                            )
-                            if personal_event_id:
-                                print(f"✅ Evento creado en calendario personal: {personal_event_id}")
-                            else:
-                                print("⚠️  No se pudo crear el evento personal (sin ID)")
-                        except Exception as e:
-                            print(f"⚠️  Error creando evento personal en {personal_calendar_id}: {e}")
-                else:
-                    print("ℹ️  No hay calendarios personales configurados para estos operarios")
+            elif _es_evento_inexistente(personal_result.get('error')):
+                # La entrada del índice apunta a un evento borrado: se olvida y el próximo sync lo recrea
+                logger.warning("El evento personal indexado en %s ya no existe, se elimina del índice", operation['calendar_id'])
+                event_index.remove(monday_item_id, operation['calendar_id'])
             else:
-                print(f"❌ Error creando evento - no se recibió ID válido")
-                return False
+                logger.warning("Error en evento personal de %s: %s", operation['calendar_id'], personal_result.get('error'))
+                # Como en el maestro: el reintento resuelve la copia antes de insertar
+                if personal_result.get('retryable') or personal_result.get('clase') in (ERROR_SERVIDOR, ERROR_RED):
+                    fallo_transitorio_personal = personal_result['error']
         
         # 7. Actualizar estado de sincronización
         if google_event_id:
+            marcar_etapa('sync_state')
             try:
-                update_sync_state(
-                    item_id=str(item_id),
-                    event_id=google_event_id,
-                    monday_content_hash=monday_content_hash,
-                    sync_direction="monday_to_google",
-                    monday_update_time=time.time()
-                )
-                print(f"📊 Estado de sincronización actualizado")
+                with medir_etapa('sync_state'):
+                    update_sync_state(
+                        item_id=str(item_id),
+                        event_id=google_event_id,
+                        monday_content_hash=monday_content_hash,
+                        sync_direction="monday_to_google",
+                        monday_update_time=time.time()
+                    )
+                logger.debug("Estado de sincronización actualizado")
             except Exception as e:
-                print(f"⚠️  Error actualizando estado de sincronización: {e}")
+                logger.warning("Error actualizando estado de sincronización: %s", e)
                 # No fallar la sincronización por un error en el estado
         
-        print(f"🎉 SINCRONIZACIÓN COMPLETADA para '{item_procesado['name']}'")
+        # Las copias personales con fallo transitorio se completan en un reintento diferido
+        if fallo_transitorio_personal is not None and defer_retries:
+            raise _como_error_reintentable(fallo_transitorio_personal, "batch eventos personales")
+        
+        # El estado que acabamos de escribir es la base para aplicar los próximos webhooks
+        if google_event_id:
+            item_procesado['google_event_id'] = google_event_id
+        guardar_snapshot_item(item_procesado)
+        
+        logger.info("Sincronización completada para '%s'", item_procesado['name'])
         return True
         
+    except RetryableError:
+        raise
     except Exception as e:
-        print(f"❌ Error inesperado en sincronización: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error inesperado en sincronización: %s", e)
         return False
 
 
@@ -672,9 +1112,15 @@ def sincronizar_item_via_webhook(item_id, monday_handler, google_service=None, c
 def _obtener_item_id_por_google_event_id(google_event_id, monday_handler):
     """
     Busca un item de Monday.com por su Google Event ID.
+
+    Los IDs deterministas llevan el item codificado y no necesitan consultar Monday.
     """
+    decodificado = decodificar_event_id(google_event_id)
+    if decodificado and decodificado[0] == str(config.BOARD_ID_GRABACIONES):
+        return decodificado[1]
+
     try:
-        print(f"🔍 Buscando item con Google Event ID: {google_event_id}")
+        logger.debug("Buscando item con Google Event ID: %s", google_event_id)
         
         query = f"""
         query {{
@@ -696,7 +1142,7 @@ def _obtener_item_id_por_google_event_id(google_event_id, monday_handler):
         response_data = response.json()
         
         if 'errors' in response_data:
-            print(f"❌ Error buscando item: {response_data['errors']}")
+            logger.error("Error buscando item: %s", response_data['errors'])
             return None
         
         items = response_data.get('data', {}).get('items', [])
@@ -707,74 +1153,148 @@ def _obtener_item_id_por_google_event_id(google_event_id, monday_handler):
                 if col.get('id') == config.COL_GOOGLE_EVENT_ID:
                     if col.get('text') == google_event_id:
                         item_id = item.get('id')
-                        print(f"✅ Item encontrado: {item_id}")
+                        logger.info("Item encontrado: %s", item_id)
                         return item_id
         
-        print(f"❌ No se encontró item con Google Event ID: {google_event_id}")
+        logger.warning("No se encontró item con Google Event ID: %s", google_event_id)
         return None
         
     except Exception as e:
-        print(f"❌ Error buscando item por Google Event ID: {e}")
+        logger.error("Error buscando item por Google Event ID: %s", e)
         return None
 
 
-def _detectar_cambio_de_automatizacion(item_id, monday_handler):
+# Caché por item de las automatizaciones detectadas: {item_id: (True, timestamp)}
+# Vive config.AUTOMATION_DETECTION_WINDOW segundos, la misma ventana que usa la detección;
+# cada escritura purga las entradas caducadas para que no crezca con cada item visto.
+# Los negativos no se guardan: un cambio de la automatización justo después no se vería
+_automation_cache = {}
+_automation_cache_lock = threading.Lock()
+
+
+def _guardar_automatizacion(item_key):
+    """Anota una automatización detectada y purga las entradas que ya salieron de la ventana."""
+    ahora = time.time()
+    with _automation_cache_lock:
+        caducadas = [clave for clave, (_, creado) in _automation_cache.items()
+                     if ahora - creado >= config.AUTOMATION_DETECTION_WINDOW]
+        for clave in caducadas:
+            del _automation_cache[clave]
+        _automation_cache[item_key] = (True, ahora)
+
+
+def _extraer_user_id_webhook(event_data):
+    """Obtiene el userId del autor del cambio desde el payload del webhook, si viene."""
+    if not event_data:
+        return None
+    event = event_data.get('event', event_data)
+    user_id = event.get('userId')
+    try:
+        return int(user_id) if user_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _es_automatizacion_por_updates(updates):
+    """
+    Evalúa las actualizaciones recientes de un item.
+    
+    Es automatización si alguna de las 3 más recientes, creada dentro de
+    config.AUTOMATION_DETECTION_WINDOW, la hizo config.AUTOMATION_USER_ID
+    (o un creador que no es una persona, si la respuesta incluye 'kind').
+    """
+    ahora = datetime.utcnow()
+    for update in updates[:3]:  # Solo las 3 más recientes
+        created_at = update.get('created_at')
+        if created_at:
+            try:
+                creado = datetime.fromisoformat(created_at.replace('Z', '+00:00')).replace(tzinfo=None)
+                if (ahora - creado).total_seconds() > config.AUTOMATION_DETECTION_WINDOW:
+                    continue
+            except ValueError:
+                pass
+        
+        creator_id = update.get('creator_id') or (update.get('creator') or {}).get('id')
+        creator_kind = (update.get('creator') or {}).get('kind')
+        if creator_id and str(creator_id) == str(config.AUTOMATION_USER_ID):
+            logger.info("Cambio de automatización detectado: update de %s", config.AUTOMATION_USER_NAME)
+            return True
+        if creator_kind and creator_kind != 'person':
+            logger.info("Cambio de automatización detectado: %s", creator_kind)
+            return True
+    
+    return False
+
+
+@medir_etapa('automation_check')
+def _detectar_cambio_de_automatizacion(item_id, monday_handler, event_data=None, item_data=None):
     """
     Detecta si un cambio fue realizado por una automatización de Monday.
     
+    Usa primero los datos que ya tenemos, por orden de coste:
+    1. El userId del payload del webhook (comparado con config.AUTOMATION_USER_ID)
+    2. La caché por item de automatizaciones detectadas (config.AUTOMATION_DETECTION_WINDOW segundos)
+    3. Las 'updates' incluidas en el item ya obtenido (get_item_by_id con updates_limit)
+    4. Solo como último recurso, una query de updates a Monday
+    
     Args:
         item_id: ID del item a verificar
         monday_handler: Handler de Monday API
+        event_data: Payload del webhook (opcional)
+        item_data: Item de Monday ya obtenido, con 'updates' si se pidieron (opcional)
         
     Returns:
         bool: True si fue un cambio de automatización
     """
     try:
-        # Obtener actualizaciones recientes del item
-        query = f"""
-        query {{
-            items(ids: [{item_id}]) {{
-                updates(limit: 5) {{
-                    id
-                    body
-                    creator {{
-                        id
-                        name
-                        kind
-                    }}
-                    created_at
-                }}
-            }}
-        }}
-        """
-        
-        data = {'query': query}
-        response = requests.post(url=monday_handler.API_URL, json=data, headers=monday_handler.HEADERS)
-        response.raise_for_status()
-        response_data = response.json()
-        
-        if 'errors' in response_data:
-            return False
+        item_key = str(item_id)
         
-        items = response_data.get('data', {}).get('items', [])
-        if not items:
-            return False
+        # 1. El payload dice quién hizo el cambio: coste cero
+        user_id = _extraer_user_id_webhook(event_data)
+        if user_id is not None:
+            es_automatizacion = user_id == config.AUTOMATION_USER_ID
+            if es_automatizacion:
+                logger.info("Cambio de automatización detectado: userId %s (%s)", user_id, config.AUTOMATION_USER_NAME)
+            return es_automatizacion
         
-        updates = items[0].get('updates', [])
+        # 2. Resultado reciente para este item
+        with _automation_cache_lock:
+            cached = _automation_cache.get(item_key)
+            vigente = cached is not None and (time.time() - cached[1]) < config.AUTOMATION_DETECTION_WINDOW
+            if cached is not None and not vigente:
+                del _automation_cache[item_key]
+        registrar_cache('automation', vigente)
+        if vigente:
+            return cached[0]
         
-        # Verificar las últimas actualizaciones
-        for update in updates[:3]:  # Solo las 3 más recientes
-            creator = update.get('creator', {})
-            creator_kind = creator.get('kind', '')
-            
-            # Si el creador es del tipo 'person' es un usuario real
-            # Si es otro tipo puede ser automatización
-            if creator_kind != 'person':
-                print(f"🤖 Cambio de automatización detectado: {creator_kind}")
-                return True
+        # 3. Updates ya incluidas en el item; 4. si no, pedirlas
+        if item_data is not None and 'updates' in item_data:
+            updates = item_data.get('updates') or []
+        else:
+            query = """
+            query($itemId: [ID!]!) {
+                items(ids: $itemId) {
+                    updates(limit: %d) {
+                        id
+                        created_at
+                        creator_id
+                    }
+                }
+            }
+            """ % AUTOMATION_UPDATES_LIMIT
+            response_data = monday_handler._make_request(query, {'itemId': item_key})
+            items = (response_data or {}).get('data', {}).get('items', [])
+            if not items:
+                return False
+            updates = items[0].get('updates') or []
         
-        return False
+        es_automatizacion = _es_automatizacion_por_updates(updates)
+        if es_automatizacion:
+            _guardar_automatizacion(item_key)
+        return es_automatizacion
         
+    except RetryableError:
+        raise
     except Exception as e:
-        print(f"⚠️  Error detectando cambio de automatización: {e}")
-        return False
\ No newline at end of file
+        logger.warning("Error detectando cambio de automatización: %s", e)
+        return False
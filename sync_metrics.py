@@ -0,0 +1,463 @@
+"""
+Sync Metrics - Métricas del proceso en formato texto de Prometheus
+==================================================================
+
+Instrumentación en proceso, con coste de microsegundos por medida, para saber
+dónde se va el tiempo de cada webhook y cuánto trabajo cuesta en Monday y Google:
+
+- `sync_stage_duration_seconds{stage}`: histograma por etapa (ver `medir_etapa`)
+- `sync_monday_requests_total{operation,outcome}` y
+  `sync_google_requests_total{operation,outcome}`: llamadas a las APIs
+- `sync_google_batch_parts_total{method,outcome}`: partes de los batch de escritura
+- `sync_retries_total{component,reason}` y `sync_throttles_total{component,reason}`
+- `sync_cache_requests_total{cache,result}` y su ratio `sync_cache_hit_ratio{cache}`
+- Profundidad de las colas, leída al servir /metrics (sin coste en el camino crítico)
+
+Los contadores e histogramas viven en memoria. Con varios procesos (gunicorn)
+cada worker vuelca los suyos a `config.METRICS_DIR` cada
+`config.METRICS_FLUSH_SECONDS` y /metrics devuelve la suma de todos, sea cual
+sea el worker que atienda la petición.
+"""
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import config
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Etiquetas = Tuple[str, ...]
+
+
+def _escapar(valor: Any) -> str:
+    """Escapa un valor de etiqueta para el formato de texto."""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(nombres: Sequence[str], valores: Sequence[Any]) -> str:
+    if not nombres:
+        return ''
+    return '{' + ','.join(f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)) + '}'
+
+
+def _formatear_numero(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+class Counter:
+    """Contador monótono con etiquetas."""
+
+    tipo = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._valores: Dict[Etiquetas, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Suma `amount` a la serie de las etiquetas dadas (en el orden de labelnames)."""
+        with self._lock:
+            self._valores[labels] = self._valores.get(labels, 0) + amount
+
+    def volcar(self) -> List[list]:
+        with self._lock:
+            return [[list(labels), valor] for labels, valor in self._valores.items()]
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._valores.clear()
+
+
+class Histogram:
+    """Histograma con buckets fijos y etiquetas."""
+
+    tipo = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = config.METRICS_STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._valores: Dict[Etiquetas, list] = {}  # {etiquetas: [conteos por bucket (+Inf al final), suma]}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Registra una observación en la serie de las etiquetas dadas."""
+        indice = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._valores.get(labels)
+            if serie is None:
+                serie = self._valores[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += value
+
+    def volcar(self) -> List[list]:
+        with self._lock:
+            return [[list(labels), list(conteos), suma] for labels, (conteos, suma) in self._valores.items()]
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._valores.clear()
+
+
+class _Gauge:
+    """Valor que se calcula al exportar, con una función que devuelve un número o {etiquetas: valor}."""
+
+    tipo = 'gauge'
+
+    def __init__(self, name: str, documentation: str, funcion: Callable[[], Any],
+                 labelnames: Sequence[str] = (), compartida: bool = False):
+        self.name = name
+        self.documentation = documentation
+        self.funcion = funcion
+        self.labelnames = tuple(labelnames)
+        # Compartida: el valor es el mismo en todos los procesos (p. ej. la cola SQLite) y no se suma
+        self.compartida = compartida
+
+    def volcar(self) -> List[list]:
+        try:
+            valor = self.funcion()
+        except Exception as e:
+            logger.debug("No se pudo calcular la métrica %s: %s", self.name, e)
+            return []
+        if isinstance(valor, dict):
+            return [[list(k) if isinstance(k, tuple) else [k], v] for k, v in valor.items() if v is not None]
+        return [[[], valor]] if valor is not None else []
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso y su exportación (sumando las de otros procesos).
+    """
+
+    def __init__(self):
+        self._metricas: Dict[str, Any] = {}
+        self._derivadas: List[Tuple[str, str, Sequence[str], Callable]] = []
+        self._lock = threading.Lock()
+        self.directorio: Optional[Path] = None
+        self._hilo: Optional[threading.Thread] = None
+
+    def _registrar(self, metrica: Any) -> Any:
+        with self._lock:
+            if metrica.name in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.name}")
+            self._metricas[metrica.name] = metrica
+        return metrica
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._registrar(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = config.METRICS_STAGE_BUCKETS) -> Histogram:
+        return self._registrar(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, funcion: Callable[[], Any],
+              labelnames: Sequence[str] = (), compartida: bool = False) -> None:
+        """
+        Registra un gauge calculado al exportar (si ya existe uno con ese nombre, lo sustituye).
+
+        Args:
+            funcion: Devuelve un número, o {valor_etiqueta | tupla_etiquetas: número}
+            compartida: True si todos los procesos leen el mismo valor (no se suma entre procesos)
+        """
+        with self._lock:
+            self._metricas.pop(name, None)
+        self._registrar(_Gauge(name, documentation, funcion, labelnames, compartida))
+
+    def derivada(self, name: str, documentation: str, labelnames: Sequence[str],
+                 funcion: Callable[[Dict[str, List[list]]], Dict[Any, float]]) -> None:
+        """Gauge calculado a partir de los valores ya sumados entre procesos (p. ej. un ratio)."""
+        self._derivadas.append((name, documentation, tuple(labelnames), funcion))
+
+    # --- Varios procesos ---
+
+    def iniciar_multiproceso(self, directorio: str = config.METRICS_DIR,
+                             intervalo: float = config.METRICS_FLUSH_SECONDS) -> None:
+        """
+        Vuelca periódicamente las métricas de este proceso para que cualquier worker pueda exportar la suma.
+
+        Se llama tras el fork: los valores heredados del proceso padre se descartan.
+        """
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        for metrica in list(self._metricas.values()):
+            if hasattr(metrica, 'reiniciar'):
+                metrica.reiniciar()
+        self._hilo = threading.Thread(target=self._bucle_volcado, args=(intervalo,),
+                                      name='metrics-flush', daemon=True)
+        self._hilo.start()
+
+    def _bucle_volcado(self, intervalo: float) -> None:
+        while True:
+            time.sleep(intervalo)
+            self.guardar()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """Valores actuales de este proceso (los gauges compartidos no se incluyen)."""
+        return {
+            nombre: metrica.volcar()
+            for nombre, metrica in list(self._metricas.items())
+            if not getattr(metrica, 'compartida', False)
+        }
+
+    def guardar(self) -> None:
+        """Escribe las métricas de este proceso en su archivo (escritura atómica)."""
+        if not self.directorio:
+            return
+        archivo = self.directorio / f'{os.getpid()}.json'
+        try:
+            temp_file = archivo.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'pid': os.getpid(), 'metrics': self._snapshot()}, f)
+            temp_file.replace(archivo)
+        except Exception as e:
+            logger.warning("Error guardando las métricas del proceso: %s", e)
+
+    def _otros_procesos(self) -> List[Dict[str, Any]]:
+        """Métricas volcadas por los demás procesos (también las de workers ya terminados)."""
+        if not self.directorio or not self.directorio.exists():
+            return []
+        propio = f'{os.getpid()}.json'
+        volcados = []
+        for archivo in self.directorio.glob('*.json'):
+            if archivo.name == propio:
+                continue
+            try:
+                with open(archivo, 'r', encoding='utf-8') as f:
+                    volcados.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return volcados
+
+    def limpiar_directorio(self, directorio: str = config.METRICS_DIR) -> None:
+        """Borra los volcados de una ejecución anterior (al arrancar el servidor, antes de los workers)."""
+        for archivo in Path(directorio).glob('*.json'):
+            archivo.unlink(missing_ok=True)
+
+    # --- Exportación ---
+
+    def _agregar(self) -> Dict[str, List[list]]:
+        """Suma las series de este proceso y las de los demás."""
+        agregados: Dict[str, Dict[Etiquetas, Any]] = {}
+
+        def _sumar(nombre, series, es_histograma):
+            destino = agregados.setdefault(nombre, {})
+            for serie in series:
+                labels = tuple(serie[0])
+                if es_histograma:
+                    previo = destino.get(labels)
+                    if previo is None:
+                        destino[labels] = [list(serie[1]), serie[2]]
+                    elif len(previo[0]) == len(serie[1]):
+                        previo[0] = [a + b for a, b in zip(previo[0], serie[1])]
+                        previo[1] += serie[2]
+                else:
+                    destino[labels] = destino.get(labels, 0) + serie[1]
+
+        for nombre, metrica in list(self._metricas.items()):
+            _sumar(nombre, metrica.volcar(), metrica.tipo == 'histogram')
+
+        for volcado in self._otros_procesos():
+            vivo = _proceso_vivo(volcado.get('pid'))
+            for nombre, series in volcado.get('metrics', {}).items():
+                metrica = self._metricas.get(nombre)
+                if metrica is None or getattr(metrica, 'compartida', False):
+                    continue
+                if metrica.tipo == 'gauge' and not vivo:
+                    # Los contadores de un worker terminado se siguen sumando; sus colas ya no existen
+                    continue
+                _sumar(nombre, series, metrica.tipo == 'histogram')
+
+        return {
+            nombre: [[list(labels)] + (valor if isinstance(valor, list) else [valor])
+                     for labels, valor in series.items()]
+            for nombre, series in agregados.items()
+        }
+
+    def render(self) -> str:
+        """Exporta todas las métricas en formato de texto de Prometheus."""
+        agregados = self._agregar()
+        lineas = []
+        for nombre, metrica in list(self._metricas.items()):
+            lineas.append(f'# HELP {nombre} {metrica.documentation}')
+            lineas.append(f'# TYPE {nombre} {metrica.tipo}')
+            for serie in sorted(agregados.get(nombre, []), key=lambda s: s[0]):
+                labels = serie[0]
+                if metrica.tipo == 'histogram':
+                    acumulado = 0
+                    for limite, conteo in zip(list(metrica.buckets) + [float('inf')], serie[1]):
+                        acumulado += conteo
+                        etiquetas = _formatear_etiquetas(metrica.labelnames + ('le',), labels + [_formatear_numero(limite)])
+                        lineas.append(f'{nombre}_bucket{etiquetas} {acumulado}')
+                    etiquetas = _formatear_etiquetas(metrica.labelnames, labels)
+                    lineas.append(f'{nombre}_sum{etiquetas} {_formatear_numero(serie[2])}')
+                    lineas.append(f'{nombre}_count{etiquetas} {acumulado}')
+                else:
+                    etiquetas = _formatear_etiquetas(metrica.labelnames, labels)
+                    lineas.append(f'{nombre}{etiquetas} {_formatear_numero(serie[1])}')
+
+        for nombre, documentacion, labelnames, funcion in self._derivadas:
+            lineas.append(f'# HELP {nombre} {documentacion}')
+            lineas.append(f'# TYPE {nombre} gauge')
+            for clave, valor in sorted(funcion(agregados).items()):
+                labels = list(clave) if isinstance(clave, tuple) else [clave]
+                lineas.append(f'{nombre}{_formatear_etiquetas(labelnames, labels)} {_formatear_numero(valor)}')
+
+        return '\n'.join(lineas) + '\n'
+
+
+def _proceso_vivo(pid: Any) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except (TypeError, ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Instancia global del registro (con varios procesos, init_worker arranca el volcado)
+metrics = MetricsRegistry()
+atexit.register(metrics.guardar)
+
+STAGE_SECONDS = metrics.histogram(
+    'sync_stage_duration_seconds',
+    'Duración de cada etapa del procesamiento de un webhook o una sincronización',
+    ('stage',)
+)
+MONDAY_REQUESTS = metrics.counter(
+    'sync_monday_requests_total', 'Peticiones HTTP a la API de Monday por operación y resultado',
+    ('operation', 'outcome')
+)
+GOOGLE_REQUESTS = metrics.counter(
+    'sync_google_requests_total', 'Peticiones HTTP a Google Calendar por operación y resultado',
+    ('operation', 'outcome')
+)
+GOOGLE_BATCH_PARTS = metrics.counter(
+    'sync_google_batch_parts_total', 'Operaciones dentro de los batch de escritura de Google por método y resultado',
+    ('method', 'outcome')
+)
+RETRIES = metrics.counter(
+    'sync_retries_total', 'Reintentos (inmediatos o programados) por componente y motivo',
+    ('component', 'reason')
+)
+THROTTLES = metrics.counter(
+    'sync_throttles_total', 'Esperas o aplazamientos por límites de ritmo y cuota',
+    ('component', 'reason')
+)
+CACHE_REQUESTS = metrics.counter(
+    'sync_cache_requests_total', 'Consultas a los cachés en memoria por resultado (hit/miss)',
+    ('cache', 'result')
+)
+LOG_RECORDS_DROPPED = metrics.counter(
+    'sync_log_records_dropped_total', 'Registros de log descartados porque la cola estaba llena'
+)
+
+
+def _ratios_cache(agregados: Dict[str, List[list]]) -> Dict[str, float]:
+    totales: Dict[str, List[float]] = {}
+    for labels, valor in agregados.get(CACHE_REQUESTS.name, []):
+        cache, resultado = labels
+        par = totales.setdefault(cache, [0, 0])
+        par[0 if resultado == 'hit' else 1] += valor
+    return {cache: hits / (hits + misses) for cache, (hits, misses) in totales.items() if hits + misses}
+
+
+metrics.derivada('sync_cache_hit_ratio', 'Proporción de aciertos de cada caché desde el arranque', ('cache',),
+                 _ratios_cache)
+
+
+@contextmanager
+def medir_etapa(stage: str) -> Iterator[None]:
+    """
+    Mide la duración del bloque (o de la función, usado como decorador) en el histograma de etapas.
+
+    Etapas: payload_parse, queue_wait, monday_read, hash, automation_check,
+    google_write, sync_state y process (el pipeline completo de un webhook
+    en un worker de la cola). Los nombres coinciden con el campo 'stage' de
+    los logs donde ambos existen.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - inicio, stage)
+
+
+def registrar_cache(cache: str, hit: bool) -> None:
+    """Cuenta un acierto o un fallo de un caché."""
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+# --- Nombre de la operación de cada petición ---
+
+_PATRON_GRAPHQL = re.compile(r'^\s*(?:query|mutation)?\s*\w*\s*(?:\([^)]*\))?\s*\{\s*(\w+)')
+
+
+def operacion_monday(query: str) -> str:
+    """Campo raíz de una query GraphQL ('items', 'change_simple_column_value'...)."""
+    coincidencia = _PATRON_GRAPHQL.match(query[:300])
+    return coincidencia.group(1) if coincidencia else 'unknown'
+
+
+def operacion_google(uri: str, method: str) -> str:
+    """Operación de Calendar v3 de una petición HTTP ('events.insert', 'batch'...)."""
+    partes = [p for p in urlsplit(uri).path.split('/') if p]
+    if 'batch' in partes[:1]:
+        return 'batch'
+    try:
+        partes = partes[partes.index('v3') + 1:]
+    except ValueError:
+        return 'other'
+    if len(partes) >= 3 and partes[0] == 'calendars' and partes[2] == 'events':
+        if len(partes) == 3:
+            return {'POST': 'events.insert', 'GET': 'events.list'}.get(method, 'events.other')
+        if len(partes) == 4:
+            return {'GET': 'events.get', 'PUT': 'events.update', 'PATCH': 'events.patch',
+                    'DELETE': 'events.delete'}.get(method, 'events.other')
+        return 'events.other'
+    if len(partes) >= 3 and partes[0] == 'calendars' and partes[2] == 'acl':
+        return 'acl.' + ('insert' if method == 'POST' else 'other')
+    if partes[:1] == ['calendars']:
+        return 'calendars.' + ('insert' if method == 'POST' else method.lower())
+    if partes[:3] == ['users', 'me', 'calendarList']:
+        return 'calendarList'
+    return 'other'
+
+
+def resultado_http(status: int) -> str:
+    """Resultado de una respuesta HTTP con pocas categorías (etiqueta 'outcome')."""
+    if status < 300:
+        return 'ok'
+    if status == 304:
+        return 'not_modified'
+    if status in (404, 410):
+        return 'not_found'
+    if status in (409, 412):
+        return 'conflict'
+    if status == 429:
+        return 'rate_limited'
+    if status == 403:
+        return 'forbidden'
+    if status < 500:
+        return 'client_error'
+    return 'server_error'
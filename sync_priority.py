@@ -0,0 +1,150 @@
+"""
+Sync Priority - Prioridad de los trabajos de sincronización
+===========================================================
+
+Con la cola de trabajo atascada (una importación masiva, una resincronización
+del tablero completo) un cambio en la grabación de mañana esperaba detrás de
+cambios en grabaciones de dentro de meses. La prioridad de cada trabajo es:
+
+    días hasta la grabación (fecha56, acotados al horizonte) + ajuste del origen
+
+Menor = se entrega antes. Los orígenes son el webhook de Monday, la
+reconciliación (divergencias en Google, resincronización del tablero) y los
+scripts manuales `forzar_sincronizacion*`; su ajuste se configura en
+`config.WORK_QUEUE_PRIORITY_BY_SOURCE`. La cola suma además un bonus por
+antigüedad para que ningún trabajo se quede esperando indefinidamente.
+
+La fecha se obtiene sin llamar a Monday: del propio webhook si cambia la
+columna de fecha, del último estado conocido del item o del evento indexado
+en el calendario maestro.
+"""
+
+import time
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+import config
+from event_index import event_index
+from sync_logic import obtener_snapshot_item
+from webhook_classifier import ACCION_APLICAR
+from work_queue import work_queue, ESTADOS_FINALES
+
+ORIGEN_WEBHOOK = 'webhook'
+ORIGEN_RECONCILIACION = 'reconciliation'
+ORIGEN_MANUAL = 'manual'
+
+
+def parsear_fecha(texto: Optional[str]) -> Optional[date]:
+    """Día de un texto de fecha de Monday o de Google ('2025-08-15', '2025-08-15 10:00', ISO)."""
+    if not texto:
+        return None
+    try:
+        return datetime.strptime(str(texto)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def fecha_item(item_id: Any, clasificacion: Any = None) -> Optional[date]:
+    """
+    Fecha de grabación de un item sin consultar Monday.
+
+    Args:
+        item_id: ID del item de Monday
+        clasificacion: WebhookClassification del webhook que originó el trabajo (opcional)
+
+    Returns:
+        Día de la grabación o None si no se conoce
+    """
+    if clasificacion is not None and clasificacion.action == ACCION_APLICAR \
+            and clasificacion.column_id == config.COL_FECHA:
+        return parsear_fecha(clasificacion.new_text)
+
+    snapshot = obtener_snapshot_item(item_id)
+    if snapshot and snapshot.get('fecha_inicio'):
+        return parsear_fecha(snapshot['fecha_inicio'])
+
+    entry = event_index.get(str(item_id), config.MASTER_CALENDAR_ID)
+    inicio = ((entry or {}).get('body') or {}).get('start') or {}
+    return parsear_fecha(inicio.get('date') or inicio.get('dateTime'))
+
+
+def calcular_prioridad(fecha: Optional[date], origen: str, hoy: Optional[date] = None) -> float:
+    """
+    Prioridad de un trabajo (menor = antes).
+
+    Args:
+        fecha: Día de la grabación (None si no se conoce)
+        origen: ORIGEN_WEBHOOK, ORIGEN_RECONCILIACION u ORIGEN_MANUAL
+        hoy: Día de referencia (por defecto, hoy)
+
+    Returns:
+        Días hasta la grabación (acotados al horizonte) más el ajuste del origen
+    """
+    horizonte = config.WORK_QUEUE_PRIORITY_HORIZON_DAYS
+    if fecha is None:
+        dias = config.WORK_QUEUE_PRIORITY_UNKNOWN_DATE_DAYS
+    else:
+        dias = (fecha - (hoy or date.today())).days
+        if dias < 0:
+            # Grabaciones ya pasadas: el calendario importa menos que el de las próximas
+            dias = horizonte
+    return min(dias, horizonte) + config.WORK_QUEUE_PRIORITY_BY_SOURCE.get(origen, 0)
+
+
+def prioridad_item(item_id: Any, origen: str, clasificacion: Any = None) -> float:
+    """Prioridad de un trabajo sobre un item, con la fecha que se conozca sin consultar Monday."""
+    return calcular_prioridad(fecha_item(item_id, clasificacion), origen)
+
+
+def encolar_sincronizacion(item_id: Any, origen: str, fecha: Optional[date] = None,
+                           change_uuid: Optional[str] = None) -> int:
+    """
+    Encola la sincronización completa de un item (trabajo 'sync_item').
+
+    Las peticiones repetidas para un item que aún espera se funden en un solo trabajo.
+
+    Args:
+        item_id: ID del item de Monday
+        origen: ORIGEN_RECONCILIACION u ORIGEN_MANUAL (los webhooks tienen su propio trabajo)
+        fecha: Día de la grabación si el llamador ya lo conoce
+        change_uuid: UUID del cambio (por defecto, uno nuevo)
+
+    Returns:
+        ID del trabajo
+    """
+    if fecha is None:
+        fecha = fecha_item(item_id)
+    return work_queue.enqueue(
+        'sync_item',
+        {
+            'item_id': str(item_id),
+            'change_uuid': change_uuid or str(uuid.uuid4()),
+            'source': origen
+        },
+        coalesce_key=str(item_id),
+        priority=calcular_prioridad(fecha, origen)
+    )
+
+
+def esperar_trabajo(job_id: int, timeout: float = 120) -> Dict[str, Any]:
+    """
+    Espera a que termine un trabajo de la cola (p. ej. uno encolado desde un script).
+
+    Falla enseguida si ningún proceso consume la cola (el servidor no está arrancado
+    o tiene la cola desactivada): el trabajo se quedaría esperando sin procesarse.
+
+    Returns:
+        {'status': ..., 'error': ...} con el estado final del trabajo ('done', 'failed'
+        o 'dead_letter'), 'timeout' si no terminó a tiempo o 'no_workers'
+    """
+    limite = time.time() + timeout
+    while True:
+        if not work_queue.consumidores_activos():
+            return {'status': 'no_workers', 'error': 'Ningún proceso está consumiendo la cola de trabajo'}
+        estado = work_queue.estado_trabajo(job_id)
+        if estado['status'] in ESTADOS_FINALES:
+            return estado
+        if time.time() >= limite:
+            return dict(estado, status='timeout')
+        time.sleep(config.WORK_QUEUE_POLL_SECONDS)
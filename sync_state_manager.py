@@ -29,6 +29,13 @@ class SyncStateManager:
         """
         self.state_file_path = Path(state_file_path)
         self.lock = threading.RLock()  # Reentrant lock para permitir llamadas anidadas
+        self._preparado = False  # El archivo se crea con el primer uso, no al importar el módulo
+    
+    def _asegurar_archivo(self) -> None:
+        """Crea el directorio y un estado vacío la primera vez que se usa el gestor."""
+        if self._preparado:
+            return
+        self._preparado = True
         
         # Crear directorio si no existe
         self.state_file_path.parent.mkdir(parents=True, exist_ok=True)
@@ -48,6 +55,7 @@ class SyncStateManager:
         Raises:
             Exception: Si hay error al cargar el archivo
         """
+        self._asegurar_archivo()
         try:
             with open(self.state_file_path, 'r', encoding='utf-8') as f:
                 return json.load(f)
@@ -68,9 +76,10 @@ class SyncStateManager:
         Raises:
             Exception: Si hay error al guardar el archivo
         """
+        self._asegurar_archivo()
         try:
             # Crear backup temporal
-            temp_file = self.state_file_path.with_suffix('.tmp')
+            temp_file = self.state_file_path.with_suffix(f'.{os.getpid()}.tmp')
             with open(temp_file, 'w', encoding='utf-8') as f:
                 json.dump(state, f, indent=2, ensure_ascii=False)
             
@@ -0,0 +1,12 @@
+"""
+Configuración común de las pruebas.
+
+Las instancias globales de los módulos no tocan el disco al importarse: cada
+prueba crea las suyas con rutas dentro de `tmp_path`.
+"""
+
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+import calendar_write_scheduler as cws
+from retry_scheduler import RetryableError
+
+
+class _BatchFalso:
+    """Sustituye a execute_event_batch: registra los batches y la concurrencia por calendario."""
+
+    def __init__(self, lentos=()):
+        self.lentos = set(lentos)
+        self.lock = threading.Lock()
+        self.en_vuelo = {}
+        self.batches = []
+        self.max_por_calendario = 0
+
+    def __call__(self, service, operations, defer_retries=True):
+        calendarios = [op['calendar_id'] for op in operations]
+        with self.lock:
+            self.batches.append(calendarios)
+            for calendar_id in set(calendarios):
+                self.en_vuelo[calendar_id] = self.en_vuelo.get(calendar_id, 0) + 1
+                self.max_por_calendario = max(self.max_por_calendario, self.en_vuelo[calendar_id])
+        time.sleep(0.3 if self.lentos & set(calendarios) else 0.02)
+        with self.lock:
+            for calendar_id in set(calendarios):
+                self.en_vuelo[calendar_id] -= 1
+        return {
+            op['key']: {'ok': True, 'response': {'id': 'evento'}, 'error': None, 'retryable': False, 'clase': None}
+            for op in operations
+        }
+
+
+def _escribir(planificador, calendar_id, resultados):
+    operacion = {'key': 'k', 'method': 'insert', 'calendar_id': calendar_id, 'body': {}}
+    resultados.append((calendar_id, planificador.execute(object(), [operacion])['k']))
+
+
+def _lanzar(planificador, calendarios):
+    resultados = []
+    hilos = [threading.Thread(target=_escribir, args=(planificador, c, resultados)) for c in calendarios]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+
+def test_las_escrituras_de_un_item_viajan_en_un_solo_batch(monkeypatch):
+    batch = _BatchFalso()
+    monkeypatch.setattr(cws, 'execute_event_batch', batch)
+    planificador = cws.CalendarWriteScheduler(rate_per_calendar=1000, burst_per_calendar=1000, timeout=5)
+    calendarios = ['maestro', 'a', 'b', 'c', 'd']
+    operaciones = [{'key': c, 'method': 'insert', 'calendar_id': c, 'body': {}} for c in calendarios]
+
+    resultados = planificador.execute(object(), operaciones)
+
+    assert all(resultado['ok'] for resultado in resultados.values())
+    assert [sorted(calendarios_del_batch) for calendarios_del_batch in batch.batches] == [sorted(calendarios)]
+
+
+def test_un_lote_en_vuelo_por_calendario(monkeypatch):
+    batch = _BatchFalso(lentos=['lento'])
+    monkeypatch.setattr(cws, 'execute_event_batch', batch)
+    planificador = cws.CalendarWriteScheduler(rate_per_calendar=1000, burst_per_calendar=1000, timeout=5)
+
+    resultados = _lanzar(planificador, ['lento', 'a', 'b'] * 3)
+
+    assert all(resultado['ok'] for _, resultado in resultados)
+    assert batch.max_por_calendario == 1
+
+
+def test_timeout_devuelve_un_fallo_reintentable(monkeypatch):
+    monkeypatch.setattr(cws, 'execute_event_batch', _BatchFalso(lentos=['lento']))
+    planificador = cws.CalendarWriteScheduler(rate_per_calendar=1000, burst_per_calendar=1000, timeout=0.1)
+
+    resultados = dict(_lanzar(planificador, ['lento']))
+
+    assert not resultados['lento']['ok']
+    assert resultados['lento']['retryable']
+    assert isinstance(resultados['lento']['error'], RetryableError)
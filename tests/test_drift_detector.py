@@ -0,0 +1,44 @@
+import pytest
+
+import drift_detector as modulo
+from drift_detector import DriftDetector
+from event_index import EventIndex
+
+
+@pytest.fixture
+def indice(monkeypatch, tmp_path):
+    indice = EventIndex(db_path=tmp_path / 'indice.db', legacy_file_path=tmp_path / 'event_index.json')
+    monkeypatch.setattr(modulo, 'event_index', indice)
+    return indice
+
+
+@pytest.fixture
+def detector(tmp_path):
+    return DriftDetector(state_file_path=tmp_path / 'sync_tokens.json')
+
+
+def _evento(etag, status='confirmed'):
+    return {'id': 'evento-1', 'etag': etag, 'status': status,
+            'extendedProperties': {'private': {'monday_item_id': '42'}}}
+
+
+def test_la_primera_vez_sin_etag_se_guarda_como_linea_base(indice, detector):
+    indice.set_event('42', 'maestro', 'evento-1')
+
+    assert detector.detectar_divergencias('maestro', [_evento('"1"')]) == []
+    assert indice.get('42', 'maestro')['etag'] == '"1"'
+    assert detector.detectar_divergencias('maestro', [_evento('"1"')]) == []
+    assert [item for item, _ in detector.detectar_divergencias('maestro', [_evento('"2"')])] == ['42']
+
+
+def test_un_borrado_es_divergencia_aunque_no_haya_etag(indice, detector):
+    indice.set_event('42', 'maestro', 'evento-1')
+
+    assert len(detector.detectar_divergencias('maestro', [_evento(None, status='cancelled')])) == 1
+
+
+def test_crear_el_detector_no_toca_el_disco(tmp_path):
+    ruta = tmp_path / 'estado' / 'sync_tokens.json'
+    detector = DriftDetector(state_file_path=ruta)
+    assert not ruta.parent.exists()
+    assert detector.get_statistics()['calendars_with_token'] == 0
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from event_index import EventIndex
+
+
+@pytest.fixture
+def indice(tmp_path):
+    return EventIndex(db_path=tmp_path / 'indice.db', legacy_file_path=tmp_path / 'event_index.json')
+
+
+def test_set_event_conserva_metadatos_solo_del_mismo_evento(indice):
+    indice.set_event('42', 'maestro', 'evento-1', etag='"1"')
+    indice.set_event('42', 'maestro', 'evento-1', fingerprint='huella')
+    assert indice.get('42', 'maestro')['etag'] == '"1"'
+
+    indice.set_event('42', 'maestro', 'evento-2')
+    assert 'etag' not in indice.get('42', 'maestro')
+
+
+def test_busquedas_y_borrado(indice):
+    indice.set_event('42', 'maestro', 'evento-1')
+    indice.set_event('42', 'personal', 'evento-2')
+
+    assert indice.find_by_event_id('personal', 'evento-2')['item_id'] == '42'
+    assert set(indice.get_entries_for_item('42')) == {'maestro', 'personal'}
+    assert indice.update_entry('42', 'maestro', body=None) is True
+    assert indice.remove('42', 'maestro') is True
+    assert indice.remove('42', 'maestro') is False
+    assert indice.update_entry('42', 'maestro', body=None) is False
+
+
+def test_importa_el_indice_json_antiguo(tmp_path):
+    antiguo = tmp_path / 'event_index.json'
+    antiguo.write_text(json.dumps({
+        '42::maestro': {'item_id': '42', 'calendar_id': 'maestro', 'event_id': 'evento-1', 'etag': '"1"'}
+    }))
+    indice = EventIndex(db_path=tmp_path / 'indice.db', legacy_file_path=antiguo)
+
+    assert indice.get('42', 'maestro')['etag'] == '"1"'
+    assert not antiguo.exists()
+
+
+def test_un_indice_json_ilegible_no_se_sobrescribe(tmp_path):
+    antiguo = tmp_path / 'event_index.json'
+    antiguo.write_text('{roto')
+    indice = EventIndex(db_path=tmp_path / 'indice.db', legacy_file_path=antiguo)
+    indice.set_event('42', 'maestro', 'evento-1')
+
+    assert antiguo.read_text() == '{roto'
+
+
+def test_crear_el_indice_no_toca_el_disco(tmp_path):
+    ruta = tmp_path / 'estado' / 'indice.db'
+    indice = EventIndex(db_path=ruta, legacy_file_path=tmp_path / 'event_index.json')
+    assert not ruta.parent.exists()
+    assert indice.get_event_id('42', 'maestro') is None
+    assert ruta.exists()
@@ -0,0 +1,121 @@
+import socket
+import ssl
+import time
+from unittest import mock
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import google_calendar_service as gcs
+from retry_scheduler import RetryableError
+
+
+def _http_error(status, reason=None):
+    contenido = b'{}'
+    if reason:
+        contenido = ('{"error": {"errors": [{"reason": "%s"}]}}' % reason).encode('utf-8')
+    return HttpError(httplib2.Response({'status': status}), contenido)
+
+
+@pytest.mark.parametrize('error, clase', [
+    (_http_error(429), gcs.ERROR_CUOTA),
+    (_http_error(403, 'rateLimitExceeded'), gcs.ERROR_CUOTA),
+    (_http_error(403, 'userRateLimitExceeded'), gcs.ERROR_CUOTA),
+    (_http_error(403, 'forbidden'), gcs.ERROR_PERMANENTE),
+    (_http_error(404), gcs.ERROR_NO_ENCONTRADO),
+    (_http_error(410), gcs.ERROR_NO_ENCONTRADO),
+    (_http_error(409), gcs.ERROR_CONFLICTO),
+    (_http_error(412), gcs.ERROR_PRECONDICION),
+    (_http_error(503), gcs.ERROR_SERVIDOR),
+    (_http_error(400), gcs.ERROR_PERMANENTE),
+    (ConnectionResetError(), gcs.ERROR_RED),
+    (socket.timeout(), gcs.ERROR_RED),
+    (socket.gaierror(), gcs.ERROR_RED),
+    (ssl.SSLError(), gcs.ERROR_RED),
+    (FileNotFoundError(), gcs.ERROR_PERMANENTE),
+    (PermissionError(), gcs.ERROR_PERMANENTE),
+    (ValueError(), gcs.ERROR_PERMANENTE),
+])
+def test_clasificar_error_google(error, clase):
+    assert gcs.clasificar_error_google(error) == clase
+
+
+def test_insert_sin_id_propio_no_se_repite_tras_5xx():
+    error = _http_error(503)
+    assert gcs.es_error_reintentable(error, method='insert') is False
+    assert gcs.es_error_reintentable(error, method='insert', id_propio=True) is True
+    assert gcs.es_error_reintentable(error, method='update') is True
+    assert gcs.es_error_reintentable(_http_error(429), method='insert') is True
+
+
+def test_como_error_reintentable_conserva_retry_after():
+    error = HttpError(httplib2.Response({'status': 429, 'retry-after': '30'}), b'{}')
+    assert gcs._como_error_reintentable(error, 'crear evento').retry_after == 30
+
+
+@pytest.fixture
+def calendario_enfriandose():
+    calendar_id = 'enfriandose@group.calendar.google.com'
+    with gcs._cooldowns_lock:
+        gcs._cooldowns[calendar_id] = time.time() + 60
+    yield calendar_id
+    with gcs._cooldowns_lock:
+        gcs._cooldowns.pop(calendar_id, None)
+
+
+def test_enfriamiento_en_modo_diferido_se_propaga_al_crear(calendario_enfriandose):
+    with pytest.raises(RetryableError):
+        gcs.create_google_event(mock.Mock(), calendario_enfriandose, {'summary': 'x'}, defer_retries=True)
+
+
+def test_enfriamiento_en_modo_diferido_se_propaga_al_actualizar(calendario_enfriandose):
+    with pytest.raises(RetryableError):
+        gcs.update_google_event(mock.Mock(), calendario_enfriandose, 'evento', {'summary': 'x'}, defer_retries=True)
+
+
+def _cuerpo(start, end, **private):
+    return {
+        'summary': 'Grabación',
+        'start': start,
+        'end': end,
+        'extendedProperties': {'private': dict({'monday_item_id': '42'}, **private)}
+    }
+
+
+def test_parche_de_dia_completo_a_hora_borra_la_clave_date():
+    anterior = _cuerpo({'date': '2026-03-01'}, {'date': '2026-03-02'})
+    nuevo = _cuerpo({'dateTime': '2026-03-01T10:00:00', 'timeZone': 'Europe/Madrid'},
+                    {'dateTime': '2026-03-01T12:00:00', 'timeZone': 'Europe/Madrid'})
+
+    parche = gcs.calcular_parche_evento(anterior, nuevo)
+
+    assert parche == {
+        'start': {'dateTime': '2026-03-01T10:00:00', 'timeZone': 'Europe/Madrid', 'date': None},
+        'end': {'dateTime': '2026-03-01T12:00:00', 'timeZone': 'Europe/Madrid', 'date': None}
+    }
+
+
+def test_parche_de_hora_a_dia_completo_borra_datetime_y_timezone():
+    anterior = _cuerpo({'dateTime': '2026-03-01T10:00:00', 'timeZone': 'Europe/Madrid'},
+                       {'dateTime': '2026-03-01T12:00:00', 'timeZone': 'Europe/Madrid'})
+    nuevo = _cuerpo({'date': '2026-03-01'}, {'date': '2026-03-02'})
+
+    parche = gcs.calcular_parche_evento(anterior, nuevo)
+
+    assert parche['start'] == {'date': '2026-03-01', 'dateTime': None, 'timeZone': None}
+    assert parche['end'] == {'date': '2026-03-02', 'dateTime': None, 'timeZone': None}
+
+
+def test_parche_de_propiedades_privadas_clave_a_clave():
+    fecha = {'date': '2026-03-01'}
+    anterior = _cuerpo(fecha, fecha, cliente='Acme', sync_version='1')
+    nuevo = _cuerpo(fecha, fecha, ubicacion='Estudio', sync_version='2')
+
+    parche = gcs.calcular_parche_evento(anterior, nuevo)
+
+    assert parche == {'extendedProperties': {'private': {
+        'ubicacion': 'Estudio', 'sync_version': '2', 'cliente': None
+    }}}
+    # Un cambio solo de propiedades volátiles no es un cambio
+    assert gcs.calcular_parche_evento(anterior, _cuerpo(fecha, fecha, cliente='Acme', sync_version='3')) == {}
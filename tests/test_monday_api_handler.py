@@ -0,0 +1,77 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+import requests
+
+from monday_api_handler import MondayAPIHandler
+from retry_scheduler import RetryableError
+
+
+def test_error_de_conexion_en_modo_no_bloqueante_es_reintentable():
+    handler = MondayAPIHandler('token', blocking_retries=False)
+    with mock.patch('monday_api_handler.requests.post', side_effect=requests.exceptions.ConnectionError('rechazada')):
+        with pytest.raises(RetryableError):
+            handler._execute_request('query { me { id } }')
+
+
+class _ApiFalsa:
+    """Sustituye a _execute_request: cuenta las llamadas y tarda un poco en responder."""
+
+    def __init__(self, retardo=0.0):
+        self.retardo = retardo
+        self.llamadas = []
+
+    def __call__(self, query, variables=None, max_retries=None):
+        self.llamadas.append((query, max_retries))
+        time.sleep(self.retardo)
+        return {'data': {'llamada': len(self.llamadas)}}
+
+
+@pytest.fixture
+def handler():
+    return MondayAPIHandler('token')
+
+
+def test_lecturas_identicas_seguidas_se_reutilizan(handler):
+    handler._execute_request = api = _ApiFalsa()
+    primera = handler._make_request('query { items { id } }')
+    segunda = handler._make_request('query { items { id } }')
+    assert primera == segunda
+    assert len(api.llamadas) == 1
+
+
+def test_opciones_distintas_no_comparten_peticion(handler):
+    handler._execute_request = api = _ApiFalsa()
+    handler._make_request('query { items { id } }')
+    handler._make_request('query { items { id } }', max_retries=0)
+    assert len(api.llamadas) == 2
+
+
+def test_una_mutacion_durante_una_lectura_impide_reutilizarla(handler):
+    handler._execute_request = api = _ApiFalsa(retardo=0.1)
+    lectura = threading.Thread(target=handler._make_request, args=('query { items { id } }',))
+    lectura.start()
+    time.sleep(0.03)
+    handler._make_request('mutation { change_column_value { id } }')
+    lectura.join()
+
+    # La lectura empezada antes de la mutación no se sirve a las posteriores
+    handler._make_request('query { items { id } }')
+    lecturas = [query for query, _ in api.llamadas if query.startswith('query')]
+    assert len(lecturas) == 2
+
+
+def test_sin_respuesta_del_lider_se_lee_directamente(handler):
+    handler.INFLIGHT_WAIT_TIMEOUT = 0.05
+    handler._execute_request = api = _ApiFalsa(retardo=0.3)
+    lider = threading.Thread(target=handler._make_request, args=('query { items { id } }',))
+    lider.start()
+    time.sleep(0.02)
+
+    handler._make_request('query { items { id } }')
+    lider.join()
+
+    # El seguidor dejó de esperar al líder e hizo su propia petición
+    assert len(api.llamadas) == 2
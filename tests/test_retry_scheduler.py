@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+
+import pytest
+
+import retry_scheduler
+from retry_scheduler import RetryScheduler, RetryableError, parse_retry_after
+
+
+@pytest.fixture(autouse=True)
+def backoff_inmediato(monkeypatch):
+    monkeypatch.setattr(retry_scheduler, 'calcular_backoff', lambda intento, retry_after=None: 0.01)
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return tmp_path / 'retry_queue.json'
+
+
+def _esperar(condicion, timeout=3):
+    limite = time.time() + timeout
+    while not condicion():
+        assert time.time() < limite, 'la condición no se cumplió a tiempo'
+        time.sleep(0.01)
+
+
+def _pendientes(ruta):
+    return json.loads(ruta.read_text())['pending']
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('no es una fecha') is None
+
+
+def test_crear_el_planificador_no_toca_el_disco(tmp_path):
+    ruta = tmp_path / 'estado' / 'retry_queue.json'
+    planificador = RetryScheduler(state_file_path=ruta)
+    assert not ruta.parent.exists()
+    planificador.schedule('sync_item', {})
+    assert len(_pendientes(ruta)) == 1
+
+
+def test_el_trabajo_sigue_en_la_tabla_mientras_se_ejecuta(ruta):
+    planificador = RetryScheduler(state_file_path=ruta, max_workers=1)
+    empezado, seguir = threading.Event(), threading.Event()
+
+    def handler(payload):
+        empezado.set()
+        seguir.wait(3)
+    planificador.register_handler('sync_item', handler)
+    planificador.start()
+    try:
+        planificador.schedule('sync_item', {'item_id': '42'}, dedup_key='42')
+        assert empezado.wait(3)
+        # Si el proceso muriera ahora, el trabajo se repetiría al arrancar
+        assert [job['in_flight'] for job in _pendientes(ruta)] == [True]
+        recuperado = RetryScheduler(state_file_path=ruta)
+        estadisticas = recuperado.get_statistics()
+        assert (estadisticas['pending'], estadisticas['in_flight']) == (1, 0)
+
+        seguir.set()
+        _esperar(lambda: not _pendientes(ruta))
+    finally:
+        seguir.set()
+        planificador.stop()
+
+
+def test_retryable_error_reprograma_y_agotado_se_marca_fallido(ruta):
+    planificador = RetryScheduler(state_file_path=ruta, max_workers=1, max_attempts=3)
+    intentos = []
+
+    def handler(payload):
+        intentos.append(payload)
+        raise RetryableError('Google no responde')
+    planificador.register_handler('sync_item', handler)
+    planificador.start()
+    try:
+        planificador.schedule('sync_item', {'item_id': '42'})
+        _esperar(lambda: planificador.get_statistics()['failed'] == 1)
+    finally:
+        planificador.stop()
+
+    assert len(intentos) == 3
+    assert planificador.get_statistics()['pending'] == 0
+    estado = json.loads(ruta.read_text())
+    assert estado['pending'] == []
+    assert estado['failed'][0]['last_error'] == 'Google no responde'
+
+
+def test_error_no_transitorio_no_se_reintenta(ruta):
+    planificador = RetryScheduler(state_file_path=ruta, max_workers=1)
+    intentos = []
+
+    def handler(payload):
+        intentos.append(payload)
+        raise ValueError('payload inválido')
+    planificador.register_handler('sync_item', handler)
+    planificador.start()
+    try:
+        planificador.schedule('sync_item', {})
+        _esperar(lambda: planificador.get_statistics()['failed'] == 1)
+    finally:
+        planificador.stop()
+    assert len(intentos) == 1
+
+
+def test_reintentos_con_la_misma_clave_se_funden(ruta):
+    planificador = RetryScheduler(state_file_path=ruta)
+
+    primero = planificador.schedule('sync_item', {'n': 1}, dedup_key='42')
+    segundo = planificador.schedule('sync_item', {'n': 2}, dedup_key='42')
+
+    assert segundo == primero
+    assert planificador._jobs[primero]['payload'] == {'n': 2}
+
+
+def test_proceso_sin_planificador_delega_y_no_escribe_la_tabla(ruta):
+    planificador = RetryScheduler(state_file_path=ruta)
+    delegados = []
+    planificador.delegar_en(lambda *args: delegados.append(args) or 7)
+
+    assert planificador.schedule('sync_item', {'item_id': '42'}, dedup_key='42') == '7'
+    assert delegados == [('sync_item', {'item_id': '42'}, 0.01, '42')]
+    assert not ruta.exists()
+
+
+def test_guarda_con_un_temporal_por_proceso(ruta, monkeypatch):
+    monkeypatch.setattr(retry_scheduler.os, 'getpid', lambda: 4242)
+    escritos = []
+    original = retry_scheduler.Path.replace
+
+    def replace(self, destino):
+        escritos.append(self.name)
+        return original(self, destino)
+    monkeypatch.setattr(retry_scheduler.Path, 'replace', replace)
+
+    RetryScheduler(state_file_path=ruta).schedule('sync_item', {})
+    assert escritos == ['retry_queue.4242.tmp']
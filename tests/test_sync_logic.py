@@ -0,0 +1,29 @@
+import time
+
+import config
+import sync_logic
+from event_index import EventIndex
+
+
+def test_la_cache_de_automatizaciones_purga_las_entradas_caducadas(monkeypatch):
+    monkeypatch.setattr(sync_logic, '_automation_cache', {})
+    caducado = time.time() - config.AUTOMATION_DETECTION_WINDOW - 1
+    sync_logic._automation_cache['1'] = (True, caducado)
+
+    sync_logic._guardar_automatizacion('2')
+
+    assert set(sync_logic._automation_cache) == {'2'}
+
+
+def test_el_contexto_devuelve_el_id_antiguo_del_indice(monkeypatch, tmp_path):
+    indice = EventIndex(db_path=tmp_path / 'indice.db', legacy_file_path=tmp_path / 'event_index.json')
+    monkeypatch.setattr(sync_logic, 'event_index', indice)
+    monkeypatch.setattr(config, 'DETERMINISTIC_EVENT_IDS', True)
+    contexto = sync_logic.ItemSyncContext(item_id='42', item_procesado={'id': '42', 'name': 'Grabación'})
+
+    assert contexto.google_event_id == sync_logic._event_id_determinista('42', config.MASTER_CALENDAR_ID)
+
+    indice.set_event('42', config.MASTER_CALENDAR_ID, 'asignado-por-google')
+    assert contexto.google_event_id == 'asignado-por-google'
+    indice.remove('42', config.MASTER_CALENDAR_ID)
+    assert contexto.google_event_id == 'asignado-por-google'
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from webhook_dedup import WebhookIdempotencyCache, clave_webhook, PREFIJO_SIN_INSTANTE
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return tmp_path / 'dedup.db'
+
+
+def test_clave_por_trigger_uuid():
+    evento = {'event': {'triggerUuid': 'abc', 'pulseId': 1, 'value': {'text': 'x'}}}
+    assert clave_webhook(evento) == 'trigger:abc'
+
+
+def test_clave_por_trigger_original_distingue_columnas():
+    base = {'originalTriggerUuid': 'abc', 'pulseId': 1}
+    primera = clave_webhook({'event': dict(base, columnId='fecha')})
+    segunda = clave_webhook({'event': dict(base, columnId='operario')})
+    assert primera != segunda
+
+
+def test_hash_sin_instante_del_cambio_usa_la_ventana_corta():
+    con_instante = clave_webhook({'event': {'pulseId': 1, 'columnId': 'c', 'changedAt': 1700000000.5}})
+    sin_instante = clave_webhook({'event': {'pulseId': 1, 'columnId': 'c'}})
+    assert con_instante.startswith('hash:')
+    assert sin_instante.startswith(PREFIJO_SIN_INSTANTE)
+
+
+def test_reenvio_es_duplicado(ruta):
+    cache = WebhookIdempotencyCache(db_path=ruta)
+    assert cache.check_and_add('trigger:abc') is False
+    assert cache.check_and_add('trigger:abc') is True
+    assert cache.get_statistics()['duplicates'] == 1
+
+
+def test_las_claves_se_comparten_entre_procesos(ruta):
+    # Dos instancias sobre la misma base equivalen a dos workers de gunicorn
+    assert WebhookIdempotencyCache(db_path=ruta).check_and_add('trigger:abc') is False
+    assert WebhookIdempotencyCache(db_path=ruta).check_and_add('trigger:abc') is True
+
+
+def test_la_clave_caduca_con_su_ventana(ruta):
+    cache = WebhookIdempotencyCache(db_path=ruta, window_seconds=60, untimed_window_seconds=0.05)
+    sin_instante = PREFIJO_SIN_INSTANTE + 'x'
+    assert cache.check_and_add(sin_instante) is False
+    assert cache.check_and_add('trigger:abc') is False
+    time.sleep(0.1)
+
+    # Un cambio real idéntico pasado un rato no se descarta; un reenvío con trigger sí
+    assert cache.check_and_add(sin_instante) is False
+    assert cache.check_and_add('trigger:abc') is True
+
+
+def test_discard_permite_reprocesar(ruta):
+    cache = WebhookIdempotencyCache(db_path=ruta)
+    cache.check_and_add('trigger:abc')
+    cache.discard('trigger:abc')
+    assert cache.check_and_add('trigger:abc') is False
+
+
+def test_crear_el_cache_no_toca_el_disco(tmp_path):
+    ruta = tmp_path / 'estado' / 'dedup.db'
+    cache = WebhookIdempotencyCache(db_path=ruta)
+    assert not ruta.parent.exists()
+    assert cache.check_and_add('trigger:abc') is False
+    assert ruta.exists()
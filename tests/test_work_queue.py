@@ -0,0 +1,148 @@
+import time
+
+import pytest
+
+from retry_scheduler import RetryableError
+from work_queue import WorkQueue, ESTADO_TERMINADO, ESTADO_FALLIDO, ESTADO_DEAD_LETTER
+
+
+@pytest.fixture
+def cola(tmp_path):
+    return WorkQueue(db_path=tmp_path / 'cola.db', workers=1, max_attempts=2, lease_seconds=30)
+
+
+def _caducar_reserva(cola, job_id):
+    cola._connect().execute('UPDATE jobs SET leased_until = ? WHERE id = ?', (time.time() - 1, job_id))
+
+
+def test_crear_la_cola_no_toca_el_disco(tmp_path):
+    ruta = tmp_path / 'estado' / 'cola.db'
+    cola = WorkQueue(db_path=ruta)
+    assert not ruta.parent.exists()
+    assert cola._claim() is None
+    assert ruta.exists()
+
+
+def test_debounce_funde_trabajos_de_la_misma_clave(cola):
+    primero = cola.enqueue('sync_item', {'n': 1}, delay=5, coalesce_key='42')
+    segundo = cola.enqueue('sync_item', {'n': 2}, delay=5, coalesce_key='42')
+
+    assert segundo == primero
+    fila = cola._connect().execute('SELECT * FROM jobs').fetchone()
+    assert fila['coalesced'] == 2
+    assert '"n": 2' in fila['payload']
+
+
+def test_debounce_respeta_max_delay(cola):
+    job_id = cola.enqueue('sync_item', {}, delay=1, coalesce_key='42', max_delay=2)
+    creado = cola._connect().execute('SELECT created_at FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+    cola.enqueue('sync_item', {}, delay=60, coalesce_key='42', max_delay=2)
+
+    disponible = cola._connect().execute('SELECT available_at FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+    assert disponible == pytest.approx(creado + 2)
+
+
+def test_se_entrega_primero_la_menor_prioridad(cola):
+    cola.enqueue('sync_item', {'n': 'lejano'}, priority=50)
+    urgente = cola.enqueue('sync_item', {'n': 'urgente'}, priority=1)
+
+    assert cola._claim()['id'] == urgente
+
+
+def test_al_fundir_se_conserva_la_prioridad_mas_urgente(cola):
+    job_id = cola.enqueue('sync_item', {}, delay=5, coalesce_key='42', priority=1)
+    cola.enqueue('sync_item', {}, delay=5, coalesce_key='42', priority=30)
+
+    prioridad = cola._connect().execute('SELECT priority FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+    assert prioridad == 1
+
+
+def test_un_trabajo_reservado_no_se_vuelve_a_entregar_hasta_que_caduca_la_reserva(cola):
+    job_id = cola.enqueue('sync_item', {})
+    assert cola._claim()['id'] == job_id
+    assert cola._claim() is None
+
+    # El worker murió sin confirmar: la reserva caduca y otro lo toma
+    _caducar_reserva(cola, job_id)
+    reentregado = cola._claim()
+    assert reentregado['id'] == job_id
+    assert reentregado['attempts'] == 2
+
+
+def test_un_trabajo_que_agota_sus_reservas_va_a_dead_letter(cola):
+    job_id = cola.enqueue('sync_item', {}, coalesce_key='42')
+    siguiente = cola.enqueue('monday_webhook', {}, coalesce_key='42')
+    for _ in range(2):
+        assert cola._claim()['id'] == job_id
+        _caducar_reserva(cola, job_id)
+
+    # Agotados sus intentos no se vuelve a entregar ni bloquea al siguiente de su clave
+    assert cola._claim()['id'] == siguiente
+    assert cola.estado_trabajo(job_id)['status'] == ESTADO_DEAD_LETTER
+    assert cola.get_statistics()['dead_lettered'] == 1
+
+
+def test_orden_por_clave_entre_tipos_distintos(cola):
+    webhook = cola.enqueue('monday_webhook', {}, coalesce_key='42')
+    sync = cola.enqueue('sync_item', {}, coalesce_key='42')
+
+    assert cola._claim()['id'] == webhook
+    # El sync_item del mismo item espera a que termine el webhook, aunque sea de otro tipo
+    assert cola._claim() is None
+    cola._complete(cola._connect().execute('SELECT * FROM jobs WHERE id = ?', (webhook,)).fetchone())
+    assert cola._claim()['id'] == sync
+
+
+def test_retryable_error_reprograma_y_agotado_va_a_dead_letter(cola):
+    def falla(payload):
+        raise RetryableError('Monday no responde', retry_after=0)
+    cola.register_handler('sync_item', falla)
+    job_id = cola.enqueue('sync_item', {})
+
+    cola._process(cola._claim())
+    assert cola.estado_trabajo(job_id)['status'] == 'pending'
+
+    cola._connect().execute('UPDATE jobs SET available_at = 0 WHERE id = ?', (job_id,))
+    cola._process(cola._claim())
+    assert cola.estado_trabajo(job_id) == {'status': ESTADO_DEAD_LETTER, 'error': 'Monday no responde'}
+
+
+def test_replay_conserva_clave_y_prioridad_y_renueva_created_at(cola):
+    def roto(payload):
+        raise ValueError('roto')
+    cola.register_handler('sync_item', roto)
+    cola.enqueue('sync_item', {'item_id': '42'}, coalesce_key='42', priority=7)
+    cola._process(cola._claim())
+    assert len(cola.list_dead_letters()) == 1
+
+    antes = time.time()
+    assert cola.replay() == 1
+
+    fila = cola._connect().execute('SELECT * FROM jobs').fetchone()
+    assert fila['coalesce_key'] == '42'
+    assert fila['priority'] == 7
+    assert fila['attempts'] == 0
+    assert fila['created_at'] >= antes
+    assert cola.list_dead_letters() == []
+
+
+def test_estado_final_de_los_trabajos(cola):
+    cola.register_handler('ok', lambda payload: True)
+    cola.register_handler('no', lambda payload: False)
+    bien = cola.enqueue('ok', {})
+    mal = cola.enqueue('no', {})
+    cola._process(cola._claim())
+    cola._process(cola._claim())
+
+    assert cola.estado_trabajo(bien)['status'] == ESTADO_TERMINADO
+    assert cola.estado_trabajo(mal)['status'] == ESTADO_FALLIDO
+
+
+def test_consumidores_activos(cola):
+    assert cola.consumidores_activos() == 0
+    cola.start()
+    try:
+        assert cola.consumidores_activos() == 1
+    finally:
+        cola.stop()
+    assert cola.consumidores_activos() == 0
@@ -0,0 +1,173 @@
+"""
+Webhook Classifier - Filtrado de webhooks de Monday antes de llamar a ninguna API
+=================================================================================
+
+Los webhooks `change_column_value` de Monday traen `columnId`, `value` y
+`previousValue`. Con eso decidimos, sin coste, qué hacer con cada webhook:
+
+- IGNORAR: la columna no llega a Google (p. ej. `color`, `link_mktcbghq` o la
+  propia columna del Google Event ID) o el valor no ha cambiado.
+- APLICAR: el payload ya trae el valor nuevo de una columna relevante; se aplica
+  sobre el último estado conocido del item sin volver a consultar Monday.
+- CONSULTAR: hace falta leer el item (creación, columnas cuyo texto no se puede
+  reconstruir desde el payload, tipos de evento desconocidos...).
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import config
+
+ACCION_IGNORAR = 'ignore'
+ACCION_APLICAR = 'apply'
+ACCION_CONSULTAR = 'fetch'
+
+# Campo de item_procesado (ver sync_logic.parse_monday_item) que alimenta cada columna relevante
+CAMPO_POR_COLUMNA = {
+    'name': 'name',
+    config.COL_FECHA: 'fecha_inicio',
+    'personas1': 'operario',
+    config.COL_CLIENTE: 'cliente',
+    'ubicaci_n': 'ubicacion',
+}
+
+
+@dataclass
+class WebhookClassification:
+    """Resultado de clasificar un webhook de Monday."""
+    item_id: Optional[str]
+    action: str
+    reason: str
+    column_id: Optional[str] = None
+    field: Optional[str] = None
+    new_text: Optional[str] = None
+    extra_fields: Optional[Dict[str, Any]] = None
+
+
+def extraer_evento(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Devuelve el objeto de evento, tanto en formato anidado ({'event': {...}}) como directo."""
+    if isinstance(event_data.get('event'), dict):
+        return event_data['event']
+    return event_data
+
+
+def extraer_item_id(event_data: Dict[str, Any]) -> Optional[str]:
+    """Extrae el ID del item (pulseId) del payload del webhook."""
+    item_id = extraer_evento(event_data).get('pulseId')
+    return str(item_id) if item_id else None
+
+
+def _cargar_valor(value: Any) -> Any:
+    """Monday puede enviar los valores como objeto JSON o como string serializado."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (TypeError, ValueError):
+            return value
+    return value
+
+
+def _texto_desde_valor(column_id: str, value: Any) -> Optional[Dict[str, Any]]:
+    """
+    Reconstruye el texto que Monday mostraría para la columna a partir del valor del payload.
+
+    Returns:
+        {'text': ..., 'extra': {...}} o None si el texto no se puede reconstruir con fiabilidad
+    """
+    value = _cargar_valor(value)
+
+    if column_id == 'name':
+        if isinstance(value, dict) and 'name' in value:
+            return {'text': value['name']}
+        return None
+
+    if column_id == config.COL_FECHA:
+        if value is None:
+            return {'text': ''}
+        if isinstance(value, dict) and value.get('date'):
+            # Con hora, Monday envía la hora en UTC pero muestra la hora local: mejor consultar
+            if value.get('time'):
+                return None
+            return {'text': value['date']}
+        return None
+
+    if column_id == config.COL_CLIENTE:
+        if value is None:
+            return {'text': ''}
+        if isinstance(value, dict) and 'value' in value:
+            return {'text': value.get('value') or ''}
+        return None
+
+    if column_id == 'personas1':
+        if value is None:
+            return {'text': '', 'extra': {'operario_ids': []}}
+        if not isinstance(value, dict):
+            return None
+        # Solo si todas las personas tienen perfil con monday_user_id conocido
+        nombres_por_id = {
+            str(p['monday_user_id']): p['monday_name']
+            for p in config.FILMMAKER_PROFILES
+            if p.get('monday_user_id')
+        }
+        personas = value.get('personsAndTeams') or []
+        nombres = []
+        for persona in personas:
+            nombre = nombres_por_id.get(str(persona.get('id')))
+            if not nombre:
+                return None
+            nombres.append(nombre)
+        return {'text': ', '.join(nombres), 'extra': {'operario_ids': [p.get('id') for p in personas]}}
+
+    # Ubicación y otras columnas: el texto depende de Monday, hay que consultar
+    return None
+
+
+def clasificar_webhook(event_data: Dict[str, Any]) -> WebhookClassification:
+    """
+    Clasifica un webhook de Monday usando solo su payload.
+
+    Args:
+        event_data: Payload completo recibido en /monday-webhook
+
+    Returns:
+        WebhookClassification con la acción a tomar
+    """
+    item_id = extraer_item_id(event_data)
+    if not item_id:
+        return WebhookClassification(None, ACCION_IGNORAR, 'sin_item_id')
+
+    event = extraer_evento(event_data)
+    event_type = event.get('type', '')
+    column_id = event.get('columnId')
+
+    if event_type == 'update_name':
+        column_id = 'name'
+
+    # Sin columna (creación de item, eventos desconocidos): hay que leer el item completo
+    if not column_id:
+        return WebhookClassification(item_id, ACCION_CONSULTAR, f'evento_{event_type or "desconocido"}')
+
+    if column_id not in config.SYNC_RELEVANT_COLUMNS:
+        return WebhookClassification(item_id, ACCION_IGNORAR, 'columna_irrelevante', column_id=column_id)
+
+    if 'value' in event and 'previousValue' in event and \
+            _cargar_valor(event['value']) == _cargar_valor(event['previousValue']):
+        return WebhookClassification(item_id, ACCION_IGNORAR, 'valor_sin_cambios', column_id=column_id)
+
+    if 'value' not in event:
+        return WebhookClassification(item_id, ACCION_CONSULTAR, 'payload_sin_valor', column_id=column_id)
+
+    reconstruido = _texto_desde_valor(column_id, event['value'])
+    if reconstruido is None:
+        return WebhookClassification(item_id, ACCION_CONSULTAR, 'valor_no_reconstruible', column_id=column_id)
+
+    return WebhookClassification(
+        item_id,
+        ACCION_APLICAR,
+        'valor_en_payload',
+        column_id=column_id,
+        field=CAMPO_POR_COLUMNA[column_id],
+        new_text=reconstruido['text'],
+        extra_fields=reconstruido.get('extra')
+    )
@@ -0,0 +1,175 @@
+"""
+Webhook Dedup - Caché de idempotencia para webhooks de Monday
+=============================================================
+
+Monday reenvía un webhook cuando no recibe respuesta a tiempo, y cada copia
+se procesaba desde cero. Este módulo identifica cada evento por:
+
+1. `triggerUuid` (único por evento, se repite en los reenvíos)
+2. `originalTriggerUuid` + item + columna (una automatización puede cambiar
+   varias columnas con el mismo trigger original)
+3. Si no hay ninguno, un hash de (pulseId, columnId, value, changedAt)
+
+y recuerda las claves vistas durante una ventana de tiempo. Las copias se
+responden con 200 antes de encolar nada ni llamar a ninguna API.
+
+Las claves viven en una tabla SQLite compartida por todos los workers (un
+reenvío casi nunca llega al mismo proceso que el original) y sobreviven a
+un reinicio. Cada comprobación es un único `INSERT OR IGNORE`.
+
+Un hash sin instante del cambio (ni changedAt ni triggerTime) no distingue un
+reenvío de un cambio real idéntico posterior, así que se recuerda solo durante
+una ventana corta (WEBHOOK_DEDUP_UNTIMED_WINDOW_SECONDS).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Dict
+
+import config
+from sync_metrics import registrar_cache
+from webhook_classifier import extraer_evento
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de las claves calculadas sin instante del cambio (ventana corta)
+PREFIJO_SIN_INSTANTE = 'contenido:'
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS webhook_dedup (
+    clave TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS webhook_dedup_expires ON webhook_dedup (expires_at);
+"""
+
+
+def clave_webhook(event_data: Dict[str, Any]) -> str:
+    """
+    Calcula la clave de idempotencia de un webhook.
+
+    Args:
+        event_data: Payload del webhook de Monday
+
+    Returns:
+        Clave estable entre reenvíos del mismo evento
+    """
+    evento = extraer_evento(event_data)
+    if evento.get('triggerUuid'):
+        return f"trigger:{evento['triggerUuid']}"
+    if evento.get('originalTriggerUuid'):
+        return f"original:{evento['originalTriggerUuid']}:{evento.get('pulseId')}:{evento.get('columnId')}"
+
+    instante = evento.get('changedAt') or evento.get('triggerTime')
+    contenido = json.dumps(
+        [evento.get('pulseId'), evento.get('columnId'), evento.get('value'), instante, evento.get('type')],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    prefijo = 'hash:' if instante else PREFIJO_SIN_INSTANTE
+    return f"{prefijo}{hashlib.sha256(contenido.encode('utf-8')).hexdigest()}"
+
+
+class WebhookIdempotencyCache:
+    """
+    Claves de webhooks ya recibidos en SQLite, con caducidad por tiempo.
+    """
+
+    def __init__(
+        self,
+        db_path: str = config.WEBHOOK_DEDUP_DB,
+        window_seconds: float = config.WEBHOOK_DEDUP_WINDOW_SECONDS,
+        untimed_window_seconds: float = config.WEBHOOK_DEDUP_UNTIMED_WINDOW_SECONDS,
+        purge_interval: float = config.WEBHOOK_DEDUP_PURGE_INTERVAL
+    ):
+        """
+        Inicializa el caché. La tabla se crea con la primera conexión, no al importar el módulo.
+
+        Args:
+            db_path: Ruta a la base de datos SQLite
+            window_seconds: Tiempo durante el que una clave cuenta como ya vista
+            untimed_window_seconds: Lo mismo para las claves sin instante del cambio
+            purge_interval: Segundos mínimos entre borrados de claves caducadas
+        """
+        self.db_path = Path(db_path)
+        self.window_seconds = window_seconds
+        self.untimed_window_seconds = untimed_window_seconds
+        self.purge_interval = purge_interval
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._last_purge = 0.0
+        self._stats = {'duplicates': 0, 'unique': 0}
+        self._preparado = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Conexión del hilo actual (SQLite no permite compartir conexiones entre hilos ni procesos)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self.lock:
+                # La tabla se crea con la primera conexión
+                if not self._preparado:
+                    conn.executescript(_ESQUEMA)
+                    self._preparado = True
+        return conn
+
+    def _purge(self, conn: sqlite3.Connection, now: float) -> None:
+        """Borra las claves caducadas, como mucho una vez cada purge_interval."""
+        with self.lock:
+            if now - self._last_purge < self.purge_interval:
+                return
+            self._last_purge = now
+        conn.execute('DELETE FROM webhook_dedup WHERE expires_at <= ?', (now,))
+
+    def check_and_add(self, key: str) -> bool:
+        """
+        Registra una clave y dice si ya se había visto dentro de la ventana.
+
+        Returns:
+            True si es un duplicado (no hay que procesarlo)
+        """
+        now = time.time()
+        window = self.untimed_window_seconds if key.startswith(PREFIJO_SIN_INSTANTE) else self.window_seconds
+        conn = self._connect()
+        self._purge(conn, now)
+        # Una clave caducada que aún no se ha purgado no cuenta como vista
+        conn.execute('DELETE FROM webhook_dedup WHERE clave = ? AND expires_at <= ?', (key, now))
+        nueva = conn.execute(
+            'INSERT OR IGNORE INTO webhook_dedup (clave, expires_at) VALUES (?, ?)', (key, now + window)
+        ).rowcount == 1
+
+        with self.lock:
+            self._stats['unique' if nueva else 'duplicates'] += 1
+        registrar_cache('webhook_dedup', not nueva)
+        return not nueva
+
+    def discard(self, key: str) -> None:
+        """Olvida una clave (p. ej. si el webhook no se pudo encolar y Monday debe reenviarlo)."""
+        self._connect().execute('DELETE FROM webhook_dedup WHERE clave = ?', (key,))
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Obtiene estadísticas del caché (los contadores son de este proceso)."""
+        entries = self._connect().execute(
+            'SELECT COUNT(*) FROM webhook_dedup WHERE expires_at > ?', (time.time(),)
+        ).fetchone()[0]
+        with self.lock:
+            return dict(
+                self._stats,
+                entries=entries,
+                window_seconds=self.window_seconds,
+                untimed_window_seconds=self.untimed_window_seconds
+            )
+
+
+# Instancia global del caché
+webhook_dedup = WebhookIdempotencyCache()
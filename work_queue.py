@@ -0,0 +1,554 @@
+"""
+Work Queue - Cola de trabajo persistente entre el webhook y los workers de sincronización
+========================================================================================
+
+El endpoint del webhook hacía toda la sincronización antes de responder
+(lecturas de Monday, escrituras en Google, estado en disco). Con un servicio
+externo lento el hilo HTTP quedaba ocupado y Monday reenviaba el webhook.
+
+Con esta cola el endpoint solo valida el payload, añade un trabajo a una
+tabla SQLite y responde. Un pool de workers consume la tabla:
+
+- Entrega al menos una vez: un trabajo se borra solo cuando su handler
+  termina; si el proceso muere a mitad, la reserva (lease) caduca y otro
+  worker lo vuelve a tomar.
+- Los fallos transitorios (RetryableError) se reprograman con backoff.
+- Los trabajos que agotan sus intentos, o fallan de forma no transitoria,
+  pasan a la tabla `dead_letter`, desde donde se pueden reencolar (replay).
+- Debounce: los trabajos encolados con la misma `coalesce_key` (p. ej. el
+  item de Monday) mientras el anterior aún espera se funden en uno solo con
+  el último payload. El trabajo se ejecuta tras una ventana de silencio, con
+  un tope de espera desde el primer evento.
+- Orden por clave: de los trabajos con la misma `coalesce_key`, sea cual sea
+  su tipo, solo se entrega el más antiguo; el siguiente espera a que termine. Los de claves distintas
+  se reparten entre todos los workers.
+- Prioridad: entre los trabajos disponibles se entrega primero el de menor
+  `priority` (ver sync_priority). La antigüedad resta prioridad a un ritmo
+  fijo, así que un trabajo poco urgente acaba saliendo aunque no paren de
+  llegar urgentes.
+
+Cada proceso que consume la cola se apunta en la tabla `consumers`, y los
+trabajos cuyo handler devuelve False se anotan en `job_failures` durante un
+rato: así un script que encola un trabajo sabe si alguien lo va a procesar y
+cómo terminó (ver `estado_trabajo`).
+
+La base de datos vive en `config/work_queue.db` y sobrevive a reinicios.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+from retry_scheduler import RetryableError, calcular_backoff
+from sync_metrics import RETRIES
+
+logger = logging.getLogger(__name__)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    leased_until REAL,
+    created_at REAL NOT NULL,
+    last_error TEXT,
+    coalesce_key TEXT,
+    coalesced INTEGER NOT NULL DEFAULT 1,
+    priority REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_available ON jobs (available_at);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    coalesce_key TEXT,
+    priority REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_failures (
+    job_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    failed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS consumers (
+    pid INTEGER PRIMARY KEY,
+    workers INTEGER NOT NULL,
+    started_at REAL NOT NULL
+);
+"""
+
+# Estados finales de un trabajo (ver WorkQueue.estado_trabajo)
+ESTADO_TERMINADO = 'done'
+ESTADO_FALLIDO = 'failed'
+ESTADO_DEAD_LETTER = 'dead_letter'
+ESTADOS_FINALES = (ESTADO_TERMINADO, ESTADO_FALLIDO, ESTADO_DEAD_LETTER)
+
+
+# Un trabajo solo se puede entregar si no queda otro anterior con su misma clave (en curso o pendiente).
+# La clave es el item, sea cual sea el tipo: un monday_webhook y un sync_item del mismo item no se solapan
+_SIN_ANTERIOR_DE_SU_CLAVE = """
+    (coalesce_key IS NULL OR NOT EXISTS (
+        SELECT 1 FROM jobs AS anterior
+        WHERE anterior.coalesce_key = jobs.coalesce_key AND anterior.id < jobs.id
+    ))
+"""
+
+
+class WorkQueue:
+    """
+    Cola de trabajos persistente en SQLite con workers en hilos propios.
+    """
+
+    def __init__(
+        self,
+        db_path: str = config.WORK_QUEUE_DB,
+        workers: int = config.WORK_QUEUE_WORKERS,
+        max_attempts: int = config.WORK_QUEUE_MAX_ATTEMPTS,
+        lease_seconds: float = config.WORK_QUEUE_LEASE_SECONDS,
+        age_boost_per_minute: float = config.WORK_QUEUE_PRIORITY_AGE_BOOST_PER_MINUTE
+    ):
+        """
+        Inicializa la cola (los workers se arrancan con start()). Las tablas se crean con la
+        primera conexión, no al importar el módulo.
+
+        Args:
+            db_path: Ruta a la base de datos SQLite
+            workers: Número de hilos que consumen la cola
+            max_attempts: Intentos antes de mover un trabajo a dead_letter
+            lease_seconds: Tiempo tras el que un trabajo en curso sin terminar se vuelve a entregar
+            age_boost_per_minute: Prioridad que gana un trabajo por cada minuto en la cola
+        """
+        self.db_path = Path(db_path)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.age_boost_per_minute = age_boost_per_minute
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._stats = {'enqueued': 0, 'coalesced': 0, 'completed': 0, 'retried': 0, 'dead_lettered': 0}
+        self._preparacion = threading.Lock()
+        self._preparado = False
+
+    def _migrar(self, conn: sqlite3.Connection) -> None:
+        """Añade a unas tablas jobs y dead_letter antiguas las columnas del debounce y de la prioridad."""
+        columnas = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'coalesce_key' not in columnas:
+            conn.execute('ALTER TABLE jobs ADD COLUMN coalesce_key TEXT')
+        if 'coalesced' not in columnas:
+            conn.execute('ALTER TABLE jobs ADD COLUMN coalesced INTEGER NOT NULL DEFAULT 1')
+        if 'priority' not in columnas:
+            conn.execute('ALTER TABLE jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_coalesce ON jobs (kind, coalesce_key)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_key_order ON jobs (coalesce_key, id)')
+        columnas = {row['name'] for row in conn.execute('PRAGMA table_info(dead_letter)')}
+        if 'coalesce_key' not in columnas:
+            conn.execute('ALTER TABLE dead_letter ADD COLUMN coalesce_key TEXT')
+        if 'priority' not in columnas:
+            conn.execute('ALTER TABLE dead_letter ADD COLUMN priority REAL NOT NULL DEFAULT 0')
+
+    def _connect(self) -> sqlite3.Connection:
+        """Conexión del hilo actual (SQLite no permite compartir conexiones entre hilos ni procesos)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # Tras un fork la conexión heredada es del proceso padre: se abre una propia
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL: los workers leen mientras el endpoint escribe; NORMAL basta para no perder commits en WAL
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._preparar(conn)
+        return conn
+
+    def _preparar(self, conn: sqlite3.Connection) -> None:
+        """Crea (o migra) las tablas con la primera conexión."""
+        with self._preparacion:
+            if self._preparado:
+                return
+            conn.executescript(_ESQUEMA)
+            self._migrar(conn)
+            self._preparado = True
+
+    def register_handler(self, kind: str, handler: Callable[[Dict[str, Any]], Any]) -> None:
+        """
+        Registra la función que procesa un tipo de trabajo.
+
+        Args:
+            kind: Nombre del tipo de trabajo (p. ej. 'monday_webhook')
+            handler: Función que recibe el payload. Si lanza RetryableError el trabajo
+                se reprograma; cualquier otra excepción lo manda a dead_letter. Si
+                devuelve False el trabajo termina, pero se anota como fallido.
+        """
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], delay: float = 0,
+                coalesce_key: Optional[str] = None, max_delay: Optional[float] = None,
+                priority: float = 0) -> int:
+        """
+        Añade un trabajo a la cola.
+
+        Args:
+            kind: Tipo de trabajo (debe tener handler registrado)
+            payload: Datos serializables en JSON
+            delay: Segundos antes de que el trabajo esté disponible (ventana de silencio si hay coalesce_key)
+            coalesce_key: Si ya hay un trabajo del mismo tipo y clave esperando, se reemplaza su
+                payload por este y su ejecución se aplaza `delay` segundos más
+            max_delay: Tope de aplazamiento desde el primer trabajo fundido (None = sin tope)
+            priority: Menor = se entrega antes. Al fundir se conserva la más urgente de las dos
+
+        Returns:
+            ID del trabajo (el existente si se fundió)
+        """
+        now = time.time()
+        serializado = json.dumps(payload, ensure_ascii=False)
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            existente = None
+            if coalesce_key is not None:
+                # Solo trabajos que aún no han empezado (ni están esperando un reintento)
+                existente = conn.execute(
+                    'SELECT id, created_at FROM jobs WHERE kind = ? AND coalesce_key = ? '
+                    'AND leased_until IS NULL AND attempts = 0',
+                    (kind, coalesce_key)
+                ).fetchone()
+            if existente:
+                disponible = now + delay
+                if max_delay is not None:
+                    disponible = min(disponible, existente['created_at'] + max_delay)
+                conn.execute(
+                    'UPDATE jobs SET payload = ?, available_at = ?, coalesced = coalesced + 1, '
+                    'priority = MIN(priority, ?) WHERE id = ?',
+                    (serializado, disponible, priority, existente['id'])
+                )
+                job_id = existente['id']
+                self._stats['coalesced'] += 1
+            else:
+                job_id = conn.execute(
+                    'INSERT INTO jobs (kind, payload, available_at, created_at, coalesce_key, priority) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (kind, serializado, now + delay, now, coalesce_key, priority)
+                ).lastrowid
+        self._stats['enqueued'] += 1
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def _seconds_to_next_job(self) -> float:
+        """Segundos hasta el próximo trabajo disponible (como mucho el intervalo de sondeo)."""
+        siguiente = self._connect().execute(
+            f'SELECT MIN(available_at) FROM jobs WHERE leased_until IS NULL AND {_SIN_ANTERIOR_DE_SU_CLAVE}'
+        ).fetchone()[0]
+        if siguiente is None:
+            return config.WORK_QUEUE_POLL_SECONDS
+        return min(config.WORK_QUEUE_POLL_SECONDS, max(0.0, siguiente - time.time()))
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """
+        Reserva para este worker el trabajo disponible (o cuya reserva caducó) más prioritario.
+
+        La prioridad efectiva (`priority` menos lo ganado por antigüedad) se calcula en la
+        consulta; solo recorre los trabajos pendientes, que con la cola al día son pocos.
+
+        Cada entrega cuenta como intento: un trabajo cuya reserva caduca una y otra vez
+        (el proceso muere o se cuelga con él) pasa a dead_letter al agotar sus intentos,
+        en lugar de entregarse para siempre y bloquear los siguientes de su clave.
+        """
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            # Lectura y reserva en la misma transacción (sin UPDATE ... RETURNING, que pide SQLite 3.35)
+            conn.execute('BEGIN IMMEDIATE')
+            caducados = conn.execute(
+                'SELECT * FROM jobs WHERE leased_until < ? AND attempts >= ?', (now, self.max_attempts)
+            ).fetchall()
+            for job in caducados:
+                self._mover_a_dead_letter(conn, job, "Reserva caducada en cada intento (el worker murió o se colgó)")
+            row = conn.execute(
+                f"""
+                SELECT id FROM jobs
+                WHERE available_at <= ? AND (leased_until IS NULL OR leased_until < ?)
+                  AND {_SIN_ANTERIOR_DE_SU_CLAVE}
+                ORDER BY priority - (? - created_at) * ?, id LIMIT 1
+                """,
+                (now, now, now, self.age_boost_per_minute / 60)
+            ).fetchone()
+            job = None
+            if row is not None:
+                conn.execute(
+                    'UPDATE jobs SET attempts = attempts + 1, leased_until = ? WHERE id = ?',
+                    (now + self.lease_seconds, row['id'])
+                )
+                job = conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+
+        for caducado in caducados:
+            self._stats['dead_lettered'] += 1
+            logger.error("Trabajo %s (%s) movido a dead_letter: su reserva caducó en sus %s intentos",
+                         caducado['id'], caducado['kind'], caducado['attempts'])
+        if caducados:
+            self._notify_all()
+        return job
+
+    def _notify_all(self) -> None:
+        """Despierta a los workers (p. ej. el siguiente trabajo de una clave ya se puede entregar)."""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _complete(self, job: sqlite3.Row, fallido: bool = False) -> None:
+        """Confirma un trabajo terminado (lo borra de la cola) y anota si su handler falló."""
+        conn = self._connect()
+        if not fallido:
+            conn.execute('DELETE FROM jobs WHERE id = ?', (job['id'],))
+        else:
+            now = time.time()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job['id'],))
+                conn.execute(
+                    'INSERT OR REPLACE INTO job_failures (job_id, kind, failed_at) VALUES (?, ?, ?)',
+                    (job['id'], job['kind'], now)
+                )
+                conn.execute(
+                    'DELETE FROM job_failures WHERE failed_at < ?', (now - config.WORK_QUEUE_FAILED_RESULT_TTL,)
+                )
+        self._stats['completed'] += 1
+        self._notify_all()
+
+    def _retry_later(self, job: sqlite3.Row, error: RetryableError) -> None:
+        """Devuelve el trabajo a la cola con backoff (respetando Retry-After)."""
+        delay = calcular_backoff(job['attempts'] - 1, retry_after=error.retry_after)
+        self._connect().execute(
+            'UPDATE jobs SET available_at = ?, leased_until = NULL, last_error = ? WHERE id = ?',
+            (time.time() + delay, str(error), job['id'])
+        )
+        self._stats['retried'] += 1
+        RETRIES.inc('work_queue', job['kind'])
+        logger.info("Trabajo %s (%s) reprogramado en %.1fs: %s", job['id'], job['kind'], delay, error)
+
+    @staticmethod
+    def _mover_a_dead_letter(conn: sqlite3.Connection, job: sqlite3.Row, error: str) -> None:
+        """Copia un trabajo a dead_letter y lo borra de la cola. Llamar dentro de una transacción."""
+        conn.execute(
+            'INSERT INTO dead_letter (job_id, kind, payload, attempts, error, created_at, failed_at, '
+            'coalesce_key, priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job['id'], job['kind'], job['payload'], job['attempts'], error, job['created_at'], time.time(),
+             job['coalesce_key'], job['priority'])
+        )
+        conn.execute('DELETE FROM jobs WHERE id = ?', (job['id'],))
+
+    def _dead_letter(self, job: sqlite3.Row, error: str) -> None:
+        """Mueve un trabajo fallido a dead_letter."""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._mover_a_dead_letter(conn, job, error)
+        self._stats['dead_lettered'] += 1
+        self._notify_all()
+        logger.error("Trabajo %s (%s) movido a dead_letter tras %s intentos: %s", job['id'], job['kind'], job['attempts'], error)
+
+    def _process(self, job: sqlite3.Row) -> None:
+        """Ejecuta el handler de un trabajo y lo confirma, reprograma o descarta."""
+        handler = self._handlers.get(job['kind'])
+        if handler is None:
+            self._dead_letter(job, f"Sin handler para el tipo de trabajo '{job['kind']}'")
+            return
+        payload = json.loads(job['payload'])
+        if job['coalesced'] > 1:
+            # El handler sabe que el payload resume varios eventos (solo trae el último)
+            payload['coalesced'] = job['coalesced']
+        try:
+            resultado = handler(payload)
+        except RetryableError as e:
+            if job['attempts'] >= self.max_attempts:
+                self._dead_letter(job, str(e))
+            else:
+                self._retry_later(job, e)
+        except Exception as e:
+            logger.exception("Error procesando trabajo %s (%s)", job['id'], job['kind'])
+            self._dead_letter(job, str(e))
+        else:
+            self._complete(job, fallido=resultado is False)
+
+    def _worker_loop(self) -> None:
+        """Bucle de un worker: toma trabajos mientras haya; si no, espera a un aviso o al siguiente sondeo."""
+        while not self._stop_event.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error("Error leyendo la cola de trabajo: %s", e)
+                job = None
+            if job is None:
+                # El sondeo cubre los trabajos diferidos y los encolados por otros procesos
+                try:
+                    espera = self._seconds_to_next_job()
+                except sqlite3.Error:
+                    espera = config.WORK_QUEUE_POLL_SECONDS
+                with self._wakeup:
+                    self._wakeup.wait(timeout=espera)
+                continue
+            self._process(job)
+
+    def start(self) -> None:
+        """Arranca los workers (idempotente)."""
+        self._threads = [t for t in self._threads if t.is_alive()]
+        if self._threads:
+            return
+        self._stop_event.clear()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO consumers (pid, workers, started_at) VALUES (?, ?, ?)',
+            (os.getpid(), self.workers, time.time())
+        )
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'work-queue-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Cola de trabajo iniciada con %s workers (%s)", self.workers, self.db_path)
+
+    def stop(self) -> None:
+        """Detiene los workers al terminar su trabajo actual."""
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        self._connect().execute('DELETE FROM consumers WHERE pid = ?', (os.getpid(),))
+
+    def consumidores_activos(self) -> int:
+        """
+        Procesos vivos de esta máquina con workers consumiendo la cola.
+
+        Los procesos que murieron sin llamar a stop() se detectan y se borran aquí.
+        """
+        conn = self._connect()
+        vivos = 0
+        for row in conn.execute('SELECT pid FROM consumers').fetchall():
+            try:
+                os.kill(row['pid'], 0)
+            except ProcessLookupError:
+                conn.execute('DELETE FROM consumers WHERE pid = ?', (row['pid'],))
+                continue
+            except PermissionError:
+                pass  # Existe, aunque sea de otro usuario
+            vivos += 1
+        return vivos
+
+    def estado_trabajo(self, job_id: int) -> Dict[str, Any]:
+        """
+        Estado de un trabajo encolado.
+
+        Returns:
+            {'status': 'pending' | 'running' | 'done' | 'failed' | 'dead_letter', 'error': str o None}.
+            Un trabajo que ya no está en la cola ni consta como fallido terminó bien.
+        """
+        conn = self._connect()
+        row = conn.execute('SELECT leased_until, last_error FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row:
+            en_curso = row['leased_until'] is not None and row['leased_until'] >= time.time()
+            return {'status': 'running' if en_curso else 'pending', 'error': row['last_error']}
+        row = conn.execute(
+            'SELECT error FROM dead_letter WHERE job_id = ? ORDER BY id DESC LIMIT 1', (job_id,)
+        ).fetchone()
+        if row:
+            return {'status': ESTADO_DEAD_LETTER, 'error': row['error']}
+        if conn.execute('SELECT 1 FROM job_failures WHERE job_id = ?', (job_id,)).fetchone():
+            return {'status': ESTADO_FALLIDO, 'error': None}
+        return {'status': ESTADO_TERMINADO, 'error': None}
+
+    def list_dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Lista los trabajos en dead_letter (los más recientes primero)."""
+        rows = self._connect().execute(
+            'SELECT * FROM dead_letter ORDER BY failed_at DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [dict(row, payload=json.loads(row['payload'])) for row in rows]
+
+    def replay(self, dead_letter_id: Optional[int] = None) -> int:
+        """
+        Reencola trabajos de dead_letter con los intentos a cero, su clave y su prioridad.
+
+        Entran como trabajos nuevos (created_at = ahora): la antigüedad que acumularon
+        antes de fallar no les da ventaja, y se ordenan tras los ya pendientes de su clave.
+
+        Args:
+            dead_letter_id: ID de la fila a reencolar; None reencola todas
+
+        Returns:
+            Número de trabajos reencolados
+        """
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if dead_letter_id is None:
+                rows = conn.execute('SELECT * FROM dead_letter').fetchall()
+            else:
+                rows = conn.execute('SELECT * FROM dead_letter WHERE id = ?', (dead_letter_id,)).fetchall()
+            for row in rows:
+                conn.execute(
+                    'INSERT INTO jobs (kind, payload, available_at, created_at, coalesce_key, priority) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (row['kind'], row['payload'], now, now, row['coalesce_key'], row['priority'])
+                )
+                conn.execute('DELETE FROM dead_letter WHERE id = ?', (row['id'],))
+        if rows:
+            with self._wakeup:
+                self._wakeup.notify_all()
+        return len(rows)
+
+    def depth(self, coalesce_key: str) -> int:
+        """Trabajos (en curso o pendientes) de una clave."""
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM jobs WHERE coalesce_key = ?', (coalesce_key,)
+        ).fetchone()[0]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Obtiene estadísticas de la cola."""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            """
+            SELECT COUNT(*) AS pending,
+                   SUM(CASE WHEN leased_until >= ? THEN 1 ELSE 0 END) AS running,
+                   SUM(CASE WHEN available_at > ? THEN 1 ELSE 0 END) AS delayed,
+                   MIN(CASE WHEN available_at <= ? THEN created_at END) AS oldest_ready,
+                   MIN(CASE WHEN available_at <= ? AND leased_until IS NULL
+                            THEN priority - (? - created_at) * ? END) AS next_priority
+            FROM jobs
+            """,
+            (now, now, now, now, now, self.age_boost_per_minute / 60)
+        ).fetchone()
+        dead_letters = conn.execute('SELECT COUNT(*) FROM dead_letter').fetchone()[0]
+        por_clave = conn.execute(
+            'SELECT coalesce_key, COUNT(*) AS depth FROM jobs WHERE coalesce_key IS NOT NULL '
+            'GROUP BY coalesce_key HAVING depth > 1 ORDER BY depth DESC LIMIT 20'
+        ).fetchall()
+        return dict(
+            self._stats,
+            pending=row['pending'],
+            running=row['running'] or 0,
+            delayed=row['delayed'] or 0,
+            oldest_ready_age_seconds=round(now - row['oldest_ready'], 3) if row['oldest_ready'] else 0,
+            next_effective_priority=round(row['next_priority'], 2) if row['next_priority'] is not None else None,
+            age_boost_per_minute=self.age_boost_per_minute,
+            dead_letters=dead_letters,
+            keys_with_backlog={row['coalesce_key']: row['depth'] for row in por_clave},
+            workers=len([t for t in self._threads if t.is_alive()])
+        )
+
+
+# Instancia global de la cola (los workers se arrancan explícitamente con start())
+work_queue = WorkQueue()